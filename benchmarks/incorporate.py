@@ -0,0 +1,54 @@
+"""Time World.incorporate with local maps of the size that knights send.
+
+Every call incorporates into a fresh world, incorporating the same map again
+would only measure the case where nothing changes.
+The native benchmarks compare the dilation against the old per-pixel
+extrusion, see `dilate_per_pixel` in benchmarks/native.rs.
+"""
+
+import time
+
+import numpy as np
+
+from janlukas.ai import WORLD_SHAPE, jl
+
+
+def make_local_map(view_radius: int, rng: np.random.Generator) -> np.ndarray:
+    shape = (2 * view_radius + 1, 2 * view_radius + 1)
+    local_map = np.zeros(shape, dtype="int64")
+    # A few walls of different orientation, like in the real maps.
+    for _ in range(6):
+        x, y = rng.integers(0, shape)
+        length = rng.integers(10, shape[0])
+        if rng.random() < 0.5:
+            local_map[x : x + length, y : y + 4] = 1
+        else:
+            local_map[x : x + 4, y : y + length] = 1
+    return local_map
+
+
+def time_incorporate(
+    local_map: np.ndarray, knight_pos: tuple, view_radius: int, n: int
+) -> float:
+    """Return the mean time of incorporating `local_map` into a new world."""
+    total = 0.0
+    for _ in range(n):
+        world = jl.World(WORLD_SHAPE)
+        begin = time.perf_counter()
+        world.incorporate(local_map, knight_pos, view_radius)
+        total += time.perf_counter() - begin
+    return total / n
+
+
+def main() -> None:
+    rng = np.random.default_rng(1923)
+    knight_pos = (WORLD_SHAPE[0] / 2, WORLD_SHAPE[1] / 2)
+    n = 100
+    for view_radius in (50, 100, 150, 200):
+        local_map = make_local_map(view_radius, rng)
+        t = time_incorporate(local_map, knight_pos, view_radius, n)
+        print(f"view_radius {view_radius:>3}: {t * 1e3:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
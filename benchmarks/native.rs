@@ -0,0 +1,168 @@
+//! Microbenchmarks of the native code without the Python layer.
+//!
+//! Run with `cargo bench --no-default-features --bench native`.
+//! Prints one JSON object per benchmark to stdout,
+//! `benchmarks/suite.py --native` collects them.
+
+use janlukas::path::Path;
+use janlukas::pos::GridPos;
+use janlukas::world::{dilate, World, STEP_SIZE};
+use ndarray::{Array2, ArrayView2};
+use std::hint::black_box;
+use std::time::{Duration, Instant};
+
+const WORLD_SHAPE: (usize, usize) = (1792, 960);
+const START: (f64, f64) = (90.0, 480.0);
+const TARGET: (f64, f64) = (1700.0, 480.0);
+
+/// Run `f` repeatedly for about a second and print timing statistics.
+fn bench(name: &str, mut f: impl FnMut()) {
+    bench_with_setup(name, || (), |_| f());
+}
+
+/// Like `bench` but pass a fresh result of `setup` to every call of `f`.
+///
+/// Neither `setup` nor dropping its result are timed.
+fn bench_with_setup<T>(name: &str, mut setup: impl FnMut() -> T, mut f: impl FnMut(&mut T)) {
+    f(&mut setup()); // warm up
+    let mut times = Vec::with_capacity(1024);
+    let start = Instant::now();
+    while times.len() < 5 || (start.elapsed() < Duration::from_secs(1) && times.len() < 1000) {
+        let mut input = setup();
+        let t = Instant::now();
+        f(&mut input);
+        times.push(t.elapsed().as_secs_f64());
+        drop(input);
+    }
+    times.sort_by(f64::total_cmp);
+    println!(
+        "{{\"name\": \"{name}\", \"median\": {:e}, \"min\": {:e}, \"runs\": {}}}",
+        times[times.len() / 2],
+        times[0],
+        times.len()
+    );
+}
+
+/// Deterministic pseudo random numbers, good enough to place walls.
+struct Lcg(u64);
+
+impl Lcg {
+    fn next(&mut self, bound: usize) -> usize {
+        self.0 = self
+            .0
+            .wrapping_mul(6364136223846793005)
+            .wrapping_add(1442695040888963407);
+        ((self.0 >> 33) as usize) % bound
+    }
+}
+
+/// Map with axis aligned walls that cover about `density` of the pixels.
+fn make_local_map(shape: (usize, usize), density: f64, seed: u64) -> Array2<i64> {
+    let mut rng = Lcg(seed);
+    let mut map = Array2::zeros(shape);
+    let n_walls = (density * (shape.0 * shape.1) as f64 / (4.0 * 60.0)) as usize;
+    for _ in 0..n_walls {
+        let (x, y) = (rng.next(shape.0), rng.next(shape.1));
+        let (wx, wy) = if rng.next(2) == 0 { (60, 4) } else { (4, 60) };
+        for xx in x..(x + wx).min(shape.0) {
+            for yy in y..(y + wy).min(shape.1) {
+                map[(xx, yy)] = 1;
+            }
+        }
+    }
+    map
+}
+
+/// Reference for `dilate`: the extrusion that `World::incorporate` used before,
+/// which writes a block of (2 * radius + 1)^2 pixels for every obstacle pixel.
+fn dilate_per_pixel(local_map: ArrayView2<i64>, radius: usize) -> Array2<bool> {
+    let (lx, ly) = local_map.dim();
+    let mut dilated = Array2::from_elem((lx + 2 * radius, ly + 2 * radius), false);
+    for ((x, y), &l) in local_map.indexed_iter() {
+        if l != 1 {
+            continue;
+        }
+        for xx in x..x + 2 * radius + 1 {
+            for yy in y..y + 2 * radius + 1 {
+                dilated[(xx, yy)] = true;
+            }
+        }
+    }
+    dilated
+}
+
+fn make_world(density: f64) -> World {
+    // No cache so that repeated queries actually search.
+    let mut world = World::new(WORLD_SHAPE, 0, 2);
+    let mut local_map = make_local_map(WORLD_SHAPE, density, 83);
+    // Keep the start and target of the path finding benchmarks free.
+    for (x, y) in [START, TARGET] {
+        let (x, y) = (x as usize, y as usize);
+        local_map
+            .slice_mut(ndarray::s![x - 10..x + 10, y - 10..y + 10])
+            .fill(0);
+    }
+    let centre = GridPos::new(WORLD_SHAPE.0 / 2, WORLD_SHAPE.1 / 2);
+    world.incorporate_impl(local_map.view(), |l| l == 1, centre, WORLD_SHAPE.0);
+    world
+}
+
+fn main() {
+    for view_radius in [100, 200] {
+        let local_map = make_local_map((2 * view_radius + 1, 2 * view_radius + 1), 0.1, 5);
+        for radius in [2, 4] {
+            assert_eq!(
+                dilate(local_map.view(), |l| l == 1, radius),
+                dilate_per_pixel(local_map.view(), radius)
+            );
+            bench(
+                &format!("dilate[view_radius={view_radius},radius={radius}]"),
+                || {
+                    black_box(dilate(local_map.view(), |l| l == 1, radius));
+                },
+            );
+            bench(
+                &format!("dilate_per_pixel[view_radius={view_radius},radius={radius}]"),
+                || {
+                    black_box(dilate_per_pixel(local_map.view(), radius));
+                },
+            );
+        }
+    }
+
+    for view_radius in [100, 200] {
+        let local_map = make_local_map((2 * view_radius + 1, 2 * view_radius + 1), 0.1, 5);
+        let centre = GridPos::new(WORLD_SHAPE.0 / 2, WORLD_SHAPE.1 / 2);
+        // A fresh world every time, incorporating the same map again would not change anything.
+        bench_with_setup(
+            &format!("incorporate[view_radius={view_radius}]"),
+            || World::new(WORLD_SHAPE, 0, 2),
+            |world| world.incorporate_impl(local_map.view(), |l| l == 1, centre, view_radius),
+        );
+    }
+
+    for density in [0.0, 0.05, 0.15] {
+        let world = make_world(density);
+        for (engine, connectivity, step_size) in [
+            ("theta_star", 4, STEP_SIZE),
+            ("theta_star", 8, STEP_SIZE),
+            ("theta_star", 8, 2 * STEP_SIZE),
+            ("lazy_theta_star", 4, STEP_SIZE),
+            ("bidirectional_theta_star", 4, STEP_SIZE),
+            ("jps", 4, STEP_SIZE),
+        ] {
+            let mut path =
+                Path::new(&world, engine, false, connectivity, step_size, None, None).unwrap();
+            path.set_target(TARGET, false, false);
+            let name = if connectivity == 4 && step_size == STEP_SIZE {
+                format!("find_path[{engine},density={density}]")
+            } else {
+                format!("find_path[{engine}/{connectivity}/{step_size},density={density}]")
+            };
+            bench(&name, || {
+                path.clear_path();
+                let _ = black_box(path.next(START, &world, 1.0, 1.0 / 30.0));
+            });
+        }
+    }
+}
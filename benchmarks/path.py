@@ -56,7 +56,8 @@ def make_world(n_repeat: int) -> jl.World:
 
     local_map = np.repeat(np.repeat(local_map, n_repeat, axis=0), n_repeat, axis=1)
 
-    world = jl.World(local_map.shape)
+    # Repeated queries would be served from the cache and not search at all.
+    world = jl.World(local_map.shape, path_cache_size=0)
     world.incorporate(local_map, knight_pos=(nx // 2, ny // 2), view_range=max(nx, ny))
     return world
 
@@ -66,24 +67,78 @@ def main() -> None:
     start = (1 * n_repeat, 11 * n_repeat)
     target = (17 * n_repeat, 4 * n_repeat)
     world = make_world(n_repeat)
-    pathfinder = jl.Path(world)
     code = """
+pathfinder.clear_path()
 pathfinder.set_target(target)
 pathfinder.next(start, world, speed=1.0, dt=1.0)
     """
 
     n = 10
-    t = timeit.timeit(
-        code,
-        number=n,
-        globals={
-            "pathfinder": pathfinder,
-            "start": start,
-            "target": target,
-            "world": world,
-        },
-    )
-    print(f"Time: {t / n:.4f}s")
+    for engine in (
+        "theta_star",
+        "lazy_theta_star",
+        "bidirectional_theta_star",
+        "jps",
+        "d_star_lite",
+        "hierarchical",
+    ):
+        pathfinder = jl.Path(world, engine=engine)
+        # The first query builds the search state of incremental engines.
+        first = timeit.timeit(
+            code,
+            number=1,
+            globals={
+                "pathfinder": pathfinder,
+                "start": start,
+                "target": target,
+                "world": world,
+            },
+        )
+        t = timeit.timeit(
+            code,
+            number=n,
+            globals={
+                "pathfinder": pathfinder,
+                "start": start,
+                "target": target,
+                "world": world,
+            },
+        )
+        line = f"{engine:>24}: first {first:.4f}s, then {t / n:.4f}s"
+        stats = pathfinder.stats
+        if stats.nodes_expanded is not None:
+            line += f", {stats.nodes_expanded / stats.queries:.0f} expansions"
+            line += f", {stats.los_checks / stats.queries:.0f} LOS checks per query"
+        print(line)
+
+    bench_plan_many(world)
+
+
+def bench_plan_many(world: jl.World, n_queries: int = 256) -> None:
+    rng = np.random.default_rng(8471)
+    shape = world.map_view().shape
+    starts = []
+    targets = []
+    while len(starts) < n_queries:
+        start = tuple(rng.uniform((0, 0), shape))
+        target = tuple(rng.uniform((0, 0), shape))
+        if world.is_accessible(start) and world.is_accessible(target):
+            starts.append(start)
+            targets.append(target)
+    starts = np.array(starts)
+    targets = np.array(targets)
+
+    for n_threads in (1, None):
+        t = timeit.timeit(
+            lambda n_threads=n_threads: jl.Path.plan_many(
+                world, starts, targets, n_threads=n_threads
+            ),
+            number=1,
+        )
+        print(
+            f"plan_many (threads={n_threads or 'all'}): "
+            f"{n_queries / t:.1f} queries/s"
+        )
 
 
 # 913eb18: 0.1299s  (OG)
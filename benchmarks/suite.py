@@ -0,0 +1,325 @@
+"""Benchmark suite for the extension module and the AI.
+
+Examples:
+
+    # Run all benchmarks and print the results.
+    python benchmarks/suite.py
+    # Only run benchmarks whose name contains 'path'.
+    python benchmarks/suite.py -k path
+    # Store the results as the new baseline.
+    python benchmarks/suite.py --save
+    # Compare against the baseline, exits with 1 if anything got slower.
+    python benchmarks/suite.py --compare
+    # Include the native microbenchmarks (requires cargo).
+    python benchmarks/suite.py --native
+
+Baselines are machine specific, only compare results from the same machine.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from janlukas.ai import WORLD_SHAPE, Knight, jl
+from janlukas.state import AngleGemGetter, DistanceGemGetter
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+# A function to time or a pair of a function to time and a function
+# that resets the state before every call, outside of the timed section.
+Benchmark = Callable[[], object] | tuple[Callable[[], object], Callable[[], object]]
+
+# name -> function that sets up a benchmark and returns what to time
+BENCHMARKS: dict[str, Callable[[], Benchmark]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[], Benchmark]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def make_walls(shape: tuple, density: float, rng: np.random.Generator) -> np.ndarray:
+    """Return a map with axis aligned walls covering about `density` of the pixels."""
+    local_map = np.zeros(shape, dtype="int64")
+    n_walls = int(density * shape[0] * shape[1] / (4 * 60))
+    for _ in range(n_walls):
+        x, y = rng.integers(0, shape)
+        if rng.random() < 0.5:
+            local_map[x : x + 60, y : y + 4] = 1
+        else:
+            local_map[x : x + 4, y : y + 60] = 1
+    return local_map
+
+
+START = (90.0, 480.0)
+TARGET = (1700.0, 480.0)
+
+
+def make_world(density: float) -> jl.World:
+    local_map = make_walls(WORLD_SHAPE, density, np.random.default_rng(83))
+    # Keep the start and target of the path finding benchmarks free.
+    for x, y in (START, TARGET):
+        local_map[int(x) - 10 : int(x) + 10, int(y) - 10 : int(y) + 10] = 0
+    # No cache so that repeated queries actually search.
+    world = jl.World(WORLD_SHAPE, path_cache_size=0)
+    centre = (WORLD_SHAPE[0] / 2, WORLD_SHAPE[1] / 2)
+    world.incorporate(local_map, centre, WORLD_SHAPE[0])
+    return world
+
+
+def make_info(
+    world: jl.World, rng: np.random.Generator, position: tuple = START
+) -> dict:
+    """Return the info dict that the game passes to a knight at `position`."""
+    view_radius = 100
+    local_map = make_walls((2 * view_radius, 2 * view_radius), 0.05, rng)
+    # Keep the knight out of the walls.
+    centre = slice(view_radius - 10, view_radius + 10)
+    local_map[centre, centre] = 0
+    gems = rng.uniform((0, 0), (2 * view_radius, 2 * view_radius), size=(8, 2))
+    gems += np.array(position) - view_radius
+    gems = gems[[world.is_accessible(tuple(gem)) for gem in gems]]
+    return {
+        "me": {
+            "position": np.array(position),
+            "view_radius": view_radius,
+            "speed": 95.0,
+            "heading": 0.0,
+        },
+        "local_map": local_map,
+        "gems": {"x": gems[:, 0], "y": gems[:, 1]},
+        "friends": [],
+        "enemies": [],
+    }
+
+
+for _view_radius in (100, 200):
+
+    @benchmark(f"incorporate[view_radius={_view_radius}]")
+    def _(view_radius=_view_radius):
+        shape = (2 * view_radius + 1, 2 * view_radius + 1)
+        local_map = make_walls(shape, 0.1, np.random.default_rng(5))
+        centre = (WORLD_SHAPE[0] / 2, WORLD_SHAPE[1] / 2)
+        world = None
+
+        # Incorporating into the same world again would not change anything.
+        def reset():
+            nonlocal world
+            world = jl.World(WORLD_SHAPE)
+
+        def run():
+            world.incorporate(local_map, centre, view_radius)
+
+        return run, reset
+
+
+for _density in (0.0, 0.05, 0.15):
+    for _engine in (
+        "theta_star",
+        "lazy_theta_star",
+        "bidirectional_theta_star",
+        "jps",
+    ):
+
+        @benchmark(f"find_path[{_engine},density={_density}]")
+        def _(engine=_engine, density=_density):
+            world = make_world(density)
+            path = jl.Path(world, engine=engine)
+            path.set_target(TARGET)
+
+            def run():
+                path.clear_path()
+                path.next(START, world, speed=1.0, dt=1.0)
+
+            return run
+
+
+for _engine in ("theta_star", "d_star_lite"):
+
+    @benchmark(f"path_next[{_engine},steady]")
+    def _(engine=_engine):
+        world = make_world(0.05)
+        path = jl.Path(world, engine=engine)
+        path.set_target(TARGET)
+        path.next(START, world, speed=1.0, dt=1.0)
+        return lambda: path.next(START, world, speed=1.0, dt=1.0)
+
+    @benchmark(f"path_next[{_engine},replan]")
+    def _(engine=_engine):
+        world = make_world(0.05)
+        path = jl.Path(world, engine=engine)
+        path.set_target(TARGET)
+
+        def run():
+            path.recompute_in_one_turn()
+            path.next(START, world, speed=1.0, dt=1.0)
+            path.next(START, world, speed=1.0, dt=1.0)
+
+        return run
+
+
+for _getter in (AngleGemGetter, DistanceGemGetter):
+
+    @benchmark(f"get_gem[{_getter.__name__}]")
+    def _(getter_type=_getter):
+        world = make_world(0.05)
+        info = make_info(world, np.random.default_rng(71))
+        getter = getter_type(0.3) if getter_type is AngleGemGetter else getter_type()
+
+        def run():
+            getter.getting_gem = None
+            getter.get_gem(info, TARGET, world)
+
+        return run
+
+
+@benchmark("knight_run")
+def _():
+    # Search on this thread so that the searches are timed, like `replay --blocking`.
+    Knight.BACKGROUND_SEARCH = False
+    knight = Knight(kind="warrior", index=0, team="red")
+    rng = np.random.default_rng(19)
+    # Walk across the map and see a different part of it on every tick.
+    infos = [
+        make_info(knight.world, rng, tuple(position))
+        for position in np.linspace(START, TARGET, 256)
+    ]
+    t = 0.0
+    dt = 1 / 30
+    tick = 0
+
+    def run():
+        nonlocal t, tick
+        knight.run(t, dt, infos[tick % len(infos)])
+        t += dt
+        tick += 1
+
+    return run
+
+
+def time_benchmark(setup: Callable[[], Benchmark]) -> dict:
+    func = setup()
+    if isinstance(func, tuple):
+        return time_with_reset(*func)
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = sorted(t / number for t in timer.repeat(repeat=5, number=number))
+    return {"median": times[len(times) // 2], "min": times[0], "runs": 5 * number}
+
+
+def time_with_reset(func: Callable[[], object], reset: Callable[[], object]) -> dict:
+    """Time every call of `func` separately and call `reset` before each."""
+    times = []
+    start = time.perf_counter()
+    while len(times) < 5 or (time.perf_counter() - start < 1.0 and len(times) < 1000):
+        reset()
+        begin = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - begin)
+    times.sort()
+    return {"median": times[len(times) // 2], "min": times[0], "runs": len(times)}
+
+
+def run_native() -> dict:
+    output = subprocess.run(
+        ["cargo", "bench", "--no-default-features", "--bench", "native"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    results = {}
+    for line in output.splitlines():
+        if line.startswith("{"):
+            result = json.loads(line)
+            results["native." + result.pop("name")] = result
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print a comparison and return the names of benchmarks that got slower."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<45} {result['median']:.3e}s (new)")
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        marker = ""
+        if ratio > 1 + tolerance:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<45} {result['median']:.3e}s {ratio:6.2f}x{marker}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", default="", help="only run benchmarks containing this")
+    parser.add_argument("--native", action="store_true", help="run native benchmarks")
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="save results as baseline")
+    parser.add_argument("--compare", action="store_true", help="compare to baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="relative slowdown that counts as a regression",
+    )
+    args = parser.parse_args()
+    if args.compare and not args.baseline.exists():
+        parser.error(f"no baseline at {args.baseline}, run with --save first")
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.k in name:
+            results[name] = time_benchmark(setup)
+            if not args.compare:
+                print(f"{name:<45} {results[name]['median']:.3e}s")
+    if args.native:
+        results.update(
+            (name, result) for name, result in run_native().items() if args.k in name
+        )
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.json is not None:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.save:
+        args.baseline.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+//! Connected components of the free nodes of the lattice.
+//!
+//! Two free nodes are in the same component if a search on the 4-connected
+//! lattice can go from one to the other.
+//! Obstacles are only ever added, so components can only shrink or split.
+//! `block` checks whether the components around new obstacles are still
+//! connected within a window around them and only relabels a whole
+//! component if that check fails.
+
+/// Label of nodes that are obstacles.
+const BLOCKED: u32 = 0;
+/// Label of free nodes that have not been assigned to a component yet.
+const UNLABELLED: u32 = u32::MAX;
+
+/// Number of nodes by which the window of the local check in `block`
+/// extends beyond the new obstacles.
+const WINDOW_MARGIN: usize = 16;
+
+const DIRECTIONS: [(isize, isize); 4] = [(1, 0), (-1, 0), (0, 1), (0, -1)];
+
+/// Component labels of all nodes of the lattice.
+#[derive(Clone)]
+pub struct Components {
+    /// Label of each node in x-major order, `BLOCKED` for obstacles.
+    labels: Vec<u32>,
+    shape: (usize, usize),
+    next_label: u32,
+}
+
+/// Inclusive range of node indices in x and y.
+#[derive(Clone, Copy)]
+struct Window {
+    min: (usize, usize),
+    max: (usize, usize),
+}
+
+impl Window {
+    fn contains(&self, (i, j): (usize, usize)) -> bool {
+        (self.min.0..=self.max.0).contains(&i) && (self.min.1..=self.max.1).contains(&j)
+    }
+
+    fn shape(&self) -> (usize, usize) {
+        (self.max.0 - self.min.0 + 1, self.max.1 - self.min.1 + 1)
+    }
+
+    /// Index of a node in a buffer with one element per node of the window.
+    fn index(&self, (i, j): (usize, usize)) -> usize {
+        (i - self.min.0) * self.shape().1 + (j - self.min.1)
+    }
+}
+
+impl Components {
+    /// Label the nodes of a lattice with `shape` nodes where `is_free(i, j)`
+    /// tells which nodes are free.
+    pub fn new(shape: (usize, usize), is_free: impl Fn(usize, usize) -> bool) -> Self {
+        let mut labels = Vec::with_capacity(shape.0 * shape.1);
+        for i in 0..shape.0 {
+            for j in 0..shape.1 {
+                labels.push(if is_free(i, j) { UNLABELLED } else { BLOCKED });
+            }
+        }
+        let mut components = Self {
+            labels,
+            shape,
+            next_label: BLOCKED + 1,
+        };
+        for i in 0..shape.0 {
+            for j in 0..shape.1 {
+                if components.labels[components.index((i, j))] == UNLABELLED {
+                    let label = components.new_label();
+                    components.flood((i, j), UNLABELLED, label);
+                }
+            }
+        }
+        components
+    }
+
+    /// Component of node (i, j), None for obstacles and nodes outside the lattice.
+    pub fn label(&self, i: usize, j: usize) -> Option<u32> {
+        if i >= self.shape.0 || j >= self.shape.1 {
+            return None;
+        }
+        match self.labels[self.index((i, j))] {
+            BLOCKED => None,
+            label => Some(label),
+        }
+    }
+
+    /// Update the labels after `nodes` have become obstacles.
+    pub fn block(&mut self, nodes: &[(usize, usize)]) {
+        let window = match self.window_around(nodes) {
+            Some(window) => window,
+            None => return,
+        };
+        for &node in nodes {
+            let index = self.index(node);
+            self.labels[index] = BLOCKED;
+        }
+
+        // Every piece that a component splits into borders a new obstacle,
+        // so it contains a free neighbour of one.
+        let mut seeds: Vec<(u32, (usize, usize))> = nodes
+            .iter()
+            .flat_map(|&node| self.neighbours(node))
+            .filter_map(|n| self.label(n.0, n.1).map(|label| (label, n)))
+            .collect();
+        seeds.sort_unstable();
+        seeds.dedup();
+
+        let mut begin = 0;
+        while begin < seeds.len() {
+            let label = seeds[begin].0;
+            let end = begin + seeds[begin..].iter().take_while(|s| s.0 == label).count();
+            let group: Vec<_> = seeds[begin..end].iter().map(|s| s.1).collect();
+            begin = end;
+            if group.len() < 2 || self.connected_within(&group, label, window) {
+                continue;
+            }
+            // The component may have split.
+            // Relabel the pieces of all but the first seed, a piece that
+            // contains the first seed is relabelled if it contains another one.
+            for &seed in &group[1..] {
+                if self.labels[self.index(seed)] == label {
+                    let new_label = self.new_label();
+                    self.flood(seed, label, new_label);
+                }
+            }
+        }
+    }
+
+    fn index(&self, (i, j): (usize, usize)) -> usize {
+        i * self.shape.1 + j
+    }
+
+    fn new_label(&mut self) -> u32 {
+        let label = self.next_label;
+        self.next_label += 1;
+        label
+    }
+
+    /// Neighbours of a node on the 4-connected lattice that are inside the lattice.
+    fn neighbours(&self, (i, j): (usize, usize)) -> impl Iterator<Item = (usize, usize)> {
+        let shape = self.shape;
+        DIRECTIONS
+            .iter()
+            .map(move |&(di, dj)| (i.wrapping_add_signed(di), j.wrapping_add_signed(dj)))
+            .filter(move |&(i, j)| i < shape.0 && j < shape.1)
+    }
+
+    /// Change the label of all nodes labelled `from` that are connected to `seed` to `to`.
+    fn flood(&mut self, seed: (usize, usize), from: u32, to: u32) {
+        let mut stack = vec![seed];
+        let index = self.index(seed);
+        self.labels[index] = to;
+        while let Some(node) = stack.pop() {
+            for neighbour in self.neighbours(node) {
+                let index = self.index(neighbour);
+                if self.labels[index] == from {
+                    self.labels[index] = to;
+                    stack.push(neighbour);
+                }
+            }
+        }
+    }
+
+    /// Return true if all `seeds` are connected through nodes labelled `label`
+    /// without leaving `window`.
+    ///
+    /// Seeds outside of the window are never reached.
+    fn connected_within(&self, seeds: &[(usize, usize)], label: u32, window: Window) -> bool {
+        if !seeds.iter().all(|&seed| window.contains(seed)) {
+            return false;
+        }
+        let (wx, wy) = window.shape();
+        let mut is_seed = vec![false; wx * wy];
+        for &seed in seeds {
+            is_seed[window.index(seed)] = true;
+        }
+        let mut visited = vec![false; wx * wy];
+        let mut stack = vec![seeds[0]];
+        visited[window.index(seeds[0])] = true;
+        let mut n_reached = 1;
+        while let Some(node) = stack.pop() {
+            for neighbour in self.neighbours(node) {
+                if !window.contains(neighbour) || self.labels[self.index(neighbour)] != label {
+                    continue;
+                }
+                let index = window.index(neighbour);
+                if visited[index] {
+                    continue;
+                }
+                visited[index] = true;
+                if is_seed[index] {
+                    n_reached += 1;
+                    if n_reached == seeds.len() {
+                        return true;
+                    }
+                }
+                stack.push(neighbour);
+            }
+        }
+        false
+    }
+
+    /// Bounding box of `nodes` extended by `WINDOW_MARGIN`, None if there are no nodes.
+    fn window_around(&self, nodes: &[(usize, usize)]) -> Option<Window> {
+        let first = *nodes.first()?;
+        let (min, max) = nodes.iter().fold((first, first), |(min, max), &(i, j)| {
+            ((min.0.min(i), min.1.min(j)), (max.0.max(i), max.1.max(j)))
+        });
+        Some(Window {
+            min: (
+                min.0.saturating_sub(WINDOW_MARGIN),
+                min.1.saturating_sub(WINDOW_MARGIN),
+            ),
+            max: (
+                (max.0 + WINDOW_MARGIN).min(self.shape.0 - 1),
+                (max.1 + WINDOW_MARGIN).min(self.shape.1 - 1),
+            ),
+        })
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn wall_at_x(x: usize, ny: usize) -> Vec<(usize, usize)> {
+        (0..ny).map(|y| (x, y)).collect()
+    }
+
+    #[test]
+    fn empty_lattice_is_one_component() {
+        let components = Components::new((5, 4), |_, _| true);
+        assert_eq!(components.label(0, 0), components.label(4, 3));
+        assert!(components.label(0, 0).is_some());
+    }
+
+    #[test]
+    fn new_separates_components_by_obstacles() {
+        let components = Components::new((5, 4), |i, _| i != 2);
+        assert_eq!(components.label(2, 1), None);
+        assert_eq!(components.label(0, 0), components.label(1, 3));
+        assert_ne!(components.label(0, 0), components.label(3, 0));
+    }
+
+    #[test]
+    fn label_outside_lattice_is_none() {
+        let components = Components::new((5, 4), |_, _| true);
+        assert_eq!(components.label(5, 0), None);
+        assert_eq!(components.label(0, 4), None);
+    }
+
+    #[test]
+    fn block_keeps_component_if_obstacles_do_not_separate() {
+        let mut components = Components::new((5, 4), |_, _| true);
+        components.block(&[(2, 0), (2, 1), (2, 2)]);
+        assert_eq!(components.label(2, 1), None);
+        assert_eq!(components.label(0, 0), components.label(4, 0));
+    }
+
+    #[test]
+    fn block_splits_component_cut_by_wall() {
+        let mut components = Components::new((5, 4), |_, _| true);
+        components.block(&wall_at_x(2, 4));
+        assert_eq!(components.label(0, 0), components.label(1, 3));
+        assert_eq!(components.label(3, 0), components.label(4, 3));
+        assert_ne!(components.label(0, 0), components.label(4, 0));
+    }
+
+    #[test]
+    fn block_splits_component_when_wall_is_closed_in_several_calls() {
+        let mut components = Components::new((5, 4), |_, _| true);
+        components.block(&[(2, 0), (2, 1)]);
+        assert_eq!(components.label(0, 0), components.label(4, 0));
+        components.block(&[(2, 2), (2, 3)]);
+        assert_ne!(components.label(0, 0), components.label(4, 0));
+    }
+
+    #[test]
+    fn block_detects_split_beyond_window() {
+        // A long wall with a gap far away from the last blocked node.
+        let ny = 3 * WINDOW_MARGIN;
+        let mut components = Components::new((5, ny), |_, _| true);
+        components.block(&wall_at_x(2, ny)[1..]);
+        assert_eq!(components.label(0, ny - 1), components.label(4, ny - 1));
+        // Closing the gap is far from most of the wall.
+        components.block(&[(2, 0)]);
+        assert_ne!(components.label(0, ny - 1), components.label(4, ny - 1));
+        assert_eq!(components.label(0, 0), components.label(0, ny - 1));
+    }
+
+    #[test]
+    fn block_connected_around_long_wall_keeps_component() {
+        // The detour around the wall leaves the window.
+        let nx = 3 * WINDOW_MARGIN;
+        let ny = 3 * WINDOW_MARGIN;
+        let mut components = Components::new((nx, ny), |_, _| true);
+        components.block(&wall_at_x(nx / 2, ny - 1)[1..]);
+        components.block(&[(nx / 2, 0)]);
+        assert_eq!(components.label(0, 0), components.label(nx - 1, 0));
+    }
+
+    #[test]
+    fn block_enclosing_region_separates_it() {
+        let mut components = Components::new((7, 7), |_, _| true);
+        let mut ring = Vec::new();
+        for k in 1..=5 {
+            ring.extend([(1, k), (5, k), (k, 1), (k, 5)]);
+        }
+        components.block(&ring);
+        assert_ne!(components.label(3, 3), components.label(0, 0));
+        assert_eq!(components.label(2, 2), components.label(4, 4));
+        assert_eq!(components.label(0, 0), components.label(6, 6));
+    }
+}
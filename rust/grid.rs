@@ -0,0 +1,166 @@
+use memmap2::MmapMut;
+use ndarray::ArrayView2;
+use std::marker::PhantomData;
+
+/// Dense 2d storage indexed by (x, y).
+///
+/// Uses the same memory layout as an `Array2` with shape (nx, ny)
+/// but avoids the generic stride computations on every access.
+pub struct Grid<T> {
+    data: Storage<T>,
+    shape: (usize, usize),
+}
+
+enum Storage<T> {
+    Owned(Vec<T>),
+    /// Private copy-on-write mapping of a file.
+    /// Pages are only read when accessed and are shared with other
+    /// processes that map the same file until they are written to.
+    /// Only used for byte-sized `T`.
+    Mapped(MmapMut, PhantomData<T>),
+}
+
+impl<T> Grid<T>
+where
+    T: Copy,
+{
+    pub fn new(shape: (usize, usize), init: T) -> Self {
+        Self {
+            data: Storage::Owned(vec![init; shape.0 * shape.1]),
+            shape,
+        }
+    }
+
+    /// Use `data` in x-major order as the elements.
+    pub fn from_vec(shape: (usize, usize), data: Vec<T>) -> Self {
+        assert_eq!(data.len(), shape.0 * shape.1);
+        Self {
+            data: Storage::Owned(data),
+            shape,
+        }
+    }
+
+    pub fn shape(&self) -> (usize, usize) {
+        self.shape
+    }
+
+    /// All elements in x-major order.
+    #[inline]
+    pub fn as_slice(&self) -> &[T] {
+        match &self.data {
+            Storage::Owned(data) => data,
+            // SAFETY: Only constructed for byte-sized types for which all bit patterns
+            // are valid and the mapping has exactly one byte per element.
+            Storage::Mapped(mmap, _) => unsafe {
+                std::slice::from_raw_parts(mmap.as_ptr() as *const T, mmap.len())
+            },
+        }
+    }
+
+    #[inline]
+    fn as_mut_slice(&mut self) -> &mut [T] {
+        match &mut self.data {
+            Storage::Owned(data) => data,
+            // SAFETY: See `as_slice`.
+            Storage::Mapped(mmap, _) => unsafe {
+                std::slice::from_raw_parts_mut(mmap.as_mut_ptr() as *mut T, mmap.len())
+            },
+        }
+    }
+
+    #[inline]
+    pub fn get(&self, x: usize, y: usize) -> Option<T> {
+        if x < self.shape.0 && y < self.shape.1 {
+            Some(self.as_slice()[x * self.shape.1 + y])
+        } else {
+            None
+        }
+    }
+
+    #[inline]
+    pub fn set(&mut self, x: usize, y: usize, value: T) {
+        assert!(x < self.shape.0 && y < self.shape.1);
+        let ny = self.shape.1;
+        self.as_mut_slice()[x * ny + y] = value;
+    }
+
+    pub fn fill(&mut self, value: T) {
+        self.as_mut_slice().fill(value);
+    }
+
+    pub fn view(&self) -> ArrayView2<T> {
+        ArrayView2::from_shape(self.shape, self.as_slice()).unwrap()
+    }
+}
+
+macro_rules! impl_from_mmap {
+    ($($t:ty),*) => {$(
+        impl Grid<$t> {
+            /// Use a mapping of a file with one byte per element as the elements.
+            pub fn from_mmap(shape: (usize, usize), mmap: MmapMut) -> Self {
+                assert_eq!(mmap.len(), shape.0 * shape.1);
+                Self {
+                    data: Storage::Mapped(mmap, PhantomData),
+                    shape,
+                }
+            }
+        }
+    )*};
+}
+
+impl_from_mmap!(i8, u8);
+
+/// Clones are always owned, even if `self` is mapped from a file.
+impl<T> Clone for Grid<T>
+where
+    T: Copy,
+{
+    fn clone(&self) -> Self {
+        Self::from_vec(self.shape, self.as_slice().to_vec())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn new_fills_with_init() {
+        let grid = Grid::new((3, 2), 7u8);
+        assert!(grid.view().iter().all(|&x| x == 7));
+    }
+
+    #[test]
+    fn get_returns_set_value() {
+        let mut grid = Grid::new((3, 2), 0i8);
+        grid.set(2, 1, -1);
+        assert_eq!(grid.get(2, 1), Some(-1));
+        assert_eq!(grid.get(1, 1), Some(0));
+    }
+
+    #[test]
+    fn get_out_of_bounds_returns_none() {
+        let grid = Grid::new((3, 2), 0i8);
+        assert_eq!(grid.get(3, 0), None);
+        assert_eq!(grid.get(0, 2), None);
+    }
+
+    #[test]
+    fn clone_is_independent() {
+        let mut grid = Grid::new((3, 2), 0i8);
+        let copy = grid.clone();
+        grid.set(1, 1, 3);
+        assert_eq!(copy.get(1, 1), Some(0));
+    }
+
+    #[test]
+    fn view_has_same_layout_as_array2() {
+        let mut grid = Grid::new((3, 2), 0i8);
+        grid.set(2, 0, 4);
+        grid.set(0, 1, 5);
+        let view = grid.view();
+        assert_eq!(view.shape(), &[3, 2]);
+        assert_eq!(view[(2, 0)], 4);
+        assert_eq!(view[(0, 1)], 5);
+    }
+}
@@ -1,6 +1,9 @@
 #![allow(non_snake_case)]
 
+mod components;
+mod grid;
 pub mod path;
+mod path_cache;
 pub mod pos;
 mod pos_map;
 mod priority;
@@ -1,10 +1,20 @@
+use crate::path::bidirectional::BidirectionalThetaStar;
+use crate::path::d_star_lite::DStarLite;
+use crate::path::hierarchical::Hierarchical;
+use crate::path::jps::JumpPointSearch;
+use crate::path::stats::{plan_with_stats, SearchCounters, SearchStats};
 use crate::path::theta_star::ThetaStar;
 use crate::pos::*;
-use crate::priority::PriorityQueue;
-use crate::world::World;
+use crate::priority::{IndexedPriorityQueue, PriorityQueue};
+use crate::world::{Neighbourhood, World, STEP_SIZE};
 use nalgebra as na;
+use ndarray::Array2;
+use numpy::{IntoPyArray, PyArray2, PyReadonlyArray2};
 use pyo3::exceptions::{PyRuntimeError, PyValueError};
 use pyo3::prelude::*;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::thread::JoinHandle;
+use std::time::{Duration, Instant};
 
 #[allow(unused)]
 fn euclidean_distance(a: &Pos, b: &Pos) -> f64 {
@@ -13,27 +23,375 @@ fn euclidean_distance(a: &Pos, b: &Pos) -> f64 {
     na::EuclideanNorm {}.norm(&na::Vector2::new(diff.x as f64, diff.y as f64))
 }
 
-#[allow(unused)]
 fn manhattan_distance(a: &Pos, b: &Pos) -> i64 {
-    (a - b).sum()
+    (a - b).abs().sum()
+}
+
+/// Indices of a lattice node in grids with one element per node.
+fn lattice_index(node: &Pos) -> (usize, usize) {
+    (node.x as usize / STEP_SIZE, node.y as usize / STEP_SIZE)
+}
+
+/// Key of a lattice node in an `IndexedPriorityQueue`, `nj` is the number of nodes in y.
+#[inline]
+fn lattice_key(node: &Pos, nj: usize) -> usize {
+    let (i, j) = lattice_index(node);
+    i * nj + j
+}
+
+/// Inverse of `lattice_key`.
+#[inline]
+fn lattice_node(key: usize, nj: usize) -> Pos {
+    let (i, j) = (key / nj, key % nj);
+    Pos::new(
+        (i * STEP_SIZE + STEP_SIZE / 2) as Coord,
+        (j * STEP_SIZE + STEP_SIZE / 2) as Coord,
+    )
 }
 
+/// Targets are moved at most this many pixels when snapping, see `Path.set_target`.
+const SNAP_DISTANCE: f64 = 32.0;
+
 fn within_one_step(a: &WorldPos, b: &WorldPos, step_length: f64) -> bool {
     use nalgebra::Norm;
     na::EuclideanNorm {}.norm(&(a - b)).abs() < step_length
 }
 
+/// Algorithm that computes paths between nodes on the lattice.
+pub trait Pathfinder: Send {
+    /// Find a path from `start` to `target`.
+    ///
+    /// The returned path is in reverse order and does not contain `start`.
+    fn find_path(
+        &mut self,
+        start: &Pos,
+        target: &Pos,
+        world: &World,
+    ) -> PyResult<Option<Vec<WorldPos>>>;
+
+    /// Configuration that determines which paths `find_path` returns.
+    fn config(&self) -> PathfinderConfig;
+
+    /// Work done by all searches so far or None if the algorithm does not count it
+    /// or counting is disabled, see `SearchCounters`.
+    fn counters(&self) -> Option<SearchCounters> {
+        None
+    }
+
+    /// Whether the path returned by the last call to `find_path` reaches the target.
+    ///
+    /// Only pathfinders with a limited `Budget` return other paths.
+    fn last_status(&self) -> PathStatus {
+        PathStatus::Complete
+    }
+
+    /// True if `find_path` returns a partial path instead of an error
+    /// when the target is unreachable.
+    fn returns_partial_paths(&self) -> bool {
+        false
+    }
+}
+
+/// Engine and lattice of a pathfinder.
+///
+/// Part of the key of the path cache because different pathfinders
+/// find different paths for the same query.
+#[derive(Clone, Copy, PartialEq, Eq, Hash)]
+pub struct PathfinderConfig {
+    pub engine: &'static str,
+    pub neighbourhood: Neighbourhood,
+}
+
+impl PathfinderConfig {
+    /// Engines that only support the 4-connected lattice.
+    const fn four_connected(engine: &'static str) -> Self {
+        Self {
+            engine,
+            neighbourhood: Neighbourhood::FOUR,
+        }
+    }
+}
+
+/// How far a path found by a search goes.
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub enum PathStatus {
+    /// The path reaches the target.
+    Complete,
+    /// The budget ran out, the path leads to the expanded node closest to the target.
+    Partial,
+    /// The target cannot be reached, the path leads to the closest reachable node.
+    Unreachable,
+}
+
+impl PathStatus {
+    fn as_str(&self) -> &'static str {
+        match self {
+            PathStatus::Complete => "complete",
+            PathStatus::Partial => "partial",
+            PathStatus::Unreachable => "unreachable",
+        }
+    }
+}
+
+/// Limits on the work of a single search.
+///
+/// A search that hits a limit returns a partial path instead of continuing.
+#[derive(Clone, Copy, Default, PartialEq)]
+pub struct Budget {
+    pub max_expansions: Option<u64>,
+    pub max_time: Option<Duration>,
+}
+
+impl Budget {
+    /// Reading the clock after every expansion would cost more than the expansion,
+    /// so the time is only checked after this many expansions.
+    const EXPANSIONS_PER_CLOCK_CHECK: u64 = 32;
+
+    pub fn is_unlimited(&self) -> bool {
+        self.max_expansions.is_none() && self.max_time.is_none()
+    }
+
+    /// Return true if a search that began at `begin` and has expanded
+    /// `expanded` nodes has to stop.
+    fn is_exhausted(&self, expanded: u64, begin: &Instant) -> bool {
+        self.max_expansions.map_or(false, |max| expanded >= max)
+            || self.max_time.map_or(false, |max| {
+                expanded % Self::EXPANSIONS_PER_CLOCK_CHECK == 0 && begin.elapsed() >= max
+            })
+    }
+}
+
+fn make_pathfinder(
+    engine: &str,
+    world: &World,
+    neighbourhood: Neighbourhood,
+    budget: Budget,
+) -> PyResult<Box<dyn Pathfinder>> {
+    if neighbourhood != Neighbourhood::FOUR && !matches!(engine, "theta_star" | "lazy_theta_star") {
+        return Err(PyValueError::new_err(format!(
+            "Engine {engine} only supports connectivity 4 and step size {STEP_SIZE}"
+        )));
+    }
+    if !budget.is_unlimited() && !matches!(engine, "theta_star" | "lazy_theta_star") {
+        return Err(PyValueError::new_err(format!(
+            "Engine {engine} does not support search budgets"
+        )));
+    }
+    match engine {
+        "theta_star" => Ok(Box::new(ThetaStar::new(
+            world,
+            false,
+            neighbourhood,
+            budget,
+        ))),
+        "lazy_theta_star" => Ok(Box::new(ThetaStar::new(world, true, neighbourhood, budget))),
+        "bidirectional_theta_star" => Ok(Box::new(BidirectionalThetaStar::new(world))),
+        "d_star_lite" => Ok(Box::new(DStarLite::new(world))),
+        "hierarchical" => Ok(Box::new(Hierarchical::new(world))),
+        "jps" => Ok(Box::new(JumpPointSearch::new(world))),
+        _ => Err(PyValueError::new_err(format!(
+            "Unknown path finding engine: {engine}"
+        ))),
+    }
+}
+
+/// Path in reverse order without the start and how far it goes.
+type Planned = (Option<Vec<WorldPos>>, PathStatus);
+
+/// Find a path from `start` to the precise `target`.
+///
+/// Uses and fills the path cache of the world with paths of the same
+/// `PathfinderConfig`.
+/// The returned path is in reverse order and does not contain `start`.
+/// Partial paths are not cached and end at the node closest to the target.
+/// Targets in another connected component than the start are rejected
+/// without searching unless the pathfinder returns partial paths.
+fn plan(
+    pathfinder: &mut dyn Pathfinder,
+    start: &WorldPos,
+    target: &WorldPos,
+    world: &World,
+) -> PyResult<Planned> {
+    let start_node = World::closest_on_grid(&start.into_pos());
+    let target_node = World::closest_on_grid(&target.into_pos());
+    let config = pathfinder.config();
+    let cached = world
+        .path_cache()
+        .get(&config, &start_node, &target_node, world.version());
+    if let Some(path) = cached {
+        return Ok((
+            Some(with_precise_target(path, target)),
+            PathStatus::Complete,
+        ));
+    }
+    // Inaccessible targets are reported by the pathfinder.
+    if !pathfinder.returns_partial_paths()
+        && !world.is_obstacle_or_out(target_node.into_pos())
+        && world.is_disconnected(&start_node, &target_node)
+    {
+        return Err(unreachable_error(&start_node, &target_node));
+    }
+    let path = pathfinder.find_path(&start_node, &target_node, world)?;
+    let status = pathfinder.last_status();
+    // Budgets are not part of the cache key, so only complete paths may be cached.
+    if status != PathStatus::Complete {
+        return Ok((path, status));
+    }
+    if let Some(path) = &path {
+        world.path_cache().insert(
+            &config,
+            &start_node,
+            &target_node,
+            world.version(),
+            path.clone(),
+        );
+    }
+    Ok((path.map(|path| with_precise_target(path, target)), status))
+}
+
+/// Find a path from `start` to the precise `target` using the shared flow field of the target.
+fn plan_shared(
+    start: &WorldPos,
+    target: &WorldPos,
+    world: &World,
+) -> PyResult<Option<Vec<WorldPos>>> {
+    let start_node = World::closest_on_grid(&start.into_pos());
+    let target_node = World::closest_on_grid(&target.into_pos());
+    if world.is_obstacle_or_out(target_node.into_pos()) {
+        return Err(PyValueError::new_err(format!(
+            "Target is not accessible: {target_node}"
+        )));
+    }
+    if world.is_disconnected(&start_node, &target_node) {
+        // Do not compute a flow field over the whole component of the target.
+        return Err(unreachable_error(&start_node, &target_node));
+    }
+    match world.flow_path(&start_node, &target_node) {
+        Some(path) => Ok(Some(with_precise_target(path, target))),
+        None => Err(PyRuntimeError::new_err(format!(
+            "Failed to find path from {start_node} to {target_node}."
+        ))),
+    }
+}
+
+fn unreachable_error(start: &Pos, target: &Pos) -> PyErr {
+    PyRuntimeError::new_err(format!(
+        "Target {target} is not reachable from {start}, they are in different components."
+    ))
+}
+
+fn with_precise_target(mut path: Vec<WorldPos>, target: &WorldPos) -> Vec<WorldPos> {
+    match path.first_mut() {
+        Some(first) => *first = *target,
+        None => path.push(*target),
+    }
+    path
+}
+
+/// Solve independent queries on `n_threads` threads.
+///
+/// Each thread has its own pathfinder and takes the next unsolved query
+/// whenever it is done with one.
+/// Failed queries produce `None`.
+fn plan_in_parallel(
+    world: &World,
+    queries: &[(WorldPos, WorldPos)],
+    engine: &str,
+    n_threads: usize,
+) -> PyResult<Vec<Option<Vec<WorldPos>>>> {
+    let next_query = AtomicUsize::new(0);
+    let next_query = &next_query;
+    let solved = std::thread::scope(|scope| {
+        let handles: Vec<_> = (0..n_threads)
+            .map(|_| {
+                scope.spawn(move || -> PyResult<Vec<(usize, Option<Vec<WorldPos>>)>> {
+                    let mut pathfinder =
+                        make_pathfinder(engine, world, Neighbourhood::FOUR, Budget::default())?;
+                    let mut solved = Vec::new();
+                    loop {
+                        let index = next_query.fetch_add(1, Ordering::Relaxed);
+                        match queries.get(index) {
+                            Some((start, target)) => solved.push((
+                                index,
+                                plan(pathfinder.as_mut(), start, target, world)
+                                    .ok()
+                                    .and_then(|(path, _)| path),
+                            )),
+                            None => break,
+                        }
+                    }
+                    Ok(solved)
+                })
+            })
+            .collect();
+        handles
+            .into_iter()
+            .map(|handle| handle.join().expect("Path finding thread panicked"))
+            .collect::<PyResult<Vec<_>>>()
+    })?;
+
+    let mut paths = vec![None; queries.len()];
+    for (index, path) in solved.into_iter().flatten() {
+        paths[index] = path;
+    }
+    Ok(paths)
+}
+
+fn read_positions(array: &PyReadonlyArray2<WorldCoord>, name: &str) -> PyResult<Vec<WorldPos>> {
+    let array = array.as_array();
+    if array.shape()[1] != 2 {
+        return Err(PyValueError::new_err(format!(
+            "{name} must have shape (n, 2), got {:?}",
+            array.shape()
+        )));
+    }
+    Ok(array
+        .rows()
+        .into_iter()
+        .map(|row| WorldPos::new(row[0], row[1]))
+        .collect())
+}
+
+/// Search running on a worker thread.
+///
+/// The thread owns the pathfinder until it is joined.
+struct Job {
+    target: WorldPos,
+    handle: JoinHandle<JobOutput>,
+}
+
+type JobOutput = (Box<dyn Pathfinder>, PyResult<Planned>, SearchStats);
+
 #[pyclass]
 pub struct Path {
-    /// Target of the path in internal coordinates.
-    target: Pos,
     /// Precise target in world coordinates.
     world_target: WorldPos,
+    /// Where searches go, `world_target` moved to a reachable position if `snap`.
+    goal: WorldPos,
+    /// Move the target to the closest position that can be reached.
+    #[pyo3(get)]
+    snap: bool,
     /// Current path in reverse order.
     path: Vec<WorldPos>,
-    pathfinder: ThetaStar,
+    /// None while a background job is using it.
+    pathfinder: Option<Box<dyn Pathfinder>>,
     /// Recompute the path in this many calls to next.
     recompute_in: i32,
+    /// If true, search on a worker thread and keep using the old path meanwhile.
+    #[pyo3(get)]
+    background: bool,
+    job: Option<Job>,
+    /// Start a new background job as soon as the current one is done.
+    replan_requested: bool,
+    /// Follow the flow field of the world towards the target instead of searching.
+    #[pyo3(get)]
+    shared: bool,
+    /// Statistics of all searches since the last reset.
+    stats: SearchStats,
+    /// Statistics of the most recent search.
+    last_stats: Option<SearchStats>,
+    /// Status of the current path, None if there is none yet.
+    status: Option<PathStatus>,
 }
 
 impl Path {
@@ -43,17 +401,40 @@ impl Path {
         world: &World,
         step_length: f64,
     ) -> PyResult<Option<&WorldPos>> {
-        if within_one_step(current, &self.world_target, step_length) {
+        if self.snap && (self.path.is_empty() || self.recompute_in == 0) {
+            self.goal = world
+                .nearest_reachable_impl(&self.world_target, Some(current), SNAP_DISTANCE)
+                .unwrap_or(self.world_target);
+        }
+        if within_one_step(current, &self.goal, step_length) {
             return Ok(None);
         }
 
         if self.recompute_in == 0 {
-            self.path.clear();
+            self.replan_requested = true;
         }
         self.recompute_in -= 1;
 
-        if self.path.is_empty() {
+        if self.shared {
+            // Flow fields are shared by all paths and repaired in place,
+            // so they are built and repaired here on the calling thread.
+            if self.replan_requested || self.path.is_empty() {
+                let begin = Instant::now();
+                let result = plan_shared(current, &self.goal, world);
+                let path = result.as_ref().ok().and_then(|path| path.as_deref());
+                self.record(SearchStats::of_query(None, current, path, begin.elapsed()));
+                self.use_result(result.map(|path| (path, PathStatus::Complete)))?;
+                self.replan_requested = false;
+            }
+        } else if self.background {
+            self.poll_job()?;
+            if (self.replan_requested || self.path.is_empty()) && self.job.is_none() {
+                self.start_job(current, world);
+                self.replan_requested = false;
+            }
+        } else if self.replan_requested || self.path.is_empty() {
             self.find_path(current, world)?;
+            self.replan_requested = false;
         }
         self.drop_until_not_at(current, step_length);
         Ok(self.path.last())
@@ -70,45 +451,219 @@ impl Path {
     }
 
     fn find_path(&mut self, start: &WorldPos, world: &World) -> PyResult<()> {
-        match self.pathfinder.find_path(
-            &World::closest_on_grid(&start.into_pos()),
-            &World::closest_on_grid(&self.target),
-            world,
-        )? {
-            None => {}
-            Some(path) => {
+        let pathfinder = self
+            .pathfinder
+            .as_mut()
+            .expect("The pathfinder is only taken by background jobs");
+        let (result, stats) = plan_with_stats(pathfinder.as_mut(), start, &self.goal, world);
+        self.record(stats);
+        self.use_result(result)
+    }
+
+    fn use_result(&mut self, result: PyResult<Planned>) -> PyResult<()> {
+        let (path, status) = result?;
+        self.status = Some(status);
+        if status == PathStatus::Partial {
+            // Search again in the next call.
+            // It starts over from the position at that time with the same budget.
+            self.recompute_in = 0;
+        }
+        if let Some(path) = path {
+            // A partial path is empty if the search got no closer to the target
+            // than the start. An old path to the same target is a better guess.
+            if !(path.is_empty() && status == PathStatus::Partial) {
                 self.path = path;
-                // Make sure the target is precise.
-                self.path[0] = self.world_target;
             }
         }
         Ok(())
     }
+
+    fn record(&mut self, stats: SearchStats) {
+        self.stats.add(&stats);
+        self.last_stats = Some(stats);
+    }
+
+    fn start_job(&mut self, start: &WorldPos, world: &World) {
+        let mut pathfinder = self
+            .pathfinder
+            .take()
+            .expect("Only one background job may run at a time");
+        let snapshot = world.snapshot();
+        let start = *start;
+        let target = self.world_target;
+        let goal = self.goal;
+        let handle = std::thread::spawn(move || {
+            let (result, stats) = plan_with_stats(pathfinder.as_mut(), &start, &goal, &snapshot);
+            (pathfinder, result, stats)
+        });
+        self.job = Some(Job { target, handle });
+    }
+
+    /// Take over the result of the background job if it has finished.
+    fn poll_job(&mut self) -> PyResult<()> {
+        match &self.job {
+            Some(job) if job.handle.is_finished() => {
+                let Job { target, handle } = self.job.take().unwrap();
+                self.finish_job(target, handle.join().expect("Path finding thread panicked"))
+            }
+            _ => Ok(()),
+        }
+    }
+
+    fn finish_job(&mut self, target: WorldPos, output: JobOutput) -> PyResult<()> {
+        let (pathfinder, result, stats) = output;
+        self.pathfinder = Some(pathfinder);
+        self.record(stats);
+        if target != self.world_target {
+            return Ok(()); // The target has changed while searching.
+        }
+        self.use_result(result)
+    }
 }
 
 #[pymethods]
 impl Path {
+    /// Create a new path on the given world.
+    ///
+    /// `engine` selects the algorithm:
+    /// - `"theta_star"`: Theta*, recomputes the path from scratch every time.
+    /// - `"lazy_theta_star"`: Lazy Theta*, like Theta* but checks the line of sight
+    ///   only for expanded nodes instead of all generated nodes.
+    /// - `"bidirectional_theta_star"`: Theta* from both the start and the target
+    ///   until the searches meet. Expands fewer nodes for long paths.
+    /// - `"d_star_lite"`: D* Lite on the lattice followed by smoothing.
+    ///   Keeps its search state between calls and only repairs the parts
+    ///   affected by new obstacles as long as the target does not change.
+    /// - `"hierarchical"`: HPA* on an abstract graph of clusters of the lattice.
+    ///   Fast for long paths, updates only clusters with new obstacles.
+    /// - `"jps"`: Jump Point Search on the lattice followed by smoothing.
+    ///   Skips over open areas and expands far fewer nodes than Theta*.
+    ///
+    /// The unidirectional Theta* engines can search on a coarser or 8-connected lattice.
+    /// `connectivity` is 4 or 8 and `step_size` is the distance between
+    /// neighbouring nodes in pixels, a multiple of the step size of the world.
+    /// Larger steps expand fewer nodes but may miss narrow gaps.
+    /// Diagonal moves shorten the searched paths, so Theta* finds the final
+    /// path with fewer expansions in open areas.
+    ///
+    /// `max_expansions` and `time_budget` (in seconds) limit the work of each
+    /// search of the Theta* and Lazy Theta* engines.
+    /// When a search runs out of budget or finds that the target is unreachable,
+    /// it does not raise but returns a partial path to the node closest to the
+    /// target it has found, see `status`.
+    /// Partial paths are extended by searching again in the next call to `next`.
+    ///
+    /// If `background` is true, `next` never blocks on a search.
+    /// Instead, searches run on a worker thread on a snapshot of the world
+    /// while `next` keeps returning waypoints of the previous path.
+    /// The new path replaces the old one in the first call to `next`
+    /// after the search has finished.
+    /// Until the first path for a target is ready,
+    /// `next` returns None and `pending` is true.
     #[new]
-    pub fn new(world: &World) -> Self {
-        Self {
-            target: Pos::origin(),
+    #[pyo3(signature = (
+        world,
+        engine = "theta_star",
+        background = false,
+        connectivity = 4,
+        step_size = STEP_SIZE,
+        max_expansions = None,
+        time_budget = None,
+    ))]
+    pub fn new(
+        world: &World,
+        engine: &str,
+        background: bool,
+        connectivity: u8,
+        step_size: usize,
+        max_expansions: Option<u64>,
+        time_budget: Option<f64>,
+    ) -> PyResult<Self> {
+        let diagonal = match connectivity {
+            4 => false,
+            8 => true,
+            _ => {
+                return Err(PyValueError::new_err(format!(
+                    "connectivity must be 4 or 8, got {connectivity}"
+                )))
+            }
+        };
+        if step_size == 0 || step_size % STEP_SIZE != 0 {
+            return Err(PyValueError::new_err(format!(
+                "step_size must be a positive multiple of {STEP_SIZE}, got {step_size}"
+            )));
+        }
+        let neighbourhood = Neighbourhood {
+            diagonal,
+            stride: step_size / STEP_SIZE,
+        };
+        if max_expansions == Some(0) {
+            return Err(PyValueError::new_err("max_expansions must be positive"));
+        }
+        let max_time = match time_budget {
+            Some(seconds) if !(seconds > 0.0 && seconds.is_finite()) => {
+                return Err(PyValueError::new_err(format!(
+                    "time_budget must be a positive number of seconds, got {seconds}"
+                )))
+            }
+            seconds => seconds.map(Duration::from_secs_f64),
+        };
+        let budget = Budget {
+            max_expansions,
+            max_time,
+        };
+        Ok(Self {
             world_target: WorldPos::origin(),
+            goal: WorldPos::origin(),
+            snap: false,
             path: Vec::with_capacity(512),
-            pathfinder: ThetaStar::new(world),
+            pathfinder: Some(make_pathfinder(engine, world, neighbourhood, budget)?),
             recompute_in: 0,
-        }
+            background,
+            job: None,
+            replan_requested: false,
+            shared: false,
+            stats: SearchStats::default(),
+            last_stats: None,
+            status: None,
+        })
     }
 
-    pub fn set_target(&mut self, target: (WorldCoord, WorldCoord)) {
+    /// Set the target to go to.
+    ///
+    /// If `shared` is true, the path follows a flow field of the world
+    /// that is shared by all paths with the same target.
+    /// Use this for targets that many knights go to.
+    /// The first path to a target computes the field for the whole map,
+    /// afterwards, paths to it cost almost nothing.
+    ///
+    /// If `snap` is true, the path goes to the position closest to the target
+    /// that can be reached from the current position, see `World.nearest_reachable`,
+    /// instead of failing when the target is on an obstacle or cut off.
+    /// The target is moved by at most 32 pixels and snapped again whenever
+    /// the path is recomputed, see `goal`.
+    #[pyo3(signature = (target, shared = false, snap = false))]
+    pub fn set_target(&mut self, target: (WorldCoord, WorldCoord), shared: bool, snap: bool) {
         let world_target = WorldPos::new(target.0, target.1);
-        if world_target == self.world_target {
+        if world_target == self.world_target && shared == self.shared && snap == self.snap {
             return;
         }
         self.world_target = world_target;
-        self.target = self.world_target.into_pos();
+        self.goal = world_target;
+        self.shared = shared;
+        self.snap = snap;
+        // The old path leads somewhere else.
+        self.path.clear();
+        self.status = None;
         self.recompute_in = 0;
     }
 
+    /// Return the next waypoint on the way from `current` to the goal.
+    ///
+    /// None if `current` is at the goal or if there is no waypoint yet.
+    /// The latter happens while a background search is `pending` and when the
+    /// status is `"partial"` or `"unreachable"` and the search did not get
+    /// closer to the goal than `current`. Check those before treating None as arrival.
     pub fn next(
         &mut self,
         current: (WorldCoord, WorldCoord),
@@ -121,106 +676,461 @@ impl Path {
             .map(|p| (p.x, p.y)))
     }
 
-    fn clear_path(&mut self) {
+    /// Position that the path goes to.
+    ///
+    /// The target or, with `snap`, the position it was snapped to.
+    #[getter]
+    pub fn goal(&self) -> (WorldCoord, WorldCoord) {
+        (self.goal.x, self.goal.y)
+    }
+
+    pub fn clear_path(&mut self) {
         self.path.clear();
     }
 
     pub fn recompute_in_one_turn(&mut self) {
         self.recompute_in = 1;
     }
+
+    /// How far the current path goes:
+    /// - `"complete"`: to the target.
+    /// - `"partial"`: the search ran out of budget, to the node closest to the target.
+    /// - `"unreachable"`: the target cannot be reached, to the closest reachable node.
+    ///
+    /// None if there is no path to the current target yet.
+    #[getter]
+    pub fn status(&self) -> Option<&'static str> {
+        self.status.map(|status| status.as_str())
+    }
+
+    /// Number of line of sight checks made by the searches of this path so far.
+    ///
+    /// None if the engine does not count them, the extension was built without
+    /// the `search-stats` feature, or a background search is running.
+    #[getter]
+    pub fn los_checks(&self) -> Option<u64> {
+        Some(self.pathfinder.as_ref()?.counters()?.los_checks)
+    }
+
+    /// Statistics of all searches of this path since it was created
+    /// or `reset_stats` was called.
+    ///
+    /// Searches on a worker thread are included once their result is taken over.
+    #[getter]
+    pub fn stats(&self) -> SearchStats {
+        self.stats.clone()
+    }
+
+    /// Statistics of the most recent search, None if there was none.
+    #[getter]
+    pub fn last_stats(&self) -> Option<SearchStats> {
+        self.last_stats.clone()
+    }
+
+    pub fn reset_stats(&mut self) {
+        self.stats = SearchStats::default();
+        self.last_stats = None;
+    }
+
+    /// True if a background search is running or its result has not been used yet.
+    #[getter]
+    pub fn pending(&self) -> bool {
+        self.job.is_some()
+    }
+
+    /// True if a background search has finished and its result
+    /// will be used by the next call to `next`.
+    #[getter]
+    pub fn ready(&self) -> bool {
+        self.job
+            .as_ref()
+            .map_or(false, |job| job.handle.is_finished())
+    }
+
+    /// Block until the background search, if any, has finished and use its result.
+    pub fn wait(&mut self, py: Python<'_>) -> PyResult<()> {
+        if let Some(Job { target, handle }) = self.job.take() {
+            // Release the GIL while waiting so that other Python threads can run.
+            let output =
+                py.allow_threads(move || handle.join().expect("Path finding thread panicked"));
+            self.finish_job(target, output)?;
+        }
+        Ok(())
+    }
+
+    /// Find paths for many queries at once.
+    ///
+    /// `starts` and `targets` are arrays of shape (n, 2).
+    /// The queries are solved in parallel on `n_threads` threads
+    /// (by default, one per CPU) without holding the GIL.
+    ///
+    /// Returns a list with one array of shape (m, 2) per query holding the
+    /// waypoints from the start (exclusive) to the target (inclusive),
+    /// or None if there is no path.
+    #[staticmethod]
+    #[pyo3(signature = (world, starts, targets, engine = "theta_star", n_threads = None))]
+    pub fn plan_many<'py>(
+        py: Python<'py>,
+        world: &World,
+        starts: PyReadonlyArray2<WorldCoord>,
+        targets: PyReadonlyArray2<WorldCoord>,
+        engine: &str,
+        n_threads: Option<usize>,
+    ) -> PyResult<Vec<Option<&'py PyArray2<WorldCoord>>>> {
+        let starts = read_positions(&starts, "starts")?;
+        let targets = read_positions(&targets, "targets")?;
+        if starts.len() != targets.len() {
+            return Err(PyValueError::new_err(format!(
+                "Got {} starts but {} targets",
+                starts.len(),
+                targets.len()
+            )));
+        }
+        let queries: Vec<_> = starts.into_iter().zip(targets).collect();
+        let n_threads = n_threads
+            .unwrap_or_else(|| std::thread::available_parallelism().map_or(1, |n| n.get()))
+            .clamp(1, queries.len().max(1));
+
+        let paths = py.allow_threads(|| plan_in_parallel(world, &queries, engine, n_threads))?;
+        Ok(paths
+            .into_iter()
+            .map(|path| {
+                path.map(|path| {
+                    let flat: Vec<WorldCoord> =
+                        path.iter().rev().flat_map(|p| [p.x, p.y]).collect();
+                    Array2::from_shape_vec((path.len(), 2), flat)
+                        .unwrap()
+                        .into_pyarray(py)
+                })
+            })
+            .collect())
+    }
 }
 
 pub fn bind(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
     m.add_class::<Path>()?;
+    m.add_class::<SearchStats>()?;
     Ok(())
 }
 
+/// Shorten a path on the lattice by skipping nodes that are in line of sight.
+///
+/// `nodes` goes from the start to the target.
+/// The result is in reverse order and does not contain the start,
+/// like the paths returned by `Pathfinder::find_path`.
+fn smooth_path(nodes: &[Pos], world: &World) -> Vec<WorldPos> {
+    let mut waypoints = Vec::with_capacity(32);
+    let mut anchor = match nodes.first() {
+        Some(start) => *start,
+        None => return waypoints,
+    };
+    for window in nodes.windows(2) {
+        let (previous, next) = (window[0], window[1]);
+        if previous != anchor && bresenham::path_is_blocked(&anchor, &next, world) {
+            waypoints.push(previous.into_pos());
+            anchor = previous;
+        }
+    }
+    if nodes.len() > 1 {
+        waypoints.push(nodes[nodes.len() - 1].into_pos());
+    }
+    waypoints.reverse();
+    waypoints
+}
+
+mod bidirectional;
+pub(crate) mod buffers;
+mod d_star_lite;
+pub(crate) mod flow_field;
+mod hierarchical;
+mod jps;
+pub(crate) mod one_to_many;
+mod stats;
+
 mod theta_star {
+    use super::buffers::SearchBuffers;
     use super::*;
-    use crate::pos_map::PosMap;
 
+    /// Theta* and Lazy Theta*.
+    ///
+    /// See Nash, Koenig, Tovey, "Lazy Theta*: Any-Angle Path Planning and
+    /// Path Length Analysis in 3D", AAAI 2010.
+    /// The lazy variant assumes that a generated node is in line of sight
+    /// of the parent of the expanded node and only checks this when the
+    /// generated node is expanded itself.
+    /// Most generated nodes are never expanded, so this saves most checks.
+    ///
+    /// The search state lives in buffers from the pool of the world.
+    ///
+    /// On lattices with a stride > 1, the target is usually not a node of the
+    /// lattice around the start, so it is connected to all expanded nodes
+    /// within one stride that are in line of sight.
     pub struct ThetaStar {
-        /// Unexpanded nodes.
-        /// value: node
-        /// cost: cost to go to node + heuristic
-        open_set: PriorityQueue<Pos, f64>,
-        /// Maps node to its parent
-        parents: PosMap<Pos>,
-        /// Current best cost to go to node
-        costs: PosMap<f64>,
+        lazy: bool,
+        neighbourhood: Neighbourhood,
+        budget: Budget,
+        counters: SearchCounters,
+        status: PathStatus,
     }
 
     impl ThetaStar {
-        pub fn new(world: &World) -> Self {
+        pub fn new(
+            _world: &World,
+            lazy: bool,
+            neighbourhood: Neighbourhood,
+            budget: Budget,
+        ) -> Self {
             Self {
-                open_set: PriorityQueue::with_capacity(2 << 11),
-                parents: PosMap::new(world.shape(), Pos::new(-1, -1)),
-                costs: PosMap::new(world.shape(), f64::INFINITY),
+                lazy,
+                neighbourhood,
+                budget,
+                counters: SearchCounters::default(),
+                status: PathStatus::Complete,
             }
         }
+    }
 
-        pub fn clear(&mut self) {
-            self.open_set.clear();
-            self.parents.clear();
-            self.costs.clear();
+    /// Return an error if the search from `start` to `target` is impossible.
+    pub(super) fn check_query(start: &Pos, target: &Pos, world: &World) -> PyResult<()> {
+        if world.is_obstacle_or_out(target.into_pos()) {
+            return Err(PyValueError::new_err(format!(
+                "Target is not accessible: {target}"
+            )));
+        }
+        let (ni, nj) = world.lattice_shape();
+        let (si, sj) = lattice_index(start);
+        if si >= ni || sj >= nj {
+            return Err(PyValueError::new_err(format!(
+                "Start is not on the map: {start}"
+            )));
         }
+        Ok(())
+    }
 
-        pub fn find_path(
-            &mut self,
+    /// State of a single search that can be advanced one expansion at a time.
+    pub(super) struct Search<'a> {
+        buffers: &'a mut SearchBuffers,
+        counters: &'a mut SearchCounters,
+        lazy: bool,
+        neighbourhood: Neighbourhood,
+        /// Number of lattice nodes in y.
+        nj: usize,
+        target: Pos,
+        /// Expanded node with the lowest distance to the target and that distance.
+        closest: (Pos, f64),
+    }
+
+    impl<'a> Search<'a> {
+        pub(super) fn new(
+            buffers: &'a mut SearchBuffers,
+            counters: &'a mut SearchCounters,
+            lazy: bool,
+            neighbourhood: Neighbourhood,
             start: &Pos,
             target: &Pos,
             world: &World,
-        ) -> PyResult<Option<Vec<WorldPos>>> {
-            if world.is_obstacle_or_out(target.into_pos()) {
-                return Err(PyValueError::new_err(format!(
-                    "Target is not accessible: {target}"
-                )));
+        ) -> Self {
+            let mut search = Self {
+                buffers,
+                counters,
+                lazy,
+                neighbourhood,
+                nj: world.lattice_shape().1,
+                target: *target,
+                closest: (*start, euclidean_distance(start, target)),
+            };
+            search.push(start, 0.0);
+            search.buffers.costs.set(start, 0.0);
+            search
+        }
+    }
+
+    impl Search<'_> {
+        #[inline]
+        fn key_of(&self, node: &Pos) -> usize {
+            lattice_key(node, self.nj)
+        }
+
+        #[inline]
+        fn node_of(&self, key: usize) -> Pos {
+            lattice_node(key, self.nj)
+        }
+
+        fn push(&mut self, node: &Pos, expected_cost: f64) {
+            let key = self.key_of(node);
+            if self.buffers.open_set.push_or_decrease(key, expected_cost) {
+                self.counters.count_push();
             }
+        }
 
-            self.clear();
-            self.open_set.push(*start, 0.0);
-            self.costs.set(start, 0.0);
+        fn in_line_of_sight(&mut self, a: &Pos, b: &Pos, world: &World) -> bool {
+            self.counters.count_los_check();
+            !bresenham::path_is_blocked(a, b, world)
+        }
 
-            while let Some(current) = self.open_set.pop() {
-                if target == &current {
-                    break;
+        fn source_of(&mut self, node: &Pos, current: &Pos, world: &World) -> Pos {
+            if self.lazy {
+                // Assume line of sight, it is checked in `set_vertex`.
+                return self
+                    .buffers
+                    .parents
+                    .get_if_set(current)
+                    .copied()
+                    .unwrap_or(*current);
+            }
+            if let Some(&parent) = self.buffers.parents.get_if_set(current) {
+                if self.in_line_of_sight(&parent, node, world) {
+                    return parent;
                 }
+            }
+            *current
+        }
 
-                for neighbour in world
-                    .free_neighbours_of(&current.into_pos())
-                    .map(|n| Pos::new(n.x as Coord, n.y as Coord))
-                {
-                    let src = self.source_of(&neighbour, &current, world);
-                    if neighbour == src {
-                        continue;
-                    }
+        /// Fix the parent of a node that is about to be expanded in the lazy variant.
+        ///
+        /// If the assumed line of sight does not exist, use the best expanded neighbour.
+        fn set_vertex(&mut self, node: &Pos, world: &World) {
+            let parent = match self.buffers.parents.get_if_set(node) {
+                Some(&parent) => parent,
+                None => return, // start
+            };
+            if self.in_line_of_sight(&parent, node, world) {
+                return;
+            }
+            let buffers = &self.buffers;
+            let best = world
+                .neighbours_of(&node.into_pos(), self.neighbourhood)
+                .map(|n| Pos::new(n.x as Coord, n.y as Coord))
+                .filter(|n| buffers.closed.get_unchecked(n))
+                .map(|n| {
+                    (
+                        n,
+                        buffers.costs.get_unchecked(&n) + euclidean_distance(&n, node),
+                    )
+                })
+                .min_by(|a, b| a.1.total_cmp(&b.1));
+            // The node was generated by expanding a neighbour, so there is one.
+            if let Some((neighbour, cost)) = best {
+                self.buffers.parents.set(node, neighbour);
+                self.buffers.costs.set(node, cost);
+            }
+        }
 
-                    let cost =
-                        self.costs.get_unchecked(&src) + euclidean_distance(&src, &neighbour);
-                    if cost < self.costs.get_or(&neighbour, &f64::INFINITY) {
-                        let expected_cost = cost + euclidean_distance(&neighbour, target);
-                        self.open_set.push(neighbour, expected_cost);
-                        self.parents.set(&neighbour, src);
-                        self.costs.set(&neighbour, cost);
-                    }
+        /// Run until the target is expanded, the open set is empty, or the budget is used up.
+        ///
+        /// Returns false if the budget was used up.
+        fn run(&mut self, world: &World, budget: &Budget) -> bool {
+            let begin = Instant::now();
+            let mut expanded = 0;
+            while let Some(current) = self.expand_next(world) {
+                if current == self.target {
+                    return true;
+                }
+                expanded += 1;
+                if budget.is_exhausted(expanded, &begin) {
+                    return false;
                 }
             }
+            true
+        }
 
-            if !self.parents.is_set(target) {
-                return Err(PyRuntimeError::new_err(format!(
-                    "Failed to find path from {start} to {target}."
-                )));
+        /// Expand the node with the lowest expected cost and return it.
+        ///
+        /// The neighbours of the target are not generated.
+        /// Each node is in the open set at most once, so there are no outdated entries
+        /// and `counters.stale_pops` stays 0.
+        pub(super) fn expand_next(&mut self, world: &World) -> Option<Pos> {
+            let (key, _) = self.buffers.open_set.pop()?;
+            let current = self.node_of(key);
+            if self.lazy {
+                self.set_vertex(&current, world);
+            }
+            self.buffers.closed.set(&current, true);
+            self.counters.count_expanded();
+            let distance = euclidean_distance(&current, &self.target);
+            if distance < self.closest.1 {
+                self.closest = (current, distance);
             }
-            Ok(Some(self.reconstruct_path(start, target)))
+            if current != self.target {
+                self.expand(&current, world);
+            }
+            Some(current)
+        }
+
+        /// Lowest expected cost of all nodes in the open set.
+        pub(super) fn min_expected_cost(&self) -> Option<f64> {
+            self.buffers.open_set.peek_cost()
+        }
+
+        pub(super) fn n_open(&self) -> usize {
+            self.buffers.open_set.len()
         }
 
-        fn source_of(&self, node: &Pos, current: &Pos, world: &World) -> Pos {
-            if let Some(parent) = self.parents.get_if_set(current) {
-                if !bresenham::path_is_blocked(parent, node, world) {
-                    return *parent;
+        /// Current best cost to go from the start to `node`, infinite if not reached.
+        pub(super) fn cost(&self, node: &Pos) -> f64 {
+            self.buffers.costs.get_or(node, &f64::INFINITY)
+        }
+
+        pub(super) fn parent(&self, node: &Pos) -> Option<Pos> {
+            self.buffers.parents.get_if_set(node).copied()
+        }
+
+        fn expand(&mut self, current: &Pos, world: &World) {
+            let target = self.target;
+            for neighbour in world
+                .neighbours_of(&current.into_pos(), self.neighbourhood)
+                .map(|n| Pos::new(n.x as Coord, n.y as Coord))
+            {
+                if self.buffers.closed.get_unchecked(&neighbour) {
+                    continue;
+                }
+                let src = self.source_of(&neighbour, current, world);
+                if neighbour == src {
+                    continue;
+                }
+
+                let cost =
+                    self.buffers.costs.get_unchecked(&src) + euclidean_distance(&src, &neighbour);
+                if cost < self.buffers.costs.get_or(&neighbour, &f64::INFINITY) {
+                    let expected_cost = cost + euclidean_distance(&neighbour, &target);
+                    self.push(&neighbour, expected_cost);
+                    self.buffers.parents.set(&neighbour, src);
+                    self.buffers.costs.set(&neighbour, cost);
                 }
             }
-            *current
+            if self.neighbourhood.stride > 1 {
+                self.connect_target(current, &target, world);
+            }
+        }
+
+        /// Make `target` a neighbour of `current` if it is within one stride
+        /// and in line of sight.
+        ///
+        /// Unlike for other nodes, the line of sight from the parent is
+        /// always checked, even in the lazy variant,
+        /// because `set_vertex` could not find a replacement parent
+        /// among the neighbours of a target that is not on the lattice.
+        fn connect_target(&mut self, current: &Pos, target: &Pos, world: &World) {
+            let (ci, cj) = lattice_index(current);
+            let (ti, tj) = lattice_index(target);
+            let stride = self.neighbourhood.stride;
+            if ci.abs_diff(ti) > stride
+                || cj.abs_diff(tj) > stride
+                || self.buffers.closed.get_unchecked(target)
+                || !self.in_line_of_sight(current, target, world)
+            {
+                return;
+            }
+            let src = match self.buffers.parents.get_if_set(current).copied() {
+                Some(parent) if self.in_line_of_sight(&parent, target, world) => parent,
+                _ => *current,
+            };
+            let cost = self.buffers.costs.get_unchecked(&src) + euclidean_distance(&src, target);
+            if cost < self.buffers.costs.get_or(target, &f64::INFINITY) {
+                self.push(target, cost);
+                self.buffers.parents.set(target, src);
+                self.buffers.costs.set(target, cost);
+            }
         }
 
         fn reconstruct_path(&self, start: &Pos, target: &Pos) -> Vec<WorldPos> {
@@ -228,11 +1138,76 @@ mod theta_star {
             let mut curr = *target;
             while curr != *start {
                 path.push(curr.into_pos());
-                curr = self.parents.get_unchecked(&curr);
+                curr = self.buffers.parents.get_unchecked(&curr);
             }
             path
         }
     }
+
+    impl Pathfinder for ThetaStar {
+        fn config(&self) -> PathfinderConfig {
+            PathfinderConfig {
+                engine: if self.lazy {
+                    "lazy_theta_star"
+                } else {
+                    "theta_star"
+                },
+                neighbourhood: self.neighbourhood,
+            }
+        }
+
+        fn find_path(
+            &mut self,
+            start: &Pos,
+            target: &Pos,
+            world: &World,
+        ) -> PyResult<Option<Vec<WorldPos>>> {
+            check_query(start, target, world)?;
+
+            let mut buffers = world.search_buffers();
+            let mut search = Search::new(
+                &mut buffers,
+                &mut self.counters,
+                self.lazy,
+                self.neighbourhood,
+                start,
+                target,
+                world,
+            );
+            let finished = search.run(world, &self.budget);
+
+            if search.buffers.parents.is_set(target) {
+                self.status = PathStatus::Complete;
+                return Ok(Some(search.reconstruct_path(start, target)));
+            }
+            if self.budget.is_unlimited() {
+                return Err(PyRuntimeError::new_err(format!(
+                    "Failed to find path from {start} to {target}."
+                )));
+            }
+            // Empty if no expanded node is closer to the target than the start.
+            let closest = search.closest.0;
+            let path = search.reconstruct_path(start, &closest);
+            self.status = if finished {
+                PathStatus::Unreachable
+            } else {
+                PathStatus::Partial
+            };
+            Ok(Some(path))
+        }
+
+        fn counters(&self) -> Option<SearchCounters> {
+            self.counters.report()
+        }
+
+        fn last_status(&self) -> PathStatus {
+            self.status
+        }
+
+        fn returns_partial_paths(&self) -> bool {
+            !self.budget.is_unlimited()
+        }
+    }
 }
 
 /// Collision detection based on Bresenham's line drawing algorithm.
@@ -255,19 +1230,15 @@ mod bresenham {
         let diff = p1 - p0;
         let dx = diff.x;
         let dy = diff.y.abs();
-        let mut d = 2 * dy - dx;
         let y_increment = if p0.y > p1.y { -1 } else { 1 };
 
-        let mut y = p0.y;
-        for x in p0.x..(p1.x + 1) {
-            if world.is_obstacle_coords(x as usize, y as usize) {
-                return true;
-            }
-            if d > 0 {
-                y += y_increment;
-                d += 2 * (dy - dx);
-            } else {
-                d += 2 * dy;
+        let mut n = 0;
+        while n <= dx {
+            let x = p0.x + n;
+            let y = p0.y + y_increment * minor_offset(n, dx, dy);
+            match next_step(x, y, world) {
+                Some(step) => n += step,
+                None => return true,
             }
         }
         false
@@ -278,21 +1249,43 @@ mod bresenham {
         let diff = p1 - p0;
         let dx = diff.x.abs();
         let dy = diff.y;
-        let mut d = 2 * dx - dy;
         let x_increment = if p0.x > p1.x { -1 } else { 1 };
 
-        let mut x = p0.x;
-        for y in p0.y..(p1.y + 1) {
-            if world.is_obstacle_coords(x as usize, y as usize) {
-                return true;
-            }
-            if d > 0 {
-                x += x_increment;
-                d += 2 * (dx - dy);
-            } else {
-                d += 2 * dx;
+        let mut n = 0;
+        while n <= dy {
+            let x = p0.x + x_increment * minor_offset(n, dy, dx);
+            let y = p0.y + n;
+            match next_step(x, y, world) {
+                Some(step) => n += step,
+                None => return true,
             }
         }
         false
     }
+
+    /// Return how many pixels along the line can be skipped after (x, y)
+    /// or None if (x, y) is an obstacle.
+    ///
+    /// Each step moves by at most one pixel along both axes, so all pixels
+    /// in the next `clearance - 1` steps are closer than the clearance and free.
+    #[inline]
+    fn next_step(x: Coord, y: Coord, world: &World) -> Option<Coord> {
+        match world.clearance_coords(x as usize, y as usize) {
+            Some(0) => None,
+            Some(clearance) => Some(clearance as Coord),
+            None => Some(1),
+        }
+    }
+
+    /// Offset along the minor axis of the n-th pixel of a line with
+    /// 0 <= minor <= major.
+    ///
+    /// Closed form of the error term updates in Bresenham's algorithm.
+    #[inline]
+    fn minor_offset(n: Coord, major: Coord, minor: Coord) -> Coord {
+        if major == 0 {
+            return 0;
+        }
+        (2 * minor * n + major - 1) / (2 * major)
+    }
 }
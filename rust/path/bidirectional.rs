@@ -0,0 +1,125 @@
+//! Bidirectional Theta*.
+//!
+//! Grows one Theta* tree from the start and one from the target, always
+//! expanding the tree with the smaller open set, until the cheapest
+//! connection between the trees cannot be improved anymore.
+//! This pays off when the target is in a dead end, where a single tree
+//! floods everything in front of it while the tree from the target only
+//! has to leave the dead end. On open maps, both trees together expand
+//! about as many nodes as Theta*.
+
+use super::theta_star::{check_query, Search};
+use super::*;
+
+pub struct BidirectionalThetaStar {
+    counters: SearchCounters,
+}
+
+impl BidirectionalThetaStar {
+    pub fn new(_world: &World) -> Self {
+        Self {
+            counters: SearchCounters::default(),
+        }
+    }
+}
+
+/// Return the node where the trees meet on the cheapest connection found.
+///
+/// Stops when the lowest expected cost in either open set is at least the
+/// cost of that connection, i.e., when neither tree can find a cheaper one.
+fn meet<'a>(forward: &mut Search<'a>, backward: &mut Search<'a>, world: &World) -> Option<Pos> {
+    let mut best: Option<(f64, Pos)> = None;
+    while let (Some(forward_min), Some(backward_min)) =
+        (forward.min_expected_cost(), backward.min_expected_cost())
+    {
+        if best.map_or(false, |(cost, _)| cost <= forward_min.max(backward_min)) {
+            break;
+        }
+        let (search, other) = if forward.n_open() <= backward.n_open() {
+            (&mut *forward, &*backward)
+        } else {
+            (&mut *backward, &*forward)
+        };
+        let node = search.expand_next(world).unwrap();
+        // Generated nodes have valid parents in the eager variant,
+        // so a node that is expanded in one tree and generated in the other connects them.
+        let cost = search.cost(&node) + other.cost(&node);
+        if best.map_or(cost.is_finite(), |(best_cost, _)| cost < best_cost) {
+            best = Some((cost, node));
+        }
+    }
+    best.map(|(_, node)| node)
+}
+
+/// Return the nodes from `node` to the root of the tree of `search`, excluding `node`.
+fn to_root(search: &Search, node: &Pos) -> Vec<Pos> {
+    let mut nodes = Vec::with_capacity(32);
+    let mut current = *node;
+    while let Some(parent) = search.parent(&current) {
+        nodes.push(parent);
+        current = parent;
+    }
+    nodes
+}
+
+impl Pathfinder for BidirectionalThetaStar {
+    fn config(&self) -> PathfinderConfig {
+        PathfinderConfig::four_connected("bidirectional_theta_star")
+    }
+
+    fn find_path(
+        &mut self,
+        start: &Pos,
+        target: &Pos,
+        world: &World,
+    ) -> PyResult<Option<Vec<WorldPos>>> {
+        check_query(start, target, world)?;
+
+        let mut forward_buffers = world.search_buffers();
+        let mut backward_buffers = world.search_buffers();
+        let mut forward_counters = SearchCounters::default();
+        let mut backward_counters = SearchCounters::default();
+        let nodes = {
+            let mut forward = Search::new(
+                &mut forward_buffers,
+                &mut forward_counters,
+                false,
+                Neighbourhood::FOUR,
+                start,
+                target,
+                world,
+            );
+            let mut backward = Search::new(
+                &mut backward_buffers,
+                &mut backward_counters,
+                false,
+                Neighbourhood::FOUR,
+                target,
+                start,
+                world,
+            );
+            meet(&mut forward, &mut backward, world).map(|meeting| {
+                let mut nodes = to_root(&forward, &meeting);
+                nodes.reverse();
+                nodes.push(meeting);
+                nodes.extend(to_root(&backward, &meeting));
+                nodes
+            })
+        };
+        self.counters.add(&forward_counters);
+        self.counters.add(&backward_counters);
+
+        match nodes {
+            // The parents in both trees are in line of sight, only the
+            // connection at the meeting node may be shortened.
+            Some(nodes) => Ok(Some(smooth_path(&nodes, world))),
+            None => Err(PyRuntimeError::new_err(format!(
+                "Failed to find path from {start} to {target}."
+            ))),
+        }
+    }
+
+    fn counters(&self) -> Option<SearchCounters> {
+        self.counters.report()
+    }
+}
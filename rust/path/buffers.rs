@@ -0,0 +1,141 @@
+//! Scratch memory of Theta* and jump point searches.
+//!
+//! Searches on a world draw their buffers from a pool owned by the world
+//! and return them when they are done.
+//! So there are only as many sets of buffers as searches that run at the
+//! same time instead of one set per `Path`.
+
+use super::*;
+use crate::pos_map::PosMap;
+use std::ops::{Deref, DerefMut};
+use std::sync::Mutex;
+
+pub struct SearchBuffers {
+    /// Generated but unexpanded nodes.
+    /// key: lattice index of the node
+    /// cost: cost to go to node + heuristic
+    pub open_set: IndexedPriorityQueue<f64>,
+    /// Maps node to its parent
+    pub parents: PosMap<Pos>,
+    /// Current best cost to go to node
+    pub costs: PosMap<f64>,
+    /// Expanded nodes.
+    pub closed: PosMap<bool>,
+    /// Results of horizontal runs of jump point search, see `jps`.
+    pub runs: PosMap<u8>,
+}
+
+impl SearchBuffers {
+    fn new(lattice_shape: (usize, usize)) -> Self {
+        Self {
+            open_set: IndexedPriorityQueue::new(lattice_shape.0 * lattice_shape.1),
+            parents: PosMap::new(lattice_shape, Pos::new(-1, -1)),
+            costs: PosMap::new(lattice_shape, f64::INFINITY),
+            closed: PosMap::new(lattice_shape, false),
+            runs: PosMap::new(lattice_shape, 0),
+        }
+    }
+
+    fn clear(&mut self) {
+        self.open_set.clear();
+        self.parents.clear();
+        self.costs.clear();
+        self.closed.clear();
+        self.runs.clear();
+    }
+}
+
+/// Buffers that are currently not used by any search.
+pub struct BufferPool {
+    free: Mutex<Vec<SearchBuffers>>,
+    lattice_shape: (usize, usize),
+}
+
+impl BufferPool {
+    pub fn new(lattice_shape: (usize, usize)) -> Self {
+        Self {
+            free: Mutex::new(Vec::new()),
+            lattice_shape,
+        }
+    }
+
+    /// Take cleared buffers from the pool or allocate new ones if all are in use.
+    ///
+    /// The buffers go back to the pool when the returned guard is dropped.
+    pub fn take(&self) -> PooledBuffers {
+        let buffers = self.free.lock().unwrap().pop();
+        let buffers = match buffers {
+            Some(mut buffers) => {
+                buffers.clear();
+                buffers
+            }
+            None => SearchBuffers::new(self.lattice_shape),
+        };
+        PooledBuffers {
+            pool: self,
+            buffers: Some(buffers),
+        }
+    }
+
+    /// Number of buffers that are not in use.
+    pub fn n_free(&self) -> usize {
+        self.free.lock().unwrap().len()
+    }
+}
+
+pub struct PooledBuffers<'pool> {
+    pool: &'pool BufferPool,
+    /// Only None while being dropped.
+    buffers: Option<SearchBuffers>,
+}
+
+impl Deref for PooledBuffers<'_> {
+    type Target = SearchBuffers;
+
+    fn deref(&self) -> &SearchBuffers {
+        self.buffers.as_ref().unwrap()
+    }
+}
+
+impl DerefMut for PooledBuffers<'_> {
+    fn deref_mut(&mut self) -> &mut SearchBuffers {
+        self.buffers.as_mut().unwrap()
+    }
+}
+
+impl Drop for PooledBuffers<'_> {
+    fn drop(&mut self) {
+        if let Some(buffers) = self.buffers.take() {
+            self.pool.free.lock().unwrap().push(buffers);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn dropped_buffers_are_reused() {
+        let pool = BufferPool::new((4, 3));
+        {
+            let mut buffers = pool.take();
+            buffers.costs.set(&Pos::new(6, 2), 1.0);
+            assert_eq!(pool.n_free(), 0);
+        }
+        assert_eq!(pool.n_free(), 1);
+        let buffers = pool.take();
+        assert_eq!(pool.n_free(), 0);
+        assert!(!buffers.costs.is_set(&Pos::new(6, 2)));
+    }
+
+    #[test]
+    fn take_allocates_while_buffers_are_in_use() {
+        let pool = BufferPool::new((4, 3));
+        let a = pool.take();
+        let b = pool.take();
+        drop(a);
+        drop(b);
+        assert_eq!(pool.n_free(), 2);
+    }
+}
@@ -0,0 +1,235 @@
+//! Incremental path finding with D* Lite.
+//!
+//! See Koenig, Likhachev, "D* Lite", AAAI 2002.
+//! The search runs backwards from the target to the start on the lattice.
+//! When new obstacles appear, only the affected nodes are repaired
+//! instead of throwing the whole search tree away.
+//! The resulting lattice path is smoothed into an any-angle path.
+
+use super::theta_star::check_query;
+use super::*;
+use crate::pos_map::PosMap;
+use crate::world::STEP_SIZE;
+
+/// Priority of a node, compared lexicographically.
+type Key = (f64, f64);
+
+pub struct DStarLite {
+    /// Inconsistent nodes.
+    /// value: node
+    /// cost: key of the node when it was pushed
+    open_set: PriorityQueue<Pos, Key>,
+    /// Current best cost to go from node to the target.
+    costs: PosMap<f64>,
+    /// One-step lookahead of `costs` based on the neighbours.
+    lookahead: PosMap<f64>,
+    start: Pos,
+    target: Pos,
+    /// Offset of the keys that accounts for the start moving.
+    key_modifier: f64,
+    /// Number of `World::blocked_nodes` that have been incorporated.
+    n_seen_blocked: usize,
+    /// True if the search state is valid for `target`.
+    initialised: bool,
+    counters: SearchCounters,
+}
+
+impl DStarLite {
+    pub fn new(world: &World) -> Self {
+        Self {
+            open_set: PriorityQueue::with_capacity(2 << 11),
+            costs: PosMap::new(world.lattice_shape(), f64::INFINITY),
+            lookahead: PosMap::new(world.lattice_shape(), f64::INFINITY),
+            start: Pos::origin(),
+            target: Pos::origin(),
+            key_modifier: 0.0,
+            n_seen_blocked: 0,
+            initialised: false,
+            counters: SearchCounters::default(),
+        }
+    }
+
+    fn heuristic(a: &Pos, b: &Pos) -> f64 {
+        manhattan_distance(a, b) as f64
+    }
+
+    fn key(&self, node: &Pos) -> Key {
+        let cost = self
+            .costs
+            .get_unchecked(node)
+            .min(self.lookahead.get_unchecked(node));
+        (
+            cost + Self::heuristic(&self.start, node) + self.key_modifier,
+            cost,
+        )
+    }
+
+    fn is_consistent(&self, node: &Pos) -> bool {
+        self.costs.get_unchecked(node) == self.lookahead.get_unchecked(node)
+    }
+
+    /// Free neighbours of `node` and `start` if it is a neighbour on an obstacle.
+    ///
+    /// Knights next to walls often stand on a node inside the inflated walls.
+    /// Like in Theta*, such a start is connected to its free neighbours.
+    fn neighbours<'w>(node: &Pos, start: Pos, world: &'w World) -> impl Iterator<Item = Pos> + 'w {
+        let blocked_start = manhattan_distance(node, &start) == STEP_SIZE as i64
+            && world.is_obstacle_or_out(start.into_pos());
+        world
+            .free_neighbours_of(&node.into_pos())
+            .map(|n| Pos::new(n.x as Coord, n.y as Coord))
+            .chain(blocked_start.then_some(start))
+    }
+
+    /// Return the neighbour with the lowest cost to go to the target and that cost.
+    fn best_successor(&self, node: &Pos, world: &World) -> Option<(Pos, f64)> {
+        if node != &self.start && world.is_obstacle_or_out(node.into_pos()) {
+            return None;
+        }
+        Self::neighbours(node, self.start, world)
+            .map(|n| (n, self.costs.get_unchecked(&n) + STEP_SIZE as f64))
+            .filter(|(_, cost)| cost.is_finite())
+            .min_by(|a, b| a.1.total_cmp(&b.1))
+    }
+
+    fn restart(&mut self, start: &Pos, target: &Pos, world: &World) {
+        self.open_set.clear();
+        self.costs.clear();
+        self.lookahead.clear();
+        self.start = *start;
+        self.target = *target;
+        self.key_modifier = 0.0;
+        self.n_seen_blocked = world.blocked_nodes().len();
+        self.initialised = true;
+
+        self.lookahead.set(target, 0.0);
+        self.push(target);
+    }
+
+    fn push(&mut self, node: &Pos) {
+        self.open_set.push(*node, self.key(node));
+        self.counters.count_push();
+    }
+
+    fn update_node(&mut self, node: &Pos, world: &World) {
+        if node != &self.target {
+            let cost = self
+                .best_successor(node, world)
+                .map_or(f64::INFINITY, |(_, cost)| cost);
+            self.lookahead.set(node, cost);
+        }
+        // Outdated entries stay in the queue and are skipped when popped.
+        if !self.is_consistent(node) {
+            self.push(node);
+        }
+    }
+
+    fn move_start(&mut self, start: &Pos, world: &World) {
+        self.key_modifier += Self::heuristic(&self.start, start);
+        self.start = *start;
+        if world.is_obstacle_or_out(start.into_pos()) {
+            // Obstacles have no lookahead, see `neighbours`.
+            self.update_node(start, world);
+        }
+    }
+
+    fn incorporate_new_obstacles(&mut self, world: &World) {
+        let blocked = &world.blocked_nodes()[self.n_seen_blocked..];
+        self.n_seen_blocked += blocked.len();
+        for node in blocked {
+            self.update_node(node, world);
+            for neighbour in Self::neighbours(node, self.start, world) {
+                self.update_node(&neighbour, world);
+            }
+        }
+    }
+
+    fn compute_shortest_path(&mut self, world: &World) {
+        while let Some(top_key) = self.open_set.peek_cost() {
+            if top_key >= self.key(&self.start) && self.is_consistent(&self.start) {
+                break;
+            }
+            let (node, old_key) = self.open_set.pop_with_cost().unwrap();
+            if self.is_consistent(&node) {
+                self.counters.count_stale_pop();
+                continue; // outdated entry
+            }
+            let new_key = self.key(&node);
+            if old_key < new_key {
+                self.push(&node);
+                continue;
+            }
+            if old_key > new_key {
+                self.counters.count_stale_pop();
+                continue; // superseded by an entry with new_key
+            }
+            self.counters.count_expanded();
+
+            let cost = self.costs.get_unchecked(&node);
+            let lookahead = self.lookahead.get_unchecked(&node);
+            if cost > lookahead {
+                self.costs.set(&node, lookahead);
+            } else {
+                self.costs.set(&node, f64::INFINITY);
+                self.update_node(&node, world);
+            }
+            for neighbour in Self::neighbours(&node, self.start, world) {
+                self.update_node(&neighbour, world);
+            }
+        }
+    }
+
+    /// Follow the cheapest successors from start to target.
+    fn extract_nodes(&self, world: &World) -> Option<Vec<Pos>> {
+        let (nx, ny) = world.shape();
+        let max_length = nx * ny / (STEP_SIZE * STEP_SIZE);
+
+        let mut nodes = Vec::with_capacity(128);
+        let mut current = self.start;
+        nodes.push(current);
+        while current != self.target {
+            if nodes.len() > max_length {
+                return None;
+            }
+            current = self.best_successor(&current, world)?.0;
+            nodes.push(current);
+        }
+        Some(nodes)
+    }
+}
+
+impl Pathfinder for DStarLite {
+    fn config(&self) -> PathfinderConfig {
+        PathfinderConfig::four_connected("d_star_lite")
+    }
+
+    fn find_path(
+        &mut self,
+        start: &Pos,
+        target: &Pos,
+        world: &World,
+    ) -> PyResult<Option<Vec<WorldPos>>> {
+        check_query(start, target, world)?;
+
+        if !self.initialised || target != &self.target {
+            self.restart(start, target, world);
+        } else {
+            self.move_start(start, world);
+            self.incorporate_new_obstacles(world);
+        }
+        self.compute_shortest_path(world);
+
+        match self.extract_nodes(world) {
+            Some(nodes) if self.costs.get_unchecked(start).is_finite() => {
+                Ok(Some(smooth_path(&nodes, world)))
+            }
+            _ => Err(PyRuntimeError::new_err(format!(
+                "Failed to find path from {start} to {target}."
+            ))),
+        }
+    }
+
+    fn counters(&self) -> Option<SearchCounters> {
+        self.counters.report()
+    }
+}
@@ -0,0 +1,279 @@
+//! Shared distance fields towards goals that many knights go to.
+//!
+//! A flow field stores the any-angle distance to its goal and the next
+//! node on the way to the goal for every node of the lattice.
+//! It is computed once with a backwards Theta* search that is run until
+//! the open set is empty.
+//! Afterwards, the next waypoint of any knight is a lookup.
+//!
+//! When obstacles appear, only nodes whose line to their parent crosses
+//! a new obstacle and the nodes that lead through them are recomputed.
+
+use super::*;
+use crate::grid::Grid;
+use crate::world::STEP_SIZE;
+
+/// Maximum number of goals that fields are kept for.
+const MAX_FIELDS: usize = 8;
+
+pub struct FlowField {
+    goal: Pos,
+    /// Cost to go from a node to the goal, indexed by lattice node.
+    costs: Grid<f64>,
+    /// Next node on the way to the goal, in line of sight, indexed by lattice node.
+    /// The parent of the goal is the goal itself.
+    parents: Grid<Option<Pos>>,
+    /// Number of `World::changes` that have been incorporated.
+    n_seen_changes: usize,
+    open_set: PriorityQueue<Pos, f64>,
+}
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+enum Status {
+    Unknown,
+    Valid,
+    Invalid,
+}
+
+fn node_at(i: usize, j: usize) -> Pos {
+    Pos::new(
+        (i * STEP_SIZE + STEP_SIZE / 2) as Coord,
+        (j * STEP_SIZE + STEP_SIZE / 2) as Coord,
+    )
+}
+
+fn neighbours<'a>(node: &Pos, world: &'a World) -> impl Iterator<Item = Pos> + 'a {
+    world
+        .free_neighbours_of(&node.into_pos())
+        .map(|n| Pos::new(n.x as Coord, n.y as Coord))
+}
+
+impl FlowField {
+    pub fn new(goal: &Pos, world: &World) -> Self {
+        let shape = world.lattice_shape();
+        let mut field = Self {
+            goal: *goal,
+            costs: Grid::new(shape, f64::INFINITY),
+            parents: Grid::new(shape, None),
+            n_seen_changes: world.changes().len(),
+            open_set: PriorityQueue::with_capacity(2 << 11),
+        };
+        if !world.is_obstacle_or_out(goal.into_pos()) {
+            field.set(goal, 0.0, *goal);
+            field.open_set.push(*goal, 0.0);
+            field.expand(world);
+        }
+        field
+    }
+
+    /// Cost to go from the lattice node to the goal, infinite if unreachable.
+    fn cost(&self, node: &Pos) -> f64 {
+        let (i, j) = lattice_index(node);
+        self.costs.get(i, j).unwrap_or(f64::INFINITY)
+    }
+
+    /// Next node on the way from the lattice node to the goal within the field.
+    fn parent(&self, node: &Pos) -> Option<Pos> {
+        let (i, j) = lattice_index(node);
+        self.parents.get(i, j).flatten()
+    }
+
+    /// First node of the field on the way from the lattice node `node`
+    /// and the distance to it.
+    ///
+    /// Knights next to walls often stand on a node inside the inflated walls,
+    /// which is not part of the field.
+    /// Like in searches, they go to the free neighbour with the cheapest path first.
+    fn entry_from(&self, node: &Pos, world: &World) -> Option<(Pos, f64)> {
+        let (i, j) = lattice_index(node);
+        if world.is_free_node(i, j) {
+            return Some((*node, 0.0));
+        }
+        neighbours(node, world)
+            .map(|n| (n, euclidean_distance(node, &n)))
+            .filter(|(n, _)| self.cost(n).is_finite())
+            .min_by(|a, b| (self.cost(&a.0) + a.1).total_cmp(&(self.cost(&b.0) + b.1)))
+    }
+
+    /// Cost to go from the lattice node to the goal, infinite if unreachable.
+    pub fn cost_from(&self, node: &Pos, world: &World) -> f64 {
+        self.entry_from(node, world)
+            .map_or(f64::INFINITY, |(entry, distance)| {
+                distance + self.cost(&entry)
+            })
+    }
+
+    /// Next node on the way from the lattice node to the goal.
+    pub fn next_from(&self, node: &Pos, world: &World) -> Option<Pos> {
+        match self.entry_from(node, world)? {
+            (entry, _) if entry != *node => Some(entry),
+            _ => self.parent(node),
+        }
+    }
+
+    /// Return the path from `start` to the goal in reverse order without `start`.
+    pub fn path_from(&self, start: &Pos, world: &World) -> Option<Vec<WorldPos>> {
+        let mut path = Vec::with_capacity(64);
+        let (mut current, _) = self.entry_from(start, world)?;
+        if current != *start {
+            path.push(current.into_pos());
+        }
+        while current != self.goal {
+            current = self.parent(&current)?;
+            path.push(current.into_pos());
+        }
+        path.reverse();
+        Some(path)
+    }
+
+    fn set(&mut self, node: &Pos, cost: f64, parent: Pos) {
+        let (i, j) = lattice_index(node);
+        self.costs.set(i, j, cost);
+        self.parents.set(i, j, Some(parent));
+    }
+
+    fn source_of(&self, node: &Pos, current: &Pos, world: &World) -> Pos {
+        let parent = self.parent(current).unwrap();
+        if bresenham::path_is_blocked(&parent, node, world) {
+            *current
+        } else {
+            parent
+        }
+    }
+
+    /// Run Theta* until the open set is empty.
+    fn expand(&mut self, world: &World) {
+        while let Some((current, cost)) = self.open_set.pop_with_cost() {
+            if cost > self.cost(&current) {
+                continue; // outdated entry
+            }
+            for neighbour in neighbours(&current, world) {
+                let source = self.source_of(&neighbour, &current, world);
+                let new_cost = self.cost(&source) + euclidean_distance(&source, &neighbour);
+                if new_cost < self.cost(&neighbour) {
+                    self.set(&neighbour, new_cost, source);
+                    self.open_set.push(neighbour, new_cost);
+                }
+            }
+        }
+    }
+
+    /// Repair the field after the world has changed.
+    pub fn update(&mut self, world: &World) {
+        let changes = &world.changes()[self.n_seen_changes..];
+        if changes.is_empty() {
+            return;
+        }
+        self.n_seen_changes = world.changes().len();
+
+        if world.is_obstacle_or_out(self.goal.into_pos()) {
+            self.costs.fill(f64::INFINITY);
+            self.parents.fill(None);
+            return;
+        }
+
+        // Nodes whose line to their parent is blocked now are invalid.
+        // Nodes that are not reachable stay unreachable and are valid.
+        let (ni, nj) = self.costs.shape();
+        let mut status = Grid::new((ni, nj), Status::Valid);
+        for i in 0..ni {
+            for j in 0..nj {
+                let node = node_at(i, j);
+                if let Some(parent) = self.parents.get(i, j).flatten() {
+                    let blocked = changes.iter().any(|c| c.intersects_line(&node, &parent))
+                        && (!world.is_free_node(i, j)
+                            || bresenham::path_is_blocked(&parent, &node, world));
+                    // Unknown until we know whether the parent is valid.
+                    let node_status = if blocked {
+                        Status::Invalid
+                    } else {
+                        Status::Unknown
+                    };
+                    status.set(i, j, node_status);
+                }
+            }
+        }
+        let (gi, gj) = lattice_index(&self.goal);
+        status.set(gi, gj, Status::Valid);
+
+        // So are all nodes that lead through an invalid node.
+        let mut chain = Vec::new();
+        for i in 0..ni {
+            for j in 0..nj {
+                let (mut ci, mut cj) = (i, j);
+                while status.get(ci, cj) == Some(Status::Unknown) {
+                    chain.push((ci, cj));
+                    (ci, cj) = lattice_index(&self.parents.get(ci, cj).flatten().unwrap());
+                }
+                let resolved = status.get(ci, cj).unwrap();
+                for (ci, cj) in chain.drain(..) {
+                    status.set(ci, cj, resolved);
+                }
+            }
+        }
+
+        // Reset invalid nodes and search again from their valid neighbours.
+        self.open_set.clear();
+        for i in 0..ni {
+            for j in 0..nj {
+                if status.get(i, j) == Some(Status::Invalid) {
+                    self.costs.set(i, j, f64::INFINITY);
+                    self.parents.set(i, j, None);
+                }
+            }
+        }
+        for i in 0..ni {
+            for j in 0..nj {
+                if status.get(i, j) != Some(Status::Invalid) || !world.is_free_node(i, j) {
+                    continue;
+                }
+                for neighbour in neighbours(&node_at(i, j), world) {
+                    let (ki, kj) = lattice_index(&neighbour);
+                    let cost = self.cost(&neighbour);
+                    if status.get(ki, kj) == Some(Status::Valid) && cost.is_finite() {
+                        self.open_set.push(neighbour, cost);
+                    }
+                }
+            }
+        }
+        self.expand(world);
+    }
+}
+
+/// Flow fields of the most recently used goals.
+pub struct FlowFields {
+    /// Fields with the time they were last used.
+    fields: Vec<(u64, FlowField)>,
+    clock: u64,
+}
+
+impl FlowFields {
+    pub fn new() -> Self {
+        Self {
+            fields: Vec::with_capacity(MAX_FIELDS),
+            clock: 0,
+        }
+    }
+
+    /// Return the up-to-date field for the lattice node `goal`, computing it if needed.
+    pub fn get(&mut self, goal: &Pos, world: &World) -> &FlowField {
+        self.clock += 1;
+        let index = match self.fields.iter().position(|(_, f)| &f.goal == goal) {
+            Some(index) => index,
+            None => {
+                if self.fields.len() == MAX_FIELDS {
+                    let oldest = (0..self.fields.len())
+                        .min_by_key(|&i| self.fields[i].0)
+                        .unwrap();
+                    self.fields.swap_remove(oldest);
+                }
+                self.fields.push((self.clock, FlowField::new(goal, world)));
+                self.fields.len() - 1
+            }
+        };
+        let (last_used, field) = &mut self.fields[index];
+        *last_used = self.clock;
+        field.update(world);
+        field
+    }
+}
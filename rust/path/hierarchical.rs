@@ -0,0 +1,490 @@
+//! Hierarchical path finding (HPA*).
+//!
+//! See Botea, Müller, Schaeffer, "Near Optimal Hierarchical Path-Finding", 2004.
+//! The lattice is partitioned into square clusters.
+//! Neighbouring clusters are connected through entrances on their shared border
+//! and the entrances of each cluster are connected by edges whose costs are
+//! the distances within the cluster.
+//! Queries run A* on this small abstract graph and only refine the parts of the
+//! abstract path that are not in line of sight.
+//! When new obstacles appear, only the clusters containing them and
+//! the entrances on their borders are recomputed.
+
+use super::*;
+use crate::world::STEP_SIZE;
+use std::collections::{BTreeSet, HashMap, VecDeque};
+
+/// Side length of a cluster in lattice nodes.
+const CLUSTER_SIZE: usize = 16;
+/// Runs of free border nodes at least this long get an entrance at both ends
+/// instead of a single one in the middle.
+const MAX_ENTRANCE_WIDTH: usize = 6;
+
+/// Indices (i, j) of a lattice node.
+type Node = (usize, usize);
+
+fn node_of(pos: &Pos) -> Node {
+    (pos.x as usize / STEP_SIZE, pos.y as usize / STEP_SIZE)
+}
+
+fn pos_of(node: Node) -> Pos {
+    Pos::new(
+        (node.0 * STEP_SIZE + STEP_SIZE / 2) as Coord,
+        (node.1 * STEP_SIZE + STEP_SIZE / 2) as Coord,
+    )
+}
+
+fn cluster_of(node: Node) -> (usize, usize) {
+    (node.0 / CLUSTER_SIZE, node.1 / CLUSTER_SIZE)
+}
+
+fn heuristic(a: Node, b: Node) -> f64 {
+    (a.0.abs_diff(b.0) + a.1.abs_diff(b.1)) as f64 * STEP_SIZE as f64
+}
+
+fn edge_cost(n_steps: u32) -> f64 {
+    n_steps as f64 * STEP_SIZE as f64
+}
+
+#[derive(Default)]
+struct Cluster {
+    /// Pairs of (entrance in this cluster, entrance in a neighbouring cluster).
+    links: Vec<(Node, Node)>,
+    /// Entrance nodes of this cluster.
+    nodes: Vec<Node>,
+    /// Edges from the entrance nodes of this cluster to other entrances
+    /// in this cluster and in neighbouring clusters.
+    edges: HashMap<Node, Vec<(Node, f64)>>,
+}
+
+/// Breadth first search restricted to a single cluster.
+struct ClusterSearch {
+    corner: Node,
+    size: (usize, usize),
+    /// Maps local node index to the local index of the parent.
+    parents: Vec<usize>,
+    /// Number of steps from the start in local node index.
+    distances: Vec<u32>,
+}
+
+impl ClusterSearch {
+    fn index(&self, node: Node) -> Option<usize> {
+        let i = node.0.checked_sub(self.corner.0)?;
+        let j = node.1.checked_sub(self.corner.1)?;
+        if i < self.size.0 && j < self.size.1 {
+            Some(i * self.size.1 + j)
+        } else {
+            None
+        }
+    }
+
+    fn node(&self, index: usize) -> Node {
+        (
+            self.corner.0 + index / self.size.1,
+            self.corner.1 + index % self.size.1,
+        )
+    }
+
+    fn distance(&self, node: Node) -> Option<f64> {
+        let index = self.index(node)?;
+        match self.distances[index] {
+            u32::MAX => None,
+            d => Some(edge_cost(d)),
+        }
+    }
+
+    /// Return the nodes from the start of the search to `node`, both inclusive.
+    fn path_to(&self, node: Node) -> Option<Vec<Node>> {
+        let mut index = self.index(node)?;
+        if self.distances[index] == u32::MAX {
+            return None;
+        }
+        let mut path = Vec::with_capacity(self.distances[index] as usize + 1);
+        path.push(node);
+        while self.distances[index] != 0 {
+            index = self.parents[index];
+            path.push(self.node(index));
+        }
+        path.reverse();
+        Some(path)
+    }
+}
+
+pub struct Hierarchical {
+    n_clusters: (usize, usize),
+    clusters: Vec<Cluster>,
+    /// Entrances between neighbouring clusters as
+    /// (node in lower cluster, node in upper cluster).
+    /// Index 0 is the border to the next cluster in x, index 1 the border in y.
+    borders: Vec<[Vec<(Node, Node)>; 2]>,
+    /// Number of `World::blocked_nodes` that have been incorporated.
+    n_seen_blocked: usize,
+    built: bool,
+}
+
+impl Hierarchical {
+    pub fn new(world: &World) -> Self {
+        let (ni, nj) = world.lattice_shape();
+        let n_clusters = (
+            (ni + CLUSTER_SIZE - 1) / CLUSTER_SIZE,
+            (nj + CLUSTER_SIZE - 1) / CLUSTER_SIZE,
+        );
+        let n = n_clusters.0 * n_clusters.1;
+        Self {
+            n_clusters,
+            clusters: (0..n).map(|_| Cluster::default()).collect(),
+            borders: (0..n).map(|_| [Vec::new(), Vec::new()]).collect(),
+            n_seen_blocked: 0,
+            built: false,
+        }
+    }
+
+    fn cluster_id(&self, cluster: (usize, usize)) -> usize {
+        cluster.0 * self.n_clusters.1 + cluster.1
+    }
+
+    /// Return the lattice node ranges covered by a cluster.
+    fn bounds(
+        cluster: (usize, usize),
+        world: &World,
+    ) -> (std::ops::Range<usize>, std::ops::Range<usize>) {
+        let (ni, nj) = world.lattice_shape();
+        (
+            cluster.0 * CLUSTER_SIZE..((cluster.0 + 1) * CLUSTER_SIZE).min(ni),
+            cluster.1 * CLUSTER_SIZE..((cluster.1 + 1) * CLUSTER_SIZE).min(nj),
+        )
+    }
+
+    fn search_cluster(world: &World, cluster: (usize, usize), from: Node) -> ClusterSearch {
+        let (is, js) = Self::bounds(cluster, world);
+        let size = (is.len(), js.len());
+        let mut search = ClusterSearch {
+            corner: (is.start, js.start),
+            size,
+            parents: vec![usize::MAX; size.0 * size.1],
+            distances: vec![u32::MAX; size.0 * size.1],
+        };
+        let start = search.index(from).unwrap();
+        search.distances[start] = 0;
+
+        let mut queue = VecDeque::with_capacity(size.0 * size.1);
+        queue.push_back(start);
+        while let Some(current) = queue.pop_front() {
+            let (i, j) = (current / size.1, current % size.1);
+            for (ni, nj) in [
+                (i + 1, j),
+                (i.wrapping_sub(1), j),
+                (i, j + 1),
+                (i, j.wrapping_sub(1)),
+            ] {
+                if ni >= size.0 || nj >= size.1 {
+                    continue;
+                }
+                let neighbour = ni * size.1 + nj;
+                if search.distances[neighbour] != u32::MAX
+                    || !world.is_free_node(search.corner.0 + ni, search.corner.1 + nj)
+                {
+                    continue;
+                }
+                search.distances[neighbour] = search.distances[current] + 1;
+                search.parents[neighbour] = current;
+                queue.push_back(neighbour);
+            }
+        }
+        search
+    }
+
+    /// Find the entrances on the border between `cluster` and its next neighbour
+    /// along `axis`.
+    fn compute_border(
+        &self,
+        world: &World,
+        cluster: (usize, usize),
+        axis: usize,
+    ) -> Vec<(Node, Node)> {
+        let (ni, nj) = world.lattice_shape();
+        let (is, js) = Self::bounds(cluster, world);
+        let pairs: Vec<(Node, Node)> = if axis == 0 {
+            if is.end >= ni {
+                return Vec::new();
+            }
+            let i = is.end - 1;
+            js.map(|j| ((i, j), (i + 1, j))).collect()
+        } else {
+            if js.end >= nj {
+                return Vec::new();
+            }
+            let j = js.end - 1;
+            is.map(|i| ((i, j), (i, j + 1))).collect()
+        };
+
+        let mut entrances = Vec::new();
+        let mut run_start = None;
+        for (k, &(a, b)) in pairs.iter().enumerate() {
+            let free = world.is_free_node(a.0, a.1) && world.is_free_node(b.0, b.1);
+            match (free, run_start) {
+                (true, None) => run_start = Some(k),
+                (false, Some(start)) => {
+                    add_entrances(&pairs[start..k], &mut entrances);
+                    run_start = None;
+                }
+                _ => {}
+            }
+        }
+        if let Some(start) = run_start {
+            add_entrances(&pairs[start..], &mut entrances);
+        }
+        entrances
+    }
+
+    fn update_borders_of(&mut self, world: &World, cluster: (usize, usize)) {
+        let id = self.cluster_id(cluster);
+        self.borders[id] = [
+            self.compute_border(world, cluster, 0),
+            self.compute_border(world, cluster, 1),
+        ];
+        if cluster.0 > 0 {
+            let lower = (cluster.0 - 1, cluster.1);
+            let lower_id = self.cluster_id(lower);
+            self.borders[lower_id][0] = self.compute_border(world, lower, 0);
+        }
+        if cluster.1 > 0 {
+            let lower = (cluster.0, cluster.1 - 1);
+            let lower_id = self.cluster_id(lower);
+            self.borders[lower_id][1] = self.compute_border(world, lower, 1);
+        }
+    }
+
+    /// Recompute the abstract graph inside a cluster.
+    ///
+    /// If `interior_changed` is false, the edges are only recomputed
+    /// if the entrances have changed.
+    fn rebuild_cluster(&mut self, world: &World, cluster: (usize, usize), interior_changed: bool) {
+        let id = self.cluster_id(cluster);
+        let mut links: Vec<(Node, Node)> = self.borders[id].concat();
+        if cluster.0 > 0 {
+            let lower_id = self.cluster_id((cluster.0 - 1, cluster.1));
+            links.extend(self.borders[lower_id][0].iter().map(|&(a, b)| (b, a)));
+        }
+        if cluster.1 > 0 {
+            let lower_id = self.cluster_id((cluster.0, cluster.1 - 1));
+            links.extend(self.borders[lower_id][1].iter().map(|&(a, b)| (b, a)));
+        }
+        links.sort_unstable();
+        if !interior_changed && links == self.clusters[id].links {
+            return;
+        }
+
+        let mut nodes: Vec<Node> = links.iter().map(|&(a, _)| a).collect();
+        nodes.dedup(); // links are sorted
+
+        let mut edges: HashMap<Node, Vec<(Node, f64)>> = HashMap::with_capacity(nodes.len());
+        for &(a, b) in &links {
+            edges.entry(a).or_default().push((b, edge_cost(1)));
+        }
+        for &node in &nodes {
+            let search = Self::search_cluster(world, cluster, node);
+            for &other in &nodes {
+                if other == node {
+                    continue;
+                }
+                if let Some(distance) = search.distance(other) {
+                    edges.entry(node).or_default().push((other, distance));
+                }
+            }
+        }
+        self.clusters[id] = Cluster {
+            links,
+            nodes,
+            edges,
+        };
+    }
+
+    fn all_clusters(&self) -> impl Iterator<Item = (usize, usize)> {
+        let (nci, ncj) = self.n_clusters;
+        (0..nci).flat_map(move |ci| (0..ncj).map(move |cj| (ci, cj)))
+    }
+
+    fn build(&mut self, world: &World) {
+        self.n_seen_blocked = world.blocked_nodes().len();
+        let clusters: Vec<_> = self.all_clusters().collect();
+        for &cluster in &clusters {
+            let id = self.cluster_id(cluster);
+            self.borders[id] = [
+                self.compute_border(world, cluster, 0),
+                self.compute_border(world, cluster, 1),
+            ];
+        }
+        for &cluster in &clusters {
+            self.rebuild_cluster(world, cluster, true);
+        }
+        self.built = true;
+    }
+
+    /// Update the clusters that contain new obstacles and their neighbours.
+    fn incorporate_new_obstacles(&mut self, world: &World) {
+        let blocked = &world.blocked_nodes()[self.n_seen_blocked..];
+        self.n_seen_blocked += blocked.len();
+        let dirty: BTreeSet<(usize, usize)> =
+            blocked.iter().map(|pos| cluster_of(node_of(pos))).collect();
+        if dirty.is_empty() {
+            return;
+        }
+
+        let mut affected = BTreeSet::new();
+        for &cluster in &dirty {
+            self.update_borders_of(world, cluster);
+            affected.insert(cluster);
+            if cluster.0 > 0 {
+                affected.insert((cluster.0 - 1, cluster.1));
+            }
+            if cluster.1 > 0 {
+                affected.insert((cluster.0, cluster.1 - 1));
+            }
+            if cluster.0 + 1 < self.n_clusters.0 {
+                affected.insert((cluster.0 + 1, cluster.1));
+            }
+            if cluster.1 + 1 < self.n_clusters.1 {
+                affected.insert((cluster.0, cluster.1 + 1));
+            }
+        }
+        for cluster in affected {
+            self.rebuild_cluster(world, cluster, dirty.contains(&cluster));
+        }
+    }
+
+    fn edges_of(&self, node: Node) -> &[(Node, f64)] {
+        self.clusters[self.cluster_id(cluster_of(node))]
+            .edges
+            .get(&node)
+            .map(|edges| edges.as_slice())
+            .unwrap_or(&[])
+    }
+
+    /// Run A* on the abstract graph with start and target temporarily inserted.
+    fn find_abstract_path(&self, world: &World, start: Node, target: Node) -> Option<Vec<Node>> {
+        let start_cluster = cluster_of(start);
+        let target_cluster = cluster_of(target);
+        let from_start = Self::search_cluster(world, start_cluster, start);
+        let to_target = Self::search_cluster(world, target_cluster, target);
+
+        let mut start_edges: Vec<(Node, f64)> = self.clusters[self.cluster_id(start_cluster)]
+            .nodes
+            .iter()
+            .filter_map(|&node| from_start.distance(node).map(|d| (node, d)))
+            .collect();
+        if start_cluster == target_cluster {
+            if let Some(distance) = from_start.distance(target) {
+                start_edges.push((target, distance));
+            }
+        }
+        let target_edges: HashMap<Node, f64> = self.clusters[self.cluster_id(target_cluster)]
+            .nodes
+            .iter()
+            .filter_map(|&node| to_target.distance(node).map(|d| (node, d)))
+            .collect();
+
+        let mut open_set = PriorityQueue::with_capacity(256);
+        let mut costs = HashMap::from([(start, 0.0)]);
+        let mut parents = HashMap::new();
+        open_set.push(start, heuristic(start, target));
+        while let Some(current) = open_set.pop() {
+            if current == target {
+                break;
+            }
+            let cost = costs[&current];
+            let mut edges = self.edges_of(current).to_vec();
+            if current == start {
+                edges.extend_from_slice(&start_edges);
+            }
+            if let Some(&distance) = target_edges.get(&current) {
+                edges.push((target, distance));
+            }
+            for (next, edge) in edges {
+                let new_cost = cost + edge;
+                if new_cost < *costs.get(&next).unwrap_or(&f64::INFINITY) {
+                    costs.insert(next, new_cost);
+                    parents.insert(next, current);
+                    open_set.push(next, new_cost + heuristic(next, target));
+                }
+            }
+        }
+
+        if start != target && !parents.contains_key(&target) {
+            return None;
+        }
+        let mut path = vec![target];
+        let mut current = target;
+        while current != start {
+            current = parents[&current];
+            path.push(current);
+        }
+        path.reverse();
+        Some(path)
+    }
+
+    /// Turn an abstract path into a lattice path.
+    /// Only segments that are not in line of sight are searched for.
+    fn refine(world: &World, abstract_path: &[Node]) -> Vec<Pos> {
+        let mut nodes = Vec::with_capacity(abstract_path.len() * 2);
+        nodes.push(pos_of(abstract_path[0]));
+        for window in abstract_path.windows(2) {
+            let (a, b) = (window[0], window[1]);
+            if !bresenham::path_is_blocked(&pos_of(a), &pos_of(b), world) {
+                nodes.push(pos_of(b));
+                continue;
+            }
+            // a and b are in the same cluster unless they are direct neighbours.
+            let search = Self::search_cluster(world, cluster_of(a), a);
+            match search.path_to(b) {
+                Some(segment) => nodes.extend(segment.into_iter().skip(1).map(pos_of)),
+                None => nodes.push(pos_of(b)),
+            }
+        }
+        nodes
+    }
+}
+
+fn add_entrances(run: &[(Node, Node)], entrances: &mut Vec<(Node, Node)>) {
+    if run.len() < MAX_ENTRANCE_WIDTH {
+        entrances.push(run[run.len() / 2]);
+    } else {
+        entrances.push(run[0]);
+        entrances.push(run[run.len() - 1]);
+    }
+}
+
+impl Pathfinder for Hierarchical {
+    fn config(&self) -> PathfinderConfig {
+        PathfinderConfig::four_connected("hierarchical")
+    }
+
+    fn find_path(
+        &mut self,
+        start: &Pos,
+        target: &Pos,
+        world: &World,
+    ) -> PyResult<Option<Vec<WorldPos>>> {
+        if world.is_obstacle_or_out(target.into_pos()) {
+            return Err(PyValueError::new_err(format!(
+                "Target is not accessible: {target}"
+            )));
+        }
+
+        if self.built {
+            self.incorporate_new_obstacles(world);
+        } else {
+            self.build(world);
+        }
+
+        match self.find_abstract_path(world, node_of(start), node_of(target)) {
+            Some(abstract_path) => Ok(Some(smooth_path(
+                &Self::refine(world, &abstract_path),
+                world,
+            ))),
+            None => Err(PyRuntimeError::new_err(format!(
+                "Failed to find path from {start} to {target}."
+            ))),
+        }
+    }
+}
@@ -0,0 +1,208 @@
+//! Jump Point Search on the lattice.
+//!
+//! See Harabor, Grastien, "Online Graph Pruning for Pathfinding on Grid Maps", AAAI 2011.
+//! Without diagonal moves, a straight run only stops at the target,
+//! next to the end of a wall on its side, or, when running vertically,
+//! at nodes from which a horizontal run finds such a node.
+//! Only those jump points enter the open set, so open areas are scanned
+//! without any heap operations.
+//! The resulting lattice path is smoothed into an any-angle path.
+
+use super::buffers::SearchBuffers;
+use super::theta_star::check_query;
+use super::*;
+use crate::pos_map::PosMap;
+
+const STEP: Coord = STEP_SIZE as Coord;
+
+/// Flags in `SearchBuffers::runs` for runs in +x and -x.
+/// (result is known, run finds a jump point)
+const RUN_RIGHT: (u8, u8) = (1, 2);
+const RUN_LEFT: (u8, u8) = (4, 8);
+
+/// The search state lives in buffers from the pool of the world.
+pub struct JumpPointSearch {
+    counters: SearchCounters,
+}
+
+impl JumpPointSearch {
+    pub fn new(_world: &World) -> Self {
+        Self {
+            counters: SearchCounters::default(),
+        }
+    }
+
+    fn is_free(x: Coord, y: Coord, world: &World) -> bool {
+        x >= 0 && y >= 0 && world.is_free_node(x as usize / STEP_SIZE, y as usize / STEP_SIZE)
+    }
+
+    /// Directions to continue in from a jump point that was reached from `parent`.
+    fn directions(node: &Pos, parent: Option<Pos>) -> &'static [(Coord, Coord)] {
+        let parent = match parent {
+            None => return &[(STEP, 0), (-STEP, 0), (0, STEP), (0, -STEP)],
+            Some(parent) => parent,
+        };
+        match ((node.x - parent.x).signum(), (node.y - parent.y).signum()) {
+            (1, _) => &[(0, -STEP), (0, STEP), (STEP, 0)],
+            (-1, _) => &[(0, -STEP), (0, STEP), (-STEP, 0)],
+            (_, 1) => &[(-STEP, 0), (STEP, 0), (0, STEP)],
+            _ => &[(-STEP, 0), (STEP, 0), (0, -STEP)],
+        }
+    }
+
+    /// Run from `from` in direction (dx, dy) until the next jump point.
+    fn jump(
+        from: &Pos,
+        (dx, dy): (Coord, Coord),
+        target: &Pos,
+        world: &World,
+        runs: &mut PosMap<u8>,
+    ) -> Option<Pos> {
+        let free = |x, y| Self::is_free(x, y, world);
+        let mut node = *from;
+        loop {
+            node = Pos::new(node.x + dx, node.y + dy);
+            let (x, y) = (node.x, node.y);
+            if !free(x, y) {
+                return None;
+            }
+            if &node == target {
+                return Some(node);
+            }
+            if dx != 0 {
+                if (free(x, y - STEP) && !free(x - dx, y - STEP))
+                    || (free(x, y + STEP) && !free(x - dx, y + STEP))
+                {
+                    return Some(node);
+                }
+            } else {
+                if (free(x - STEP, y) && !free(x - STEP, y - dy))
+                    || (free(x + STEP, y) && !free(x + STEP, y - dy))
+                {
+                    return Some(node);
+                }
+                if Self::run_finds_jump_point(&node, STEP, target, world, runs)
+                    || Self::run_finds_jump_point(&node, -STEP, target, world, runs)
+                {
+                    return Some(node);
+                }
+            }
+        }
+    }
+
+    /// Return true if a horizontal run from `from` in direction `dx` ends at a jump point.
+    ///
+    /// Vertical runs ask this at every node, so the result is stored for all nodes
+    /// of the run, which all end at the same jump point or wall.
+    /// This way, every node is scanned at most once per direction and query.
+    fn run_finds_jump_point(
+        from: &Pos,
+        dx: Coord,
+        target: &Pos,
+        world: &World,
+        runs: &mut PosMap<u8>,
+    ) -> bool {
+        let (known, found) = if dx > 0 { RUN_RIGHT } else { RUN_LEFT };
+        let flags = runs.get_unchecked(from);
+        if flags & known != 0 {
+            return flags & found != 0;
+        }
+
+        let end = Self::jump(from, (dx, 0), target, world, runs);
+        let result = if end.is_some() { known | found } else { known };
+        let mut node = *from;
+        while Some(node) != end && Self::is_free(node.x, node.y, world) {
+            runs.set(&node, runs.get_unchecked(&node) | result);
+            node.x += dx;
+        }
+        end.is_some()
+    }
+
+    /// Return all lattice nodes from start to target.
+    fn reconstruct_nodes(buffers: &SearchBuffers, start: &Pos, target: &Pos) -> Vec<Pos> {
+        let mut nodes = Vec::with_capacity(128);
+        let mut current = *target;
+        while &current != start {
+            let parent = buffers.parents.get_unchecked(&current);
+            // Jump points are connected by straight runs.
+            let step = Pos::new(
+                (parent.x - current.x).signum() * STEP,
+                (parent.y - current.y).signum() * STEP,
+            )
+            .coords;
+            while current != parent {
+                nodes.push(current);
+                current += step;
+            }
+        }
+        nodes.push(*start);
+        nodes.reverse();
+        nodes
+    }
+}
+
+impl Pathfinder for JumpPointSearch {
+    fn config(&self) -> PathfinderConfig {
+        PathfinderConfig::four_connected("jps")
+    }
+
+    fn find_path(
+        &mut self,
+        start: &Pos,
+        target: &Pos,
+        world: &World,
+    ) -> PyResult<Option<Vec<WorldPos>>> {
+        check_query(start, target, world)?;
+
+        let nj = world.lattice_shape().1;
+        let mut pooled = world.search_buffers();
+        let buffers = &mut *pooled;
+        buffers.costs.set(start, 0.0);
+        buffers
+            .open_set
+            .push_or_decrease(lattice_key(start, nj), 0.0);
+        self.counters.count_push();
+
+        while let Some((key, _)) = buffers.open_set.pop() {
+            let current = lattice_node(key, nj);
+            self.counters.count_expanded();
+            if target == &current {
+                break;
+            }
+
+            let cost = buffers.costs.get_unchecked(&current);
+            let parent = buffers.parents.get_if_set(&current).copied();
+            for &direction in Self::directions(&current, parent) {
+                let jump_point =
+                    match Self::jump(&current, direction, target, world, &mut buffers.runs) {
+                        Some(jump_point) => jump_point,
+                        None => continue,
+                    };
+                let new_cost = cost + manhattan_distance(&current, &jump_point) as f64;
+                if new_cost < buffers.costs.get_unchecked(&jump_point) {
+                    buffers.costs.set(&jump_point, new_cost);
+                    buffers.parents.set(&jump_point, current);
+                    let expected_cost = new_cost + manhattan_distance(&jump_point, target) as f64;
+                    if buffers
+                        .open_set
+                        .push_or_decrease(lattice_key(&jump_point, nj), expected_cost)
+                    {
+                        self.counters.count_push();
+                    }
+                }
+            }
+        }
+
+        if start != target && !buffers.parents.is_set(target) {
+            return Err(PyRuntimeError::new_err(format!(
+                "Failed to find path from {start} to {target}."
+            )));
+        }
+        let nodes = Self::reconstruct_nodes(buffers, start, target);
+        Ok(Some(smooth_path(&nodes, world)))
+    }
+
+    fn counters(&self) -> Option<SearchCounters> {
+        self.counters.report()
+    }
+}
@@ -0,0 +1,60 @@
+//! Path costs from one start to many targets with a single search.
+
+use super::*;
+use std::collections::{HashMap, HashSet};
+
+/// Return the any-angle path cost from `start` to each of `targets`.
+///
+/// All positions must be nodes of the lattice.
+/// Runs Dijkstra's algorithm with the parent rule of Theta* from `start`
+/// until all targets are settled or the cost exceeds `max_cost`.
+/// The search only touches the part of the map that is closer than
+/// the farthest target, so the maps are hash maps instead of dense grids.
+/// Targets that are unreachable or cost more than `max_cost` get infinity.
+/// The search does not run at all if all targets are in other components than `start`.
+pub fn path_costs(start: &Pos, targets: &[Pos], max_cost: f64, world: &World) -> Vec<f64> {
+    let mut pending: HashSet<Pos> = targets
+        .iter()
+        .filter(|t| !world.is_obstacle_or_out(t.into_pos()) && !world.is_disconnected(start, t))
+        .copied()
+        .collect();
+    // node -> (cost, parent)
+    let mut nodes: HashMap<Pos, (f64, Pos)> = HashMap::from([(*start, (0.0, *start))]);
+    let mut open_set = PriorityQueue::with_capacity(2 << 8);
+    open_set.push(*start, 0.0);
+
+    while let Some((current, cost)) = open_set.pop_with_cost() {
+        if pending.is_empty() || cost > max_cost {
+            break;
+        }
+        let (best, parent) = nodes[&current];
+        if cost > best {
+            continue; // outdated entry
+        }
+        pending.remove(&current);
+
+        for neighbour in world
+            .free_neighbours_of(&current.into_pos())
+            .map(|n| Pos::new(n.x as Coord, n.y as Coord))
+        {
+            let source = if bresenham::path_is_blocked(&parent, &neighbour, world) {
+                current
+            } else {
+                parent
+            };
+            let new_cost = nodes[&source].0 + euclidean_distance(&source, &neighbour);
+            if nodes.get(&neighbour).map_or(true, |&(c, _)| new_cost < c) {
+                nodes.insert(neighbour, (new_cost, source));
+                open_set.push(neighbour, new_cost);
+            }
+        }
+    }
+
+    targets
+        .iter()
+        .map(|target| match nodes.get(target) {
+            Some(&(cost, _)) if cost <= max_cost && !pending.contains(target) => cost,
+            _ => f64::INFINITY,
+        })
+        .collect()
+}
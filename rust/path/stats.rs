@@ -0,0 +1,228 @@
+//! Statistics about the searches of a path.
+
+use super::*;
+use std::time::Duration;
+
+/// Work done by all searches of a pathfinder so far.
+///
+/// Counting is compiled in with the `search-stats` feature, which is on by default.
+/// Without it, the `count_*` methods do nothing and pathfinders report no counters,
+/// so the searches do no extra work.
+/// Compare `cargo bench --no-default-features --bench native` with and without
+/// `--features search-stats` to measure the overhead.
+#[derive(Clone, Copy, Default)]
+pub struct SearchCounters {
+    pub expanded: u64,
+    /// Outdated entries that were popped from the open set.
+    pub stale_pops: u64,
+    pub pushes: u64,
+    pub los_checks: u64,
+}
+
+impl SearchCounters {
+    /// True if counting is compiled in.
+    pub const ENABLED: bool = cfg!(feature = "search-stats");
+
+    #[inline(always)]
+    pub fn count_expanded(&mut self) {
+        if Self::ENABLED {
+            self.expanded += 1;
+        }
+    }
+
+    #[inline(always)]
+    pub fn count_stale_pop(&mut self) {
+        if Self::ENABLED {
+            self.stale_pops += 1;
+        }
+    }
+
+    #[inline(always)]
+    pub fn count_push(&mut self) {
+        if Self::ENABLED {
+            self.pushes += 1;
+        }
+    }
+
+    #[inline(always)]
+    pub fn count_los_check(&mut self) {
+        if Self::ENABLED {
+            self.los_checks += 1;
+        }
+    }
+
+    /// Return the counters for `Pathfinder::counters`, None if counting is disabled.
+    pub fn report(&self) -> Option<Self> {
+        Self::ENABLED.then_some(*self)
+    }
+
+    pub fn add(&mut self, other: &Self) {
+        self.expanded += other.expanded;
+        self.stale_pops += other.stale_pops;
+        self.pushes += other.pushes;
+        self.los_checks += other.los_checks;
+    }
+
+    /// Return the work done since `earlier`.
+    fn since(&self, earlier: &Self) -> Self {
+        Self {
+            expanded: self.expanded - earlier.expanded,
+            stale_pops: self.stale_pops - earlier.stale_pops,
+            pushes: self.pushes - earlier.pushes,
+            los_checks: self.los_checks - earlier.los_checks,
+        }
+    }
+}
+
+/// Statistics about searches for paths.
+///
+/// The counts of work are None if the engine does not count them or the
+/// extension was built without the `search-stats` feature.
+/// Queries that are answered by the path cache or a flow field count as
+/// searches but do not expand any nodes.
+#[pyclass]
+#[derive(Clone, Default)]
+pub struct SearchStats {
+    #[pyo3(get)]
+    pub queries: u64,
+    /// Number of queries that did not find a path.
+    #[pyo3(get)]
+    pub failed: u64,
+    /// Number of queries that found a partial path because they ran out
+    /// of budget or the target is unreachable.
+    #[pyo3(get)]
+    pub partial: u64,
+    #[pyo3(get)]
+    pub nodes_expanded: Option<u64>,
+    #[pyo3(get)]
+    pub stale_pops: Option<u64>,
+    #[pyo3(get)]
+    pub heap_pushes: Option<u64>,
+    #[pyo3(get)]
+    pub los_checks: Option<u64>,
+    /// Total length of the paths that were found in pixels.
+    #[pyo3(get)]
+    pub path_length: f64,
+    /// Total wall time spent in searches in seconds.
+    #[pyo3(get)]
+    pub time: f64,
+}
+
+impl SearchStats {
+    /// Statistics of a single query from `start` that found `path`, if any.
+    pub fn of_query(
+        counters: Option<SearchCounters>,
+        start: &WorldPos,
+        path: Option<&[WorldPos]>,
+        elapsed: Duration,
+    ) -> Self {
+        Self {
+            queries: 1,
+            failed: path.is_none() as u64,
+            partial: 0,
+            nodes_expanded: counters.map(|c| c.expanded),
+            stale_pops: counters.map(|c| c.stale_pops),
+            heap_pushes: counters.map(|c| c.pushes),
+            los_checks: counters.map(|c| c.los_checks),
+            path_length: path.map_or(0.0, |path| path_length(start, path)),
+            time: elapsed.as_secs_f64(),
+        }
+    }
+
+    pub fn add(&mut self, other: &Self) {
+        self.queries += other.queries;
+        self.failed += other.failed;
+        self.partial += other.partial;
+        self.nodes_expanded = add_counts(self.nodes_expanded, other.nodes_expanded);
+        self.stale_pops = add_counts(self.stale_pops, other.stale_pops);
+        self.heap_pushes = add_counts(self.heap_pushes, other.heap_pushes);
+        self.los_checks = add_counts(self.los_checks, other.los_checks);
+        self.path_length += other.path_length;
+        self.time += other.time;
+    }
+}
+
+#[pymethods]
+impl SearchStats {
+    fn __repr__(&self) -> String {
+        let count = |c: Option<u64>| c.map_or("None".to_string(), |c| c.to_string());
+        format!(
+            "SearchStats(queries={}, failed={}, partial={}, nodes_expanded={}, stale_pops={}, \
+             heap_pushes={}, los_checks={}, path_length={:.1}, time={:.6})",
+            self.queries,
+            self.failed,
+            self.partial,
+            count(self.nodes_expanded),
+            count(self.stale_pops),
+            count(self.heap_pushes),
+            count(self.los_checks),
+            self.path_length,
+            self.time
+        )
+    }
+}
+
+fn add_counts(a: Option<u64>, b: Option<u64>) -> Option<u64> {
+    match (a, b) {
+        (Some(a), Some(b)) => Some(a + b),
+        (a, None) => a,
+        (None, b) => b,
+    }
+}
+
+/// Length of a path in reverse order that does not contain `start`.
+fn path_length(start: &WorldPos, path: &[WorldPos]) -> f64 {
+    use nalgebra::Norm;
+    let mut previous = start;
+    let mut length = 0.0;
+    for waypoint in path.iter().rev() {
+        length += na::EuclideanNorm {}.norm(&(waypoint - previous));
+        previous = waypoint;
+    }
+    length
+}
+
+/// Run `plan` and measure it.
+pub fn plan_with_stats(
+    pathfinder: &mut dyn Pathfinder,
+    start: &WorldPos,
+    target: &WorldPos,
+    world: &World,
+) -> (PyResult<Planned>, SearchStats) {
+    let before = pathfinder.counters();
+    let begin = Instant::now();
+    let result = plan(pathfinder, start, target, world);
+    let elapsed = begin.elapsed();
+    let counters = pathfinder
+        .counters()
+        .zip(before)
+        .map(|(after, before)| after.since(&before));
+    let path = result.as_ref().ok().and_then(|(path, _)| path.as_deref());
+    let mut stats = SearchStats::of_query(counters, start, path, elapsed);
+    if let Ok((_, status)) = &result {
+        stats.partial = (*status != PathStatus::Complete) as u64;
+    }
+    (result, stats)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn path_length_includes_start() {
+        let path = [WorldPos::new(3.0, 4.0), WorldPos::new(0.0, 4.0)];
+        assert_eq!(path_length(&WorldPos::new(0.0, 0.0), &path), 7.0);
+    }
+
+    #[test]
+    fn add_keeps_counts_of_engines_that_count() {
+        let mut stats = SearchStats {
+            nodes_expanded: Some(3),
+            ..Default::default()
+        };
+        stats.add(&SearchStats::default());
+        assert_eq!(stats.nodes_expanded, Some(3));
+        assert_eq!(SearchStats::default().nodes_expanded, None);
+    }
+}
@@ -0,0 +1,200 @@
+use crate::path::PathfinderConfig;
+use crate::pos::*;
+use std::collections::HashMap;
+
+#[derive(Clone, Copy, PartialEq, Eq, Hash)]
+struct Key {
+    /// Pathfinders with other configurations find other paths.
+    config: PathfinderConfig,
+    start: (Coord, Coord),
+    target: (Coord, Coord),
+    /// Version of the world that the path was computed on.
+    version: u64,
+}
+
+struct Entry {
+    path: Vec<WorldPos>,
+    last_used: u64,
+}
+
+/// Least recently used cache of paths between lattice nodes.
+///
+/// Entries of old world versions are never hit again and get evicted
+/// like any other unused entry.
+pub struct PathCache {
+    entries: HashMap<Key, Entry>,
+    capacity: usize,
+    /// Incremented on every access, used to find the least recently used entry.
+    clock: u64,
+    pub hits: u64,
+    pub misses: u64,
+    pub evictions: u64,
+}
+
+impl PathCache {
+    pub fn new(capacity: usize) -> Self {
+        Self {
+            entries: HashMap::with_capacity(capacity + 1),
+            capacity,
+            clock: 0,
+            hits: 0,
+            misses: 0,
+            evictions: 0,
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.entries.len()
+    }
+
+    pub fn capacity(&self) -> usize {
+        self.capacity
+    }
+
+    pub fn get(
+        &mut self,
+        config: &PathfinderConfig,
+        start: &Pos,
+        target: &Pos,
+        version: u64,
+    ) -> Option<Vec<WorldPos>> {
+        self.clock += 1;
+        match self
+            .entries
+            .get_mut(&make_key(config, start, target, version))
+        {
+            Some(entry) => {
+                self.hits += 1;
+                entry.last_used = self.clock;
+                Some(entry.path.clone())
+            }
+            None => {
+                self.misses += 1;
+                None
+            }
+        }
+    }
+
+    pub fn insert(
+        &mut self,
+        config: &PathfinderConfig,
+        start: &Pos,
+        target: &Pos,
+        version: u64,
+        path: Vec<WorldPos>,
+    ) {
+        if self.capacity == 0 {
+            return;
+        }
+        self.clock += 1;
+        self.entries.insert(
+            make_key(config, start, target, version),
+            Entry {
+                path,
+                last_used: self.clock,
+            },
+        );
+        if self.entries.len() > self.capacity {
+            self.evict_least_recently_used();
+        }
+    }
+
+    pub fn clear(&mut self) {
+        self.entries.clear();
+    }
+
+    fn evict_least_recently_used(&mut self) {
+        if let Some(key) = self
+            .entries
+            .iter()
+            .min_by_key(|(_, entry)| entry.last_used)
+            .map(|(key, _)| *key)
+        {
+            self.entries.remove(&key);
+            self.evictions += 1;
+        }
+    }
+}
+
+fn make_key(config: &PathfinderConfig, start: &Pos, target: &Pos, version: u64) -> Key {
+    Key {
+        config: *config,
+        start: (start.x, start.y),
+        target: (target.x, target.y),
+        version,
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::world::Neighbourhood;
+
+    const CONFIG: PathfinderConfig = PathfinderConfig {
+        engine: "theta_star",
+        neighbourhood: Neighbourhood::FOUR,
+    };
+
+    fn path() -> Vec<WorldPos> {
+        vec![WorldPos::new(1.0, 2.0), WorldPos::new(3.0, 4.0)]
+    }
+
+    #[test]
+    fn get_returns_inserted_path() {
+        let mut cache = PathCache::new(4);
+        cache.insert(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0, path());
+        assert_eq!(
+            cache.get(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0),
+            Some(path())
+        );
+        assert_eq!(cache.hits, 1);
+        assert_eq!(cache.misses, 0);
+    }
+
+    #[test]
+    fn get_misses_other_version() {
+        let mut cache = PathCache::new(4);
+        cache.insert(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0, path());
+        assert_eq!(
+            cache.get(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 1),
+            None
+        );
+        assert_eq!(cache.misses, 1);
+    }
+
+    #[test]
+    fn get_misses_other_config() {
+        let mut cache = PathCache::new(4);
+        cache.insert(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0, path());
+        let other = PathfinderConfig {
+            engine: "jps",
+            ..CONFIG
+        };
+        assert_eq!(cache.get(&other, &Pos::new(2, 2), &Pos::new(6, 2), 0), None);
+        let other = PathfinderConfig {
+            neighbourhood: Neighbourhood {
+                diagonal: true,
+                stride: 1,
+            },
+            ..CONFIG
+        };
+        assert_eq!(cache.get(&other, &Pos::new(2, 2), &Pos::new(6, 2), 0), None);
+    }
+
+    #[test]
+    fn insert_evicts_least_recently_used() {
+        let mut cache = PathCache::new(2);
+        cache.insert(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0, path());
+        cache.insert(&CONFIG, &Pos::new(2, 6), &Pos::new(6, 2), 0, path());
+        cache.get(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0);
+        cache.insert(&CONFIG, &Pos::new(6, 6), &Pos::new(6, 2), 0, path());
+        assert_eq!(cache.len(), 2);
+        assert_eq!(cache.evictions, 1);
+        assert!(cache
+            .get(&CONFIG, &Pos::new(2, 2), &Pos::new(6, 2), 0)
+            .is_some());
+        assert!(cache
+            .get(&CONFIG, &Pos::new(2, 6), &Pos::new(6, 2), 0)
+            .is_none());
+    }
+}
@@ -1,55 +1,117 @@
 use crate::pos::*;
+use crate::world::STEP_SIZE;
 use ndarray::Array2;
 
+/// Dense map from nodes of the lattice to values with a constant time `clear`.
+///
+/// Has one element per lattice node, i.e., one per `STEP_SIZE`x`STEP_SIZE`
+/// pixels, and must only be used with lattice nodes.
+///
+/// Every element is stamped with the generation it was last set in.
+/// `clear` only starts a new generation, elements of older generations
+/// read as `init`.
 pub struct PosMap<T> {
-    data: Array2<T>,
+    /// (generation, value)
+    data: Array2<(u32, T)>,
     init: T,
+    generation: u32,
 }
 
 impl<T> PosMap<T>
 where
     T: Copy + PartialEq,
 {
+    /// `shape` is the number of lattice nodes, see `World::lattice_shape`.
     pub fn new(shape: (usize, usize), init: T) -> Self {
         Self {
-            data: Array2::from_elem(shape, init),
+            data: Array2::from_elem(shape, (0, init)),
             init,
+            generation: 1,
         }
     }
 
     pub fn get(&self, pos: &Pos) -> Option<&T> {
-        self.data.get(Self::pos_to_key(pos))
+        self.data
+            .get(Self::pos_to_key(pos))
+            .map(|entry| self.current(entry))
     }
 
     pub fn get_if_set(&self, pos: &Pos) -> Option<&T> {
-        self.data
-            .get(Self::pos_to_key(pos))
+        self.get(pos)
             .and_then(|x| if x == &self.init { None } else { Some(x) })
     }
 
     pub fn get_or(&self, pos: &Pos, default: &T) -> T {
-        *self.data.get(Self::pos_to_key(pos)).unwrap_or(default)
+        *self.get(pos).unwrap_or(default)
     }
 
     pub fn get_unchecked(&self, pos: &Pos) -> T {
-        self.data[Self::pos_to_key(pos)]
+        *self.current(&self.data[Self::pos_to_key(pos)])
     }
 
     pub fn set(&mut self, pos: &Pos, value: T) {
-        self.data[Self::pos_to_key(pos)] = value;
+        self.data[Self::pos_to_key(pos)] = (self.generation, value);
     }
 
     pub fn is_set(&self, pos: &Pos) -> bool {
-        self.data
-            .get(Self::pos_to_key(pos))
-            .map_or(false, |&x| x != self.init)
+        self.get(pos).map_or(false, |&x| x != self.init)
     }
 
     pub fn clear(&mut self) {
-        self.data.fill(self.init);
+        if self.generation == u32::MAX {
+            // Only happens after billions of clears.
+            self.data.fill((0, self.init));
+            self.generation = 0;
+        }
+        self.generation += 1;
+    }
+
+    #[inline]
+    fn current<'a>(&'a self, entry: &'a (u32, T)) -> &'a T {
+        if entry.0 == self.generation {
+            &entry.1
+        } else {
+            &self.init
+        }
     }
 
     fn pos_to_key(pos: &Pos) -> (usize, usize) {
-        (pos.x as usize, pos.y as usize)
+        (pos.x as usize / STEP_SIZE, pos.y as usize / STEP_SIZE)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn get_returns_set_value() {
+        let mut map = PosMap::new((4, 3), -1);
+        map.set(&Pos::new(10, 6), 5);
+        assert_eq!(map.get(&Pos::new(10, 6)), Some(&5));
+        assert_eq!(map.get(&Pos::new(6, 6)), Some(&-1));
+        assert_eq!(map.get(&Pos::new(18, 6)), None);
+    }
+
+    #[test]
+    fn clear_resets_to_init() {
+        let mut map = PosMap::new((4, 3), -1);
+        map.set(&Pos::new(10, 6), 5);
+        map.clear();
+        assert_eq!(map.get_unchecked(&Pos::new(10, 6)), -1);
+        assert!(!map.is_set(&Pos::new(10, 6)));
+        map.set(&Pos::new(2, 10), 3);
+        assert_eq!(map.get_if_set(&Pos::new(2, 10)), Some(&3));
+    }
+
+    #[test]
+    fn clear_works_after_generation_overflow() {
+        let mut map = PosMap::new((4, 3), -1);
+        map.generation = u32::MAX;
+        map.set(&Pos::new(10, 6), 5);
+        map.clear();
+        assert_eq!(map.get_unchecked(&Pos::new(10, 6)), -1);
+        map.set(&Pos::new(6, 6), 4);
+        assert_eq!(map.get_unchecked(&Pos::new(6, 6)), 4);
     }
 }
@@ -5,9 +5,12 @@ use std::collections::BinaryHeap;
  * Priority queue that uses costs instead of priorities.
  * The cost may be floating point in which case the queue pretends that
  * NaN's don't exist. If a cost is NaN, the behaviour is undefined.
+ * Of elements with equal costs, the most recently pushed is popped first.
  */
 pub struct PriorityQueue<T, C> {
     heap: BinaryHeap<PriorityQueueNode<T, C>>,
+    /// Number of elements pushed so far, used to break ties.
+    n_pushed: u64,
 }
 
 impl<T, C> PriorityQueue<T, C>
@@ -18,12 +21,14 @@ where
     pub fn new() -> Self {
         Self {
             heap: BinaryHeap::new(),
+            n_pushed: 0,
         }
     }
 
     pub fn with_capacity(capacity: usize) -> Self {
         Self {
             heap: BinaryHeap::with_capacity(capacity),
+            n_pushed: 0,
         }
     }
 
@@ -32,29 +37,54 @@ where
     }
 
     pub fn push(&mut self, value: T, cost: C) {
-        self.heap.push(PriorityQueueNode { value, cost });
+        self.n_pushed += 1;
+        self.heap.push(PriorityQueueNode {
+            value,
+            cost,
+            order: self.n_pushed,
+        });
     }
 
     pub fn pop(&mut self) -> Option<T> {
         self.heap.pop().map(|node| node.value)
     }
 
+    pub fn pop_with_cost(&mut self) -> Option<(T, C)> {
+        self.heap.pop().map(|node| (node.value, node.cost))
+    }
+
+    /// Return the lowest cost in the queue without removing the element.
+    pub fn peek_cost(&self) -> Option<C> {
+        self.heap.peek().map(|node| node.cost)
+    }
+
     pub fn clear(&mut self) {
         self.heap.clear();
     }
 }
 
-#[derive(PartialEq)]
 struct PriorityQueueNode<T, C> {
     cost: C,
     value: T,
+    /// Position in the order of pushes, unique within a queue.
+    order: u64,
+}
+
+impl<T, C> PartialEq for PriorityQueueNode<T, C>
+where
+    T: PartialEq,
+    C: PartialEq + PartialOrd + Copy,
+{
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
 }
 
 // Ignore the possibility of NaN's.
 impl<T, C> Eq for PriorityQueueNode<T, C>
 where
     T: PartialEq,
-    C: PartialEq + PartialOrd,
+    C: PartialEq + PartialOrd + Copy,
 {
 }
 
@@ -76,16 +106,137 @@ where
     fn cmp(&self, other: &Self) -> Ordering {
         // Compare self and other in reverse order to produce a min-heap.
         //
-        // Break ties in cost by comparing values.
-        // Since values cannot be ordered, only compare for equality
-        // and assume that the other's cost is greater to prefer self over other.
-        compare_cost(other.cost, self.cost).then_with(|| {
-            if self.value == other.value {
-                Ordering::Equal
-            } else {
-                Ordering::Greater
+        // Break ties in cost by preferring the node that was pushed last.
+        // This is a total order because `order` is unique.
+        compare_cost(other.cost, self.cost).then_with(|| self.order.cmp(&other.order))
+    }
+}
+
+/// Min-heap of keys in `0..n_keys` that supports lowering the cost of a key.
+///
+/// Unlike `PriorityQueue`, every key is in the queue at most once,
+/// so searches never pop outdated entries.
+/// Uses a 4-ary heap, which is shallower than a binary heap
+/// and compares children that are next to each other in memory.
+/// Like `PriorityQueue`, the behaviour is undefined if a cost is NaN.
+pub struct IndexedPriorityQueue<C> {
+    /// (cost, key)
+    heap: Vec<(C, usize)>,
+    /// Index of each key in `heap` or `ABSENT`.
+    positions: Vec<usize>,
+}
+
+const ARITY: usize = 4;
+const ABSENT: usize = usize::MAX;
+
+impl<C> IndexedPriorityQueue<C>
+where
+    C: PartialOrd + Copy,
+{
+    pub fn new(n_keys: usize) -> Self {
+        Self {
+            heap: Vec::with_capacity(n_keys.min(2 << 11)),
+            positions: vec![ABSENT; n_keys],
+        }
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.heap.is_empty()
+    }
+
+    pub fn len(&self) -> usize {
+        self.heap.len()
+    }
+
+    pub fn contains(&self, key: usize) -> bool {
+        self.positions[key] != ABSENT
+    }
+
+    /// Return the lowest cost in the queue without removing its key.
+    pub fn peek_cost(&self) -> Option<C> {
+        self.heap.first().map(|&(cost, _)| cost)
+    }
+
+    /// Insert `key` or lower its cost if it is already in the queue.
+    ///
+    /// Does nothing if `key` is in the queue with a lower or equal cost.
+    /// Returns true if the queue has changed.
+    pub fn push_or_decrease(&mut self, key: usize, cost: C) -> bool {
+        match self.positions[key] {
+            ABSENT => {
+                self.heap.push((cost, key));
+                self.sift_up(self.heap.len() - 1);
+                true
+            }
+            index if cost < self.heap[index].0 => {
+                self.heap[index].0 = cost;
+                self.sift_up(index);
+                true
             }
-        })
+            _ => false,
+        }
+    }
+
+    pub fn pop(&mut self) -> Option<(usize, C)> {
+        if self.heap.is_empty() {
+            return None;
+        }
+        let (cost, key) = self.heap.swap_remove(0);
+        self.positions[key] = ABSENT;
+        if !self.heap.is_empty() {
+            self.sift_down(0);
+        }
+        Some((key, cost))
+    }
+
+    /// Remove all keys, takes time proportional to the number of keys in the queue.
+    pub fn clear(&mut self) {
+        for &(_, key) in &self.heap {
+            self.positions[key] = ABSENT;
+        }
+        self.heap.clear();
+    }
+
+    fn sift_up(&mut self, mut index: usize) {
+        let entry = self.heap[index];
+        while index > 0 {
+            let parent = (index - 1) / ARITY;
+            if !(entry.0 < self.heap[parent].0) {
+                break;
+            }
+            self.place(index, self.heap[parent]);
+            index = parent;
+        }
+        self.place(index, entry);
+    }
+
+    fn sift_down(&mut self, mut index: usize) {
+        let entry = self.heap[index];
+        let n = self.heap.len();
+        loop {
+            let first_child = index * ARITY + 1;
+            if first_child >= n {
+                break;
+            }
+            let mut best = first_child;
+            for child in first_child + 1..(first_child + ARITY).min(n) {
+                if self.heap[child].0 < self.heap[best].0 {
+                    best = child;
+                }
+            }
+            if !(self.heap[best].0 < entry.0) {
+                break;
+            }
+            self.place(index, self.heap[best]);
+            index = best;
+        }
+        self.place(index, entry);
+    }
+
+    #[inline]
+    fn place(&mut self, index: usize, entry: (C, usize)) {
+        self.heap[index] = entry;
+        self.positions[entry.1] = index;
     }
 }
 
@@ -142,6 +293,36 @@ mod tests {
         assert_eq!(queue.pop(), Some("c"));
     }
 
+    #[test]
+    fn pop_with_cost_returns_element_and_cost() {
+        let mut queue = PriorityQueue::new();
+        queue.push("a", 1.3);
+        queue.push("b", 0.12);
+        assert_eq!(queue.pop_with_cost(), Some(("b", 0.12)));
+        assert_eq!(queue.pop_with_cost(), Some(("a", 1.3)));
+        assert_eq!(queue.pop_with_cost(), None);
+    }
+
+    #[test]
+    fn peek_cost_does_not_remove_element() {
+        let mut queue = PriorityQueue::new();
+        queue.push("a", 1.3);
+        queue.push("b", 0.12);
+        assert_eq!(queue.peek_cost(), Some(0.12));
+        assert_eq!(queue.pop(), Some("b"));
+    }
+
+    #[test]
+    fn can_use_tuples_as_costs() {
+        let mut queue = PriorityQueue::new();
+        queue.push("a", (1.0, 2.0));
+        queue.push("b", (1.0, 1.0));
+        queue.push("c", (0.5, 3.0));
+        assert_eq!(queue.pop(), Some("c"));
+        assert_eq!(queue.pop(), Some("b"));
+        assert_eq!(queue.pop(), Some("a"));
+    }
+
     #[test]
     fn clear_makes_queue_empty() {
         let mut queue = PriorityQueue::new();
@@ -150,4 +331,60 @@ mod tests {
         queue.clear();
         assert!(queue.is_empty());
     }
+
+    #[test]
+    fn pop_prefers_last_pushed_of_equal_costs() {
+        let mut queue = PriorityQueue::new();
+        queue.push("a", 1.0);
+        queue.push("b", 1.0);
+        queue.push("a", 1.0);
+        queue.push("c", 2.0);
+        assert_eq!(queue.pop_with_cost(), Some(("a", 1.0)));
+        assert_eq!(queue.pop_with_cost(), Some(("b", 1.0)));
+        assert_eq!(queue.pop_with_cost(), Some(("a", 1.0)));
+        assert_eq!(queue.pop_with_cost(), Some(("c", 2.0)));
+    }
+
+    #[test]
+    fn indexed_pop_returns_keys_in_order_of_cost() {
+        let mut queue = IndexedPriorityQueue::new(100);
+        // Scrambled keys with costs that are not in order of the keys.
+        for i in 0..100 {
+            let key = (i * 37) % 100;
+            queue.push_or_decrease(key, ((key * 53) % 100) as f64);
+        }
+        assert_eq!(queue.len(), 100);
+        let mut previous = f64::NEG_INFINITY;
+        while let Some((key, cost)) = queue.pop() {
+            assert_eq!(cost, ((key * 53) % 100) as f64);
+            assert!(cost >= previous);
+            previous = cost;
+        }
+    }
+
+    #[test]
+    fn indexed_push_or_decrease_only_lowers_cost() {
+        let mut queue = IndexedPriorityQueue::new(4);
+        assert!(queue.push_or_decrease(0, 2.0));
+        assert!(queue.push_or_decrease(1, 3.0));
+        assert!(queue.push_or_decrease(1, 1.0));
+        assert!(!queue.push_or_decrease(0, 5.0));
+        assert_eq!(queue.len(), 2);
+        assert_eq!(queue.peek_cost(), Some(1.0));
+        assert_eq!(queue.pop(), Some((1, 1.0)));
+        assert_eq!(queue.pop(), Some((0, 2.0)));
+        assert_eq!(queue.pop(), None);
+    }
+
+    #[test]
+    fn indexed_clear_removes_all_keys() {
+        let mut queue = IndexedPriorityQueue::new(4);
+        queue.push_or_decrease(2, 2.0);
+        queue.push_or_decrease(3, 1.0);
+        queue.clear();
+        assert!(queue.is_empty());
+        assert!(!queue.contains(2));
+        assert!(queue.push_or_decrease(2, 7.0));
+        assert_eq!(queue.pop(), Some((2, 7.0)));
+    }
 }
@@ -1,32 +1,148 @@
+use crate::components::Components;
+use crate::grid::Grid;
+use crate::path::buffers::{BufferPool, PooledBuffers};
+use crate::path::flow_field::FlowFields;
+use crate::path::one_to_many;
+use crate::path_cache::PathCache;
 use crate::pos::*;
+use memmap2::MmapOptions;
 use ndarray::{s, Array2, ArrayView2};
-use numpy::{PyArray2, ToPyArray};
+use numpy::{IntoPyArray, PyArray2, PyReadonlyArray2};
+use pyo3::exceptions::{PyTypeError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::types::IntoPyDict;
+use std::collections::HashMap;
+use std::fs::File;
+use std::io::{BufWriter, Read, Write};
+use std::path::PathBuf;
+use std::sync::{Arc, Mutex, MutexGuard};
 
-const STEP_SIZE: GridCoord = 4;
+/// Distance between neighbouring nodes of the lattice used for path finding.
+pub const STEP_SIZE: GridCoord = 4;
+
+/// Identifies files written by `World.save`.
+const FILE_MAGIC: &[u8; 8] = b"JLWORLD\0";
+/// Incremented whenever the file layout changes.
+const FILE_FORMAT_VERSION: u32 = 1;
+/// Magic, format version, padding, nx, ny, inflation radius, max clearance.
+/// The header is followed by the lattice, the map, and the clearance
+/// with one byte per element each.
+const FILE_HEADER_SIZE: usize = 48;
+
+/// Which nodes of the lattice a search can move to from a node.
+#[derive(Clone, Copy, PartialEq, Eq, Hash)]
+pub struct Neighbourhood {
+    /// Also move diagonally, i.e., use an 8-connected lattice.
+    pub diagonal: bool,
+    /// Move this many lattice nodes at once.
+    pub stride: usize,
+}
+
+impl Neighbourhood {
+    /// Direct neighbours on the 4-connected lattice.
+    pub const FOUR: Neighbourhood = Neighbourhood {
+        diagonal: false,
+        stride: 1,
+    };
+}
+
+/// Directions to the neighbours of a node, the first four are not diagonal.
+const DIRECTIONS: [(isize, isize); 8] = [
+    (1, 0),
+    (-1, 0),
+    (0, 1),
+    (0, -1),
+    (1, 1),
+    (1, -1),
+    (-1, 1),
+    (-1, -1),
+];
+
+/// Indices of the node (si, sj) nodes away from node (i, j).
+///
+/// Produces indices that are out of bounds instead of negative ones.
+#[inline]
+fn offset_node(i: usize, j: usize, si: isize, sj: isize) -> (usize, usize) {
+    (i.wrapping_add_signed(si), j.wrapping_add_signed(sj))
+}
+
+/// Bounding box of the pixels that changed in one call to `incorporate`.
+#[derive(Clone, Copy)]
+pub struct Change {
+    /// Smallest changed coordinates.
+    pub min: GridPos,
+    /// Largest changed coordinates, inclusive.
+    pub max: GridPos,
+}
+
+impl Change {
+    /// Return true if the bounding box of the line from a to b overlaps the change.
+    pub fn intersects_line(&self, a: &Pos, b: &Pos) -> bool {
+        let (min_x, max_x) = (a.x.min(b.x) as GridCoord, a.x.max(b.x) as GridCoord);
+        let (min_y, max_y) = (a.y.min(b.y) as GridCoord, a.y.max(b.y) as GridCoord);
+        min_x <= self.max.x && max_x >= self.min.x && min_y <= self.max.y && max_y >= self.min.y
+    }
+}
 
 #[pyclass(module = "janlukasAI")]
 pub struct World {
-    pub map: Array2<i64>,
+    /// One byte per pixel holding one of the codes below.
+    map: Grid<i8>,
+    /// Obstacles at the nodes of the lattice, indexed by node position / STEP_SIZE.
+    /// This is a coarse copy of `map` for fast neighbour lookups.
+    lattice: Grid<bool>,
+    /// Chebyshev distance from each pixel to the closest obstacle,
+    /// at most `MAX_CLEARANCE`.
+    clearance: Grid<u8>,
 
     #[pyo3(get, set)]
     pub enemy_king: Option<(f64, f64)>,
+
+    /// Lattice nodes in the order in which they became obstacles.
+    blocked_nodes: Vec<Pos>,
+    /// Connected components of the free lattice nodes.
+    /// Nodes without information are free, like for path finding.
+    components: Components,
+
+    /// Obstacles are extruded by this many pixels in x and y.
+    #[pyo3(get)]
+    inflation_radius: usize,
+
+    /// Incremented whenever the map changes.
+    #[pyo3(get)]
+    version: u64,
+    /// What changed with each version.
+    changes: Vec<Change>,
+
+    /// Paths computed by any `Path` on this world.
+    /// Shared with snapshots.
+    path_cache: Arc<Mutex<PathCache>>,
+
+    /// Distance fields towards goals that many knights go to.
+    /// Not shared with snapshots.
+    flow_fields: Mutex<FlowFields>,
+
+    /// Scratch memory for searches of any `Path` on this world.
+    /// Shared with snapshots.
+    search_buffers: Arc<BufferPool>,
 }
 
 impl World {
     #[allow(unused)]
-    const EMPTY: i64 = 0;
+    const EMPTY: i8 = 0;
     #[allow(unused)]
-    const OBSTACLE: i64 = 1;
+    const OBSTACLE: i8 = 1;
     #[allow(unused)]
-    const GEM: i64 = 2;
+    const GEM: i8 = 2;
     #[allow(unused)]
-    const NO_INFO: i64 = -1;
+    const NO_INFO: i8 = -1;
 
+    /// Pixels that are further away from any obstacle have this clearance.
+    pub const MAX_CLEARANCE: u8 = 32;
+
+    #[inline]
     pub fn is_obstacle_coords(&self, x: GridCoord, y: GridCoord) -> bool {
-        self.map
-            .get((x, y))
-            .map_or(false, |&t| t == World::OBSTACLE)
+        self.map.get(x, y) == Some(World::OBSTACLE)
     }
 
     pub fn is_obstacle(&self, pos: GridPos) -> bool {
@@ -35,27 +151,231 @@ impl World {
 
     pub fn is_obstacle_or_out(&self, pos: GridPos) -> bool {
         self.map
-            .get((pos.x, pos.y))
-            .map_or(true, |&t| t == World::OBSTACLE)
-    }
-
-    pub fn free_neighbours_of(&self, pos: &GridPos) -> impl Iterator<Item = GridPos> {
-        let mut res = Vec::new();
-        for p in [
-            GridPos::new(pos.x + STEP_SIZE, pos.y),
-            GridPos::new(pos.x - STEP_SIZE, pos.y),
-            GridPos::new(pos.x, pos.y + STEP_SIZE),
-            GridPos::new(pos.x, pos.y - STEP_SIZE),
-        ] {
-            if !self.is_obstacle_or_out(p) {
-                res.push(p);
+            .get(pos.x, pos.y)
+            .map_or(true, |t| t == World::OBSTACLE)
+    }
+
+    /// Free direct neighbours on the 4-connected lattice.
+    ///
+    /// `pos` must be a node of the lattice.
+    pub fn free_neighbours_of(&self, pos: &GridPos) -> impl Iterator<Item = GridPos> + '_ {
+        self.neighbours_of(pos, Neighbourhood::FOUR)
+    }
+
+    /// Nodes that a search can move to from `pos` in `neighbourhood`.
+    ///
+    /// `pos` must be a node of the lattice.
+    /// All nodes passed on the way must be free and diagonal moves must not
+    /// cut corners, i.e., the nodes next to the diagonal must be free as well.
+    pub fn neighbours_of(
+        &self,
+        pos: &GridPos,
+        neighbourhood: Neighbourhood,
+    ) -> impl Iterator<Item = GridPos> + '_ {
+        let (i, j) = (pos.x / STEP_SIZE, pos.y / STEP_SIZE);
+        let n_directions = if neighbourhood.diagonal { 8 } else { 4 };
+        let stride = neighbourhood.stride as isize;
+        DIRECTIONS[..n_directions]
+            .iter()
+            .filter(move |&&(di, dj)| self.is_free_move(i, j, di, dj, stride))
+            .map(move |&(di, dj)| {
+                let (ni, nj) = offset_node(i, j, di * stride, dj * stride);
+                GridPos::new(
+                    ni * STEP_SIZE + STEP_SIZE / 2,
+                    nj * STEP_SIZE + STEP_SIZE / 2,
+                )
+            })
+    }
+
+    /// True if all nodes on the way from node (i, j) to the node `stride`
+    /// steps in direction (di, dj) are free.
+    #[inline]
+    fn is_free_move(&self, i: usize, j: usize, di: isize, dj: isize, stride: isize) -> bool {
+        let is_free = |si: isize, sj: isize| {
+            let (ni, nj) = offset_node(i, j, si, sj);
+            self.is_free_node(ni, nj)
+        };
+        let diagonal = di != 0 && dj != 0;
+        (1..=stride).all(|t| {
+            is_free(t * di, t * dj)
+                && (!diagonal || (is_free(t * di, (t - 1) * dj) && is_free((t - 1) * di, t * dj)))
+        })
+    }
+
+    pub fn shape(&self) -> (usize, usize) {
+        self.map.shape()
+    }
+
+    /// Chebyshev distance from the pixel to the closest obstacle.
+    ///
+    /// 0 for obstacles and capped at `MAX_CLEARANCE`.
+    /// All pixels closer to (x, y) than its clearance are free.
+    /// Returns None outside the map.
+    #[inline]
+    pub fn clearance_coords(&self, x: GridCoord, y: GridCoord) -> Option<u8> {
+        self.clearance.get(x, y)
+    }
+
+    /// Copy the parts of the world that path finding needs.
+    ///
+    /// This allows searching on another thread while this world keeps changing.
+    pub fn snapshot(&self) -> World {
+        World {
+            map: self.map.clone(),
+            lattice: self.lattice.clone(),
+            clearance: self.clearance.clone(),
+            enemy_king: self.enemy_king,
+            blocked_nodes: self.blocked_nodes.clone(),
+            components: self.components.clone(),
+            inflation_radius: self.inflation_radius,
+            version: self.version,
+            changes: self.changes.clone(),
+            path_cache: Arc::clone(&self.path_cache),
+            flow_fields: Mutex::new(FlowFields::new()),
+            search_buffers: Arc::clone(&self.search_buffers),
+        }
+    }
+
+    pub fn version(&self) -> u64 {
+        self.version
+    }
+
+    /// Changes of the map, `changes()[v]` is the change from version v to v+1.
+    pub fn changes(&self) -> &[Change] {
+        &self.changes
+    }
+
+    pub fn path_cache(&self) -> MutexGuard<PathCache> {
+        self.path_cache.lock().unwrap()
+    }
+
+    /// Take cleared scratch memory for a search, see `BufferPool::take`.
+    pub fn search_buffers(&self) -> PooledBuffers {
+        self.search_buffers.take()
+    }
+
+    /// Return the path from `start` to `goal` using a shared flow field.
+    ///
+    /// Both must be nodes of the lattice.
+    /// The path is in reverse order and does not contain the start.
+    /// Returns None if the goal cannot be reached.
+    pub fn flow_path(&self, start: &Pos, goal: &Pos) -> Option<Vec<WorldPos>> {
+        self.flow_fields
+            .lock()
+            .unwrap()
+            .get(goal, self)
+            .path_from(start, self)
+    }
+
+    /// Number of lattice nodes in x and y.
+    pub fn lattice_shape(&self) -> (usize, usize) {
+        self.lattice.shape()
+    }
+
+    /// True if the lattice node with indices (i, j) exists and is not an obstacle.
+    pub fn is_free_node(&self, i: usize, j: usize) -> bool {
+        self.lattice.get(i, j) == Some(false)
+    }
+
+    /// Lattice nodes that have become obstacles, in the order in which they did so.
+    ///
+    /// Obstacles are never removed, so incremental path finders can remember
+    /// how much of this list they have already processed.
+    pub fn blocked_nodes(&self) -> &[Pos] {
+        &self.blocked_nodes
+    }
+
+    /// Component of free space that a search from the lattice node `node` explores.
+    ///
+    /// Searches that start on an obstacle first move to a free neighbour,
+    /// so for obstacles this is the component of the free neighbours.
+    /// None if there are no free neighbours or they are in different components.
+    pub fn component_of(&self, node: &Pos) -> Option<u32> {
+        let (i, j) = (node.x as usize / STEP_SIZE, node.y as usize / STEP_SIZE);
+        if let Some(label) = self.components.label(i, j) {
+            return Some(label);
+        }
+        let mut labels = DIRECTIONS.iter().filter_map(|&(di, dj)| {
+            let (ni, nj) = offset_node(i, j, di, dj);
+            self.components.label(ni, nj)
+        });
+        let first = labels.next()?;
+        labels.all(|label| label == first).then_some(first)
+    }
+
+    /// Return true if there certainly is no path between the lattice nodes `a` and `b`.
+    pub fn is_disconnected(&self, a: &Pos, b: &Pos) -> bool {
+        matches!(
+            (self.component_of(a), self.component_of(b)),
+            (Some(ca), Some(cb)) if ca != cb
+        )
+    }
+
+    /// Return the position closest to `pos` that a search from `start` can go to.
+    ///
+    /// This is `pos` itself if its lattice node is free and in the component of `start`.
+    /// Otherwise, it is the closest such node within `max_distance` pixels of `pos`,
+    /// found by scanning rings of nodes around `pos` with constant time checks
+    /// of the component labels.
+    /// Without `start`, or if the component of `start` is unknown,
+    /// any free node will do.
+    /// Returns None if there is no suitable node within `max_distance`.
+    pub fn nearest_reachable_impl(
+        &self,
+        pos: &WorldPos,
+        start: Option<&WorldPos>,
+        max_distance: f64,
+    ) -> Option<WorldPos> {
+        let component =
+            start.and_then(|start| self.component_of(&World::closest_on_grid(&start.into_pos())));
+        let accepts = |i: usize, j: usize| {
+            self.components
+                .label(i, j)
+                .map_or(false, |label| component.map_or(true, |c| label == c))
+        };
+
+        let (ni, nj) = self.lattice_shape();
+        let index_of =
+            |x: WorldCoord, n: usize| (x.max(0.0) as usize / STEP_SIZE).min(n - 1) as isize;
+        let (i0, j0) = (index_of(pos.x, ni), index_of(pos.y, nj));
+        let (nx, ny) = self.shape();
+        let inside = (0.0..nx as f64).contains(&pos.x) && (0.0..ny as f64).contains(&pos.y);
+        if inside && accepts(i0 as usize, j0 as usize) {
+            return Some(*pos);
+        }
+
+        let step = STEP_SIZE as f64;
+        let distance_to = |i: isize, j: isize| {
+            let centre = |k: isize| k as f64 * step + step / 2.0;
+            (centre(i) - pos.x).hypot(centre(j) - pos.y)
+        };
+        let mut best: Option<(f64, (isize, isize))> = None;
+        let max_ring = (max_distance / step).ceil() as isize + 1;
+        // Ring 0 is the node of `pos`, which is only a candidate if `pos` is outside the map.
+        for ring in 0..=max_ring {
+            // All nodes on this and later rings are at least this far away.
+            let min_distance = ring as f64 * step - step / 2.0;
+            if min_distance > max_distance || best.map_or(false, |(d, _)| d <= min_distance) {
+                break;
+            }
+            for (i, j) in ring_around(i0, j0, ring) {
+                if i < 0 || j < 0 || !accepts(i as usize, j as usize) {
+                    continue;
+                }
+                let distance = distance_to(i, j);
+                if distance <= max_distance && best.map_or(true, |(d, _)| distance < d) {
+                    best = Some((distance, (i, j)));
+                }
             }
         }
-        res.into_iter()
+        best.map(|(_, (i, j))| {
+            let centre = |k: isize| (k as usize * STEP_SIZE + STEP_SIZE / 2) as WorldCoord;
+            WorldPos::new(centre(i), centre(j))
+        })
     }
 
-    pub fn shape(&self) -> (usize, usize) {
-        (self.map.shape()[0], self.map.shape()[1])
+    pub fn is_on_grid(x: GridCoord, y: GridCoord) -> bool {
+        x % STEP_SIZE == STEP_SIZE / 2 && y % STEP_SIZE == STEP_SIZE / 2
     }
 
     pub fn closest_on_grid(pos: &Pos) -> Pos {
@@ -67,6 +387,60 @@ impl World {
     }
 }
 
+/// Dilate the obstacles in `local_map` by `radius` pixels in x and y.
+///
+/// The result has shape `local_map.shape() + 2 * radius` and element (i, j)
+/// corresponds to element (i - radius, j - radius) of `local_map`.
+/// The dilation is separable: the first pass dilates along y and the second along x.
+/// Both remember the last obstacle that was seen in each row or column,
+/// so every element is read and written once regardless of the radius.
+pub fn dilate<T>(
+    local_map: ArrayView2<T>,
+    is_obstacle: impl Fn(T) -> bool,
+    radius: usize,
+) -> Array2<bool>
+where
+    T: Copy,
+{
+    let (lx, ly) = local_map.dim();
+    let (ox, oy) = (lx + 2 * radius, ly + 2 * radius);
+    let width = 2 * radius;
+
+    let mut rows = Array2::from_elem((lx, oy), false);
+    for (local_row, mut row) in local_map.outer_iter().zip(rows.outer_iter_mut()) {
+        let mut last = None;
+        for (j, out) in row.iter_mut().enumerate() {
+            if j < ly && is_obstacle(local_row[j]) {
+                last = Some(j);
+            }
+            *out = last.map_or(false, |l| j - l <= width);
+        }
+    }
+
+    let mut dilated = Array2::from_elem((ox, oy), false);
+    let mut last = vec![None; oy];
+    for (i, mut out) in dilated.outer_iter_mut().enumerate() {
+        if i < lx {
+            for (l, &obstacle) in last.iter_mut().zip(rows.row(i)) {
+                if obstacle {
+                    *l = Some(i);
+                }
+            }
+        }
+        for (o, l) in out.iter_mut().zip(&last) {
+            *o = l.map_or(false, |l| i - l <= width);
+        }
+    }
+    dilated
+}
+
+/// Indices of the nodes at Chebyshev distance `ring` from node (i, j).
+fn ring_around(i: isize, j: isize, ring: isize) -> impl Iterator<Item = (isize, isize)> {
+    let columns = (-ring..=ring).flat_map(move |d| [(i + d, j - ring), (i + d, j + ring)]);
+    let rows = (1 - ring..ring).flat_map(move |d| [(i - ring, j + d), (i + ring, j + d)]);
+    columns.chain(rows)
+}
+
 fn local_map_start(knight_pos: GridPos, view_range: usize) -> (usize, usize) {
     let start_x = if knight_pos.x < view_range {
         0
@@ -82,79 +456,506 @@ fn local_map_start(knight_pos: GridPos, view_range: usize) -> (usize, usize) {
 }
 
 impl World {
-    fn incorporate_impl(
+    /// Add the obstacles in a local map around a knight.
+    ///
+    /// `is_obstacle` tells which elements of `local_map` are obstacles.
+    pub fn incorporate_impl<T>(
         &mut self,
-        local_map: ArrayView2<i64>,
+        local_map: ArrayView2<T>,
+        is_obstacle: impl Fn(T) -> bool,
         knight_pos: GridPos,
         view_range: usize,
-    ) {
+    ) where
+        T: Copy,
+    {
         let (start_x, start_y) = local_map_start(knight_pos, view_range);
-        let end_x = start_x + local_map.shape()[0];
-        let end_y = start_y + local_map.shape()[1];
-        let mut slice = self.map.slice_mut(s![start_x..end_x, start_y..end_y]);
-
-        // Copy local_map into self.map
-        // Extrude obstacles by 1 pixel in x and y.
-        // The outer map is sliced such that indexing into `slice` with x+-1 and y+-1
-        // is always valid.
-        local_map
-            .slice(s![2..local_map.shape()[0] - 2, 2..local_map.shape()[1] - 2])
-            .indexed_iter()
-            .for_each(|((x, y), &l)| {
-                if l == World::OBSTACLE {
-                    let x = x + 2;
-                    let y = y + 2;
-                    for xx in x - 2..x + 3 {
-                        slice[(xx, y - 2)] = l;
-                        slice[(xx, y - 1)] = l;
-                        slice[(xx, y)] = l;
-                        slice[(xx, y + 1)] = l;
-                        slice[(xx, y + 2)] = l;
-                    }
-                }
+        let (nx, ny) = self.shape();
+        let radius = self.inflation_radius;
+        let n_blocked = self.blocked_nodes.len();
+
+        // Copy obstacles from local_map into self.map
+        // and extrude them by `radius` pixels in x and y.
+        // The dilated mask starts `radius` pixels before the local map.
+        let dilated = dilate(local_map, is_obstacle, radius);
+        let mut change: Option<Change> = None;
+        for ((i, j), &obstacle) in dilated.indexed_iter() {
+            if !obstacle || start_x + i < radius || start_y + j < radius {
+                continue;
+            }
+            let (x, y) = (start_x + i - radius, start_y + j - radius);
+            if x >= nx || y >= ny || !self.set_obstacle(x, y) {
+                continue;
+            }
+            let pos = GridPos::new(x, y);
+            change = Some(match change {
+                None => Change { min: pos, max: pos },
+                Some(c) => Change {
+                    min: GridPos::new(c.min.x.min(x), c.min.y.min(y)),
+                    max: GridPos::new(c.max.x.max(x), c.max.y.max(y)),
+                },
             });
+        }
+        let new_nodes: Vec<_> = self.blocked_nodes[n_blocked..]
+            .iter()
+            .map(|node| (node.x as usize / STEP_SIZE, node.y as usize / STEP_SIZE))
+            .collect();
+        self.components.block(&new_nodes);
+        if let Some(change) = change {
+            self.update_clearance(&change);
+            self.changes.push(change);
+            self.version += 1;
+        }
+    }
+
+    /// Lower the clearance around new obstacles.
+    ///
+    /// Obstacles are only ever added, so the old clearance is an upper bound.
+    /// Two chamfer passes over the region that the new obstacles can affect
+    /// propagate the new distances.
+    /// With unit weights for all 8 neighbours, this gives the exact Chebyshev distance.
+    fn update_clearance(&mut self, change: &Change) {
+        let (nx, ny) = self.shape();
+        let reach = World::MAX_CLEARANCE as usize;
+        let (x0, y0) = (
+            change.min.x.saturating_sub(reach),
+            change.min.y.saturating_sub(reach),
+        );
+        let (x1, y1) = (
+            (change.max.x + reach).min(nx - 1),
+            (change.max.y + reach).min(ny - 1),
+        );
+
+        let clearance = &mut self.clearance;
+        let mut relax = |x: usize, y: usize, neighbours: [(usize, usize); 4]| {
+            let mut c = if self.map.get(x, y) == Some(World::OBSTACLE) {
+                0
+            } else {
+                clearance.get(x, y).unwrap()
+            };
+            for (xn, yn) in neighbours {
+                if let Some(n) = clearance.get(xn, yn) {
+                    c = c.min(n + 1);
+                }
+            }
+            clearance.set(x, y, c);
+        };
+        for x in x0..=x1 {
+            for y in y0..=y1 {
+                let (xm, ym) = (x.wrapping_sub(1), y.wrapping_sub(1));
+                relax(x, y, [(xm, ym), (xm, y), (xm, y + 1), (x, ym)]);
+            }
+        }
+        for x in (x0..=x1).rev() {
+            for y in (y0..=y1).rev() {
+                let ym = y.wrapping_sub(1);
+                relax(x, y, [(x + 1, y + 1), (x + 1, y), (x + 1, ym), (x, y + 1)]);
+            }
+        }
+    }
+
+    /// Return true if the pixel was not an obstacle before.
+    fn set_obstacle(&mut self, x: GridCoord, y: GridCoord) -> bool {
+        if self.map.get(x, y) == Some(World::OBSTACLE) {
+            return false;
+        }
+        self.map.set(x, y, World::OBSTACLE);
+        if World::is_on_grid(x, y) {
+            self.lattice.set(x / STEP_SIZE, y / STEP_SIZE, true);
+            self.blocked_nodes.push(Pos::new(x as Coord, y as Coord));
+        }
+        true
     }
 
     pub fn in_bounds(&self, pos: &GridPos) -> bool {
-        pos.x < self.map.shape()[0] && pos.y < self.map.shape()[1]
+        let (nx, ny) = self.shape();
+        pos.x < nx && pos.y < ny
+    }
+}
+
+impl World {
+    fn write_to(&self, mut out: impl Write) -> std::io::Result<()> {
+        let (nx, ny) = self.shape();
+        out.write_all(FILE_MAGIC)?;
+        out.write_all(&FILE_FORMAT_VERSION.to_le_bytes())?;
+        out.write_all(&[0; 4])?;
+        for value in [nx, ny, self.inflation_radius, World::MAX_CLEARANCE as usize] {
+            out.write_all(&(value as u64).to_le_bytes())?;
+        }
+        let lattice: Vec<u8> = self.lattice.as_slice().iter().map(|&b| b as u8).collect();
+        out.write_all(&lattice)?;
+        let map: Vec<u8> = self.map.as_slice().iter().map(|&c| c as u8).collect();
+        out.write_all(&map)?;
+        out.write_all(self.clearance.as_slice())?;
+        out.flush()
+    }
+
+    fn read_from(path: &PathBuf, mmap: bool, path_cache_size: usize) -> PyResult<World> {
+        let invalid = |reason: &str| {
+            PyValueError::new_err(format!(
+                "{} is not a valid world file: {reason}",
+                path.display()
+            ))
+        };
+        let mut file = File::open(path)?;
+        let file_size = file.metadata()?.len() as usize;
+        if file_size < FILE_HEADER_SIZE {
+            return Err(invalid("too small"));
+        }
+        let mut header = [0u8; FILE_HEADER_SIZE];
+        file.read_exact(&mut header)?;
+        if &header[..8] != FILE_MAGIC {
+            return Err(invalid("unknown file type"));
+        }
+        let format = u32::from_le_bytes(header[8..12].try_into().unwrap());
+        if format != FILE_FORMAT_VERSION {
+            return Err(invalid(&format!("unsupported format version {format}")));
+        }
+        let field =
+            |i: usize| u64::from_le_bytes(header[16 + 8 * i..24 + 8 * i].try_into().unwrap());
+        let (nx, ny) = (field(0) as usize, field(1) as usize);
+        let inflation_radius = field(2) as usize;
+        if field(3) != World::MAX_CLEARANCE as u64 {
+            return Err(invalid("clearance was computed with a different maximum"));
+        }
+        if nx == 0 || ny == 0 {
+            return Err(invalid("empty shape"));
+        }
+        if nx % STEP_SIZE != 0 || ny % STEP_SIZE != 0 {
+            return Err(invalid("shape is not a multiple of the step size"));
+        }
+        let lattice_shape = (nx / STEP_SIZE, ny / STEP_SIZE);
+        // The header is untrusted, so the sizes must not overflow.
+        let n_pixels = nx
+            .checked_mul(ny)
+            .ok_or_else(|| invalid("shape is too large"))?;
+        // At most n_pixels / STEP_SIZE^2, so this cannot overflow.
+        let n_nodes = lattice_shape.0 * lattice_shape.1;
+        let expected_size = n_pixels
+            .checked_mul(2)
+            .and_then(|size| size.checked_add(FILE_HEADER_SIZE + n_nodes))
+            .ok_or_else(|| invalid("shape is too large"))?;
+        if file_size != expected_size {
+            return Err(invalid("size does not match shape"));
+        }
+
+        // The lattice is small and needs to be converted to bool, so always read it.
+        let mut lattice = vec![0u8; n_nodes];
+        file.read_exact(&mut lattice)?;
+        let lattice = Grid::from_vec(lattice_shape, lattice.iter().map(|&b| b != 0).collect());
+
+        let (map, clearance) = if mmap {
+            let map_offset = FILE_HEADER_SIZE + n_nodes;
+            let map_section = |offset: usize| {
+                // SAFETY: The mapping is private, so writes to it do not reach the file.
+                // The file must not be modified by others while it is mapped.
+                unsafe {
+                    MmapOptions::new()
+                        .offset(offset as u64)
+                        .len(n_pixels)
+                        .map_copy(&file)
+                }
+            };
+            (
+                Grid::<i8>::from_mmap((nx, ny), map_section(map_offset)?),
+                Grid::<u8>::from_mmap((nx, ny), map_section(map_offset + n_pixels)?),
+            )
+        } else {
+            let mut map = vec![0u8; n_pixels];
+            file.read_exact(&mut map)?;
+            let mut clearance = vec![0u8; n_pixels];
+            file.read_exact(&mut clearance)?;
+            (
+                Grid::from_vec((nx, ny), map.iter().map(|&c| c as i8).collect()),
+                Grid::from_vec((nx, ny), clearance),
+            )
+        };
+
+        let search_buffers = Arc::new(BufferPool::new(lattice.shape()));
+        // Cheap compared to reading the map, so it is not stored in the file.
+        let components = Components::new(lattice.shape(), |i, j| lattice.get(i, j) == Some(false));
+        Ok(World {
+            map,
+            lattice,
+            clearance,
+            enemy_king: None,
+            blocked_nodes: Vec::new(),
+            components,
+            inflation_radius,
+            version: 0,
+            changes: Vec::new(),
+            path_cache: Arc::new(Mutex::new(PathCache::new(path_cache_size))),
+            flow_fields: Mutex::new(FlowFields::new()),
+            search_buffers,
+        })
     }
 }
 
 #[pymethods]
 impl World {
+    /// Create a world without any information.
+    ///
+    /// `path_cache_size` is the maximum number of paths that are cached
+    /// for all `Path` objects on this world.
+    /// `inflation_radius` is the number of pixels by which `incorporate`
+    /// extrudes obstacles in x and y to keep knights away from walls.
     #[new]
-    pub fn new(shape: (usize, usize)) -> Self {
+    #[pyo3(signature = (shape, path_cache_size = 256, inflation_radius = 2))]
+    pub fn new(shape: (usize, usize), path_cache_size: usize, inflation_radius: usize) -> Self {
         assert_eq!(shape.0 % STEP_SIZE, 0);
         assert_eq!(shape.1 % STEP_SIZE, 0);
+        let lattice_shape = (shape.0 / STEP_SIZE, shape.1 / STEP_SIZE);
         World {
-            map: Array2::from_elem((shape.0, shape.1), World::NO_INFO),
+            map: Grid::new(shape, World::NO_INFO),
+            lattice: Grid::new(lattice_shape, false),
+            clearance: Grid::new(shape, World::MAX_CLEARANCE),
             enemy_king: None,
+            blocked_nodes: Vec::new(),
+            components: Components::new(lattice_shape, |_, _| true),
+            inflation_radius,
+            version: 0,
+            changes: Vec::new(),
+            path_cache: Arc::new(Mutex::new(PathCache::new(path_cache_size))),
+            flow_fields: Mutex::new(FlowFields::new()),
+            search_buffers: Arc::new(BufferPool::new(lattice_shape)),
         }
     }
 
+    /// Write the map and the data derived from it to a file.
+    ///
+    /// The path cache, flow fields, and history of changes are not saved.
+    fn save(&self, path: PathBuf) -> PyResult<()> {
+        self.write_to(BufWriter::new(File::create(path)?))?;
+        Ok(())
+    }
+
+    /// Load a world from a file written by `save`.
+    ///
+    /// If `mmap` is true, the map and clearance are mapped from the file
+    /// instead of being read.
+    /// Pages are only loaded when they are used and are shared by all
+    /// processes that load the same file until `incorporate` writes to them.
+    /// Writes only change a private copy, never the file.
+    /// The file must not be modified while a world is mapped from it.
+    #[staticmethod]
+    #[pyo3(signature = (path, mmap = true, path_cache_size = 256))]
+    fn load(path: PathBuf, mmap: bool, path_cache_size: usize) -> PyResult<World> {
+        World::read_from(&path, mmap, path_cache_size)
+    }
+
+    /// Return a copy of the map as int64.
+    ///
+    /// Prefer `map_view` which does not copy.
     fn get_map<'py>(&self, py: Python<'py>) -> &'py PyArray2<i64> {
-        self.map.to_pyarray(py)
+        self.map.view().mapv(i64::from).into_pyarray(py)
+    }
+
+    /// Return a read-only int8 view of the map without copying it.
+    ///
+    /// `region = (x_start, x_stop, y_start, y_stop)` selects a part of the map
+    /// and `step` only returns every step-th pixel in x and y.
+    /// The view keeps the world alive and reflects later calls to `incorporate`.
+    #[pyo3(signature = (region = None, step = 1))]
+    fn map_view<'py>(
+        slf: &'py PyCell<Self>,
+        region: Option<(usize, usize, usize, usize)>,
+        step: usize,
+    ) -> PyResult<&'py PyArray2<i8>> {
+        let py = slf.py();
+        let world = slf.borrow();
+        let (nx, ny) = world.shape();
+        let (x_start, x_stop, y_start, y_stop) = region.unwrap_or((0, nx, 0, ny));
+        if x_start > x_stop || x_stop > nx || y_start > y_stop || y_stop > ny {
+            return Err(PyValueError::new_err(format!(
+                "Region {:?} is out of bounds of map with shape {:?}",
+                (x_start, x_stop, y_start, y_stop),
+                (nx, ny)
+            )));
+        }
+        if step == 0 {
+            return Err(PyValueError::new_err("step must be positive"));
+        }
+
+        let view = world.map.view().slice_move(s![
+            x_start..x_stop;step,
+            y_start..y_stop;step
+        ]);
+        // SAFETY: The map is never reallocated and `slf` is kept alive by the array.
+        let array = unsafe { PyArray2::borrow_from_array(&view, slf.as_ref()) };
+        array.call_method("setflags", (), Some([("write", false)].into_py_dict(py)))?;
+        Ok(array)
     }
 
+    /// Add the obstacles in `local_map` to the world.
+    ///
+    /// `local_map` may have any integer or bool dtype and does not need to be contiguous.
+    /// For integers, elements equal to 1 are obstacles,
+    /// for bools, true elements are obstacles.
     fn incorporate(
         &mut self,
-        local_map: &PyArray2<i64>,
+        local_map: &PyAny,
         knight_pos: (WorldCoord, WorldCoord),
         view_range: usize,
-    ) {
-        let read_only_local_map = local_map.readonly();
-        let knight_pos = WorldPos::new(knight_pos.0, knight_pos.1);
-        self.incorporate_impl(
-            read_only_local_map.as_array(),
-            knight_pos.into_pos(),
-            view_range,
-        );
+    ) -> PyResult<()> {
+        let knight_pos: GridPos = WorldPos::new(knight_pos.0, knight_pos.1).into_pos();
+
+        macro_rules! incorporate_integer {
+            ($($t:ty),*) => {$(
+                if let Ok(map) = local_map.extract::<PyReadonlyArray2<$t>>() {
+                    let obstacle = World::OBSTACLE as $t;
+                    self.incorporate_impl(map.as_array(), |l| l == obstacle, knight_pos, view_range);
+                    return Ok(());
+                }
+            )*};
+        }
+        incorporate_integer!(i64, i32, i16, i8, u64, u32, u16, u8);
+        if let Ok(map) = local_map.extract::<PyReadonlyArray2<bool>>() {
+            self.incorporate_impl(map.as_array(), |l| l, knight_pos, view_range);
+            return Ok(());
+        }
+        Err(PyTypeError::new_err(
+            "local_map must be a 2d array of integers or bools",
+        ))
     }
 
     fn is_accessible(&self, pos: (WorldCoord, WorldCoord)) -> bool {
         let pos = WorldPos::new(pos.0, pos.1);
         !self.is_obstacle_or_out(pos.into_pos())
     }
+
+    /// Return true if a path may connect `a` and `b`.
+    ///
+    /// Returns false if they are in different connected components of free space,
+    /// which takes constant time instead of a search.
+    /// Parts of the map without information count as free.
+    /// Positions on obstacles use the component of the free lattice nodes around them.
+    fn reachable(&self, a: (WorldCoord, WorldCoord), b: (WorldCoord, WorldCoord)) -> bool {
+        let node_of = |(x, y): (WorldCoord, WorldCoord)| {
+            World::closest_on_grid(&WorldPos::new(x, y).into_pos())
+        };
+        let (a, b) = (node_of(a), node_of(b));
+        matches!(
+            (self.component_of(&a), self.component_of(&b)),
+            (Some(ca), Some(cb)) if ca == cb
+        )
+    }
+
+    /// Return the position closest to `pos` that can be reached from `start`.
+    ///
+    /// Returns `pos` if a path from `start` can end there.
+    /// Otherwise, returns the closest free node of the lattice within `max_distance`
+    /// pixels that is in the same component as `start`, or None if there is none.
+    /// Use this to move targets off obstacles, e.g., gems next to walls.
+    /// Without `start`, returns the closest free node.
+    #[pyo3(signature = (pos, start = None, max_distance = 32.0))]
+    fn nearest_reachable(
+        &self,
+        pos: (WorldCoord, WorldCoord),
+        start: Option<(WorldCoord, WorldCoord)>,
+        max_distance: f64,
+    ) -> Option<(WorldCoord, WorldCoord)> {
+        let start = start.map(|(x, y)| WorldPos::new(x, y));
+        self.nearest_reachable_impl(&WorldPos::new(pos.0, pos.1), start.as_ref(), max_distance)
+            .map(|p| (p.x, p.y))
+    }
+
+    /// Return the length of the shortest path from `start` to each of `targets`.
+    ///
+    /// Uses a single search for all targets that stops as soon as the
+    /// costs of all targets are known or exceed `max_cost`.
+    /// Returns infinity for targets that are not accessible, not reachable,
+    /// or further away than `max_cost`.
+    /// Targets in other components than `start` are skipped without searching.
+    #[pyo3(signature = (start, targets, max_cost = f64::INFINITY))]
+    fn path_costs(
+        &self,
+        start: (WorldCoord, WorldCoord),
+        targets: Vec<(WorldCoord, WorldCoord)>,
+        max_cost: f64,
+    ) -> Vec<f64> {
+        let node_of = |(x, y): (WorldCoord, WorldCoord)| {
+            World::closest_on_grid(&WorldPos::new(x, y).into_pos())
+        };
+        let target_nodes: Vec<Pos> = targets.into_iter().map(node_of).collect();
+        one_to_many::path_costs(&node_of(start), &target_nodes, max_cost, self)
+    }
+
+    /// Return the distance from `pos` to the closest known obstacle.
+    ///
+    /// Uses the Chebyshev (chessboard) distance in pixels, capped at `MAX_CLEARANCE`.
+    /// Returns 0 for obstacles and positions outside the map.
+    fn clearance(&self, pos: (WorldCoord, WorldCoord)) -> u8 {
+        let pos: GridPos = WorldPos::new(pos.0, pos.1).into_pos();
+        self.clearance_coords(pos.x, pos.y).unwrap_or(0)
+    }
+
+    /// Return the clearance of all pixels, see `clearance`.
+    fn get_clearance<'py>(&self, py: Python<'py>) -> &'py PyArray2<u8> {
+        self.clearance.view().to_owned().into_pyarray(py)
+    }
+
+    /// Clearance of pixels that are far away from all obstacles.
+    #[classattr]
+    #[pyo3(name = "MAX_CLEARANCE")]
+    fn max_clearance() -> u8 {
+        World::MAX_CLEARANCE
+    }
+
+    /// Shape of the map in pixels.
+    #[getter(shape)]
+    fn py_shape(&self) -> (usize, usize) {
+        self.shape()
+    }
+
+    /// Return counters and size of the path cache.
+    #[getter]
+    fn path_cache_info(&self) -> HashMap<&'static str, u64> {
+        let cache = self.path_cache();
+        HashMap::from([
+            ("hits", cache.hits),
+            ("misses", cache.misses),
+            ("evictions", cache.evictions),
+            ("size", cache.len() as u64),
+            ("capacity", cache.capacity() as u64),
+        ])
+    }
+
+    fn clear_path_cache(&self) {
+        self.path_cache().clear();
+    }
+
+    /// Return the next waypoint from `pos` towards `goal` or None if there is no path.
+    ///
+    /// Uses a flow field that is shared by all queries with the same goal,
+    /// so only the first query for a goal requires a search.
+    /// The field is repaired when the map changes.
+    fn flow_next(
+        &self,
+        goal: (WorldCoord, WorldCoord),
+        pos: (WorldCoord, WorldCoord),
+    ) -> Option<(WorldCoord, WorldCoord)> {
+        let goal = WorldPos::new(goal.0, goal.1);
+        let node = World::closest_on_grid(&WorldPos::new(pos.0, pos.1).into_pos());
+        let goal_node = World::closest_on_grid(&goal.into_pos());
+        let mut fields = self.flow_fields.lock().unwrap();
+        let field = fields.get(&goal_node, self);
+        match field.next_from(&node, self)? {
+            next if next == goal_node => Some((goal.x, goal.y)),
+            next => Some((next.x as WorldCoord, next.y as WorldCoord)),
+        }
+    }
+
+    /// Return the length of the path from `pos` to `goal` according to the flow field.
+    ///
+    /// Returns infinity if there is no path.
+    fn flow_cost(&self, goal: (WorldCoord, WorldCoord), pos: (WorldCoord, WorldCoord)) -> f64 {
+        let node = World::closest_on_grid(&WorldPos::new(pos.0, pos.1).into_pos());
+        let goal_node = World::closest_on_grid(&WorldPos::new(goal.0, goal.1).into_pos());
+        self.flow_fields
+            .lock()
+            .unwrap()
+            .get(&goal_node, self)
+            .cost_from(&node, self)
+    }
 }
 
 pub fn bind(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
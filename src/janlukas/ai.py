@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import os
+
 import numpy as np
 from quest.core.ai import BaseAI
 
@@ -13,16 +15,37 @@ WORLD_SHAPE = (1792, 960)
 ENEMY_TEAM_NAME = {"red": "blue", "blue": "red"}
 
 
+# File written by World.save to start every game with.
+# Useful when the same map is played repeatedly.
+PRIOR_WORLD = os.environ.get("JANLUKAS_PRIOR_WORLD")
+
+
 def make_world(team: str, index: int) -> jl.World:
     if index == 0:
-        make_world.world[team] = jl.World(WORLD_SHAPE)
+        make_world.world[team] = _load_prior_world() or jl.World(WORLD_SHAPE)
     return make_world.world[team]
 
 
+def _load_prior_world() -> jl.World | None:
+    if PRIOR_WORLD is None or not os.path.exists(PRIOR_WORLD):
+        return None
+    world = jl.World.load(PRIOR_WORLD)
+    # A snapshot of another map is worse than no information.
+    if world.shape != WORLD_SHAPE:
+        return None
+    return world
+
+
 make_world.world = {"red": None, "blue": None}
 
 
 class Knight(BaseAI):
+    # Search paths on a worker thread, disabled for deterministic replays.
+    BACKGROUND_SEARCH = True
+    # Follow flow fields to targets that many knights share.
+    # Fields are built and repaired on the game thread, so this is opt-in.
+    SHARED_TARGETS = False
+
     def __init__(self, kind: str, index: int, **kwargs) -> None:
         super().__init__(creator=CREATOR, kind=kind, **kwargs)
         if not kwargs:
@@ -30,7 +53,9 @@ class Knight(BaseAI):
 
         self.knight_index = index
         self.world = make_world(self.team, index)
-        self.path = jl.Path(self.world)
+        self.path = jl.Path(
+            self.world, engine="d_star_lite", background=self.BACKGROUND_SEARCH
+        )
         self.tick = -10
 
         self.state = None
@@ -55,13 +80,17 @@ class Knight(BaseAI):
             self.path.recompute_in_one_turn()
 
         self.state, target = self.state.step(info=info, world=self.world)
-        self.path.set_target(target)
+        self.path.set_target(target, shared=self._shared(), snap=True)
 
         to = self.find_path(target, pos, speed=me["speed"], dt=dt)
 
         if to is not None:
             self.stop = False
             self.goto = to
+        elif self.path.pending or self.path.status == "partial":
+            # Wait for the first path to the new target
+            # or for a search that gets further.
+            self.stop = True
         else:
             self.stop = True
             self.state = self.state.reached_target(info=info, world=self.world)
@@ -72,7 +101,9 @@ class Knight(BaseAI):
         if _iter == 5:
             return None  # give up
         try:
-            return self.path.next(pos, self.world, speed=speed, dt=dt)
+            to = self.path.next(pos, self.world, speed=speed, dt=dt)
+            if to is not None or not self._stopped_short_of(target):
+                return to
         except ValueError:
             # print(f"{self.team}.{self.knight_index}: target unreachable: {target}")
             pass
@@ -83,9 +114,19 @@ class Knight(BaseAI):
             # )
             pass
         self.state, target = self.state.cannot_go_there()
-        self.path.set_target(target)
+        self.path.set_target(target, shared=self._shared(), snap=True)
         return self.find_path(target, pos, speed, dt, _iter + 1)
 
+    def _shared(self) -> bool:
+        return self.SHARED_TARGETS and self.state.shared_target
+
+    def _stopped_short_of(self, target: tuple) -> bool:
+        """Return true if the path has ended somewhere other than at `target`."""
+        if self.path.pending or self.path.status == "partial":
+            return False
+        # Snapping moves targets that are cut off to the closest reachable position.
+        return self.path.status == "unreachable" or self.path.goal != tuple(target)
+
     def _handle_messages(self, friends: list[dict]) -> None:
         for friend in friends:
             if (king := _parse_messages(friend["message"])) is not None:
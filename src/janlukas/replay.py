@@ -0,0 +1,148 @@
+"""Record the inputs of AIs during a match and replay them without the game.
+
+Recordings are gzip compressed streams of pickled records,
+one per call to `run`.
+Only load recordings that you made yourself, unpickling runs arbitrary code.
+
+Record a match with `python tests/run.py --record match.rec`.
+Replay it as fast as possible and report latencies with
+`python -m janlukas.replay match.rec`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import pickle
+import time
+from collections.abc import Iterator
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class Recorder:
+    """Write the arguments of calls to `run` to a file as they happen."""
+
+    def __init__(self, path: str | Path) -> None:
+        self._file = gzip.open(path, "wb", compresslevel=3)
+        pickle.dump({"format": FORMAT_VERSION}, self._file)
+
+    def record(self, team: str, name: str, t: float, dt: float, info: dict) -> None:
+        pickle.dump((team, name, t, dt, _compact(info)), self._file)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> Recorder:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _compact(info: dict) -> dict:
+    """Store the local map with one byte per pixel if possible."""
+    local_map = np.asarray(info["local_map"])
+    if (
+        local_map.dtype.kind in "iu"
+        and local_map.size > 0
+        and -128 <= local_map.min()
+        and local_map.max() <= 127
+    ):
+        info = {**info, "local_map": local_map.astype(np.int8)}
+    return info
+
+
+def recording_team(team: dict[str, Callable], recorder: Recorder) -> dict:
+    """Return a team whose AIs record every call to `run` with `recorder`."""
+    return {
+        name: partial(_make_recording_ai, make, name, recorder)
+        for name, make in team.items()
+    }
+
+
+def _make_recording_ai(make: Callable, name: str, recorder: Recorder, **kwargs) -> Any:
+    ai = make(**kwargs)
+    if not kwargs:
+        return ai  # not playing, see Knight.__init__
+    run = ai.run
+
+    def recorded_run(t: float, dt: float, info: dict) -> None:
+        recorder.record(ai.team, name, t, dt, info)
+        run(t, dt, info)
+
+    ai.run = recorded_run
+    return ai
+
+
+def read_recording(path: str | Path) -> Iterator[tuple[str, str, float, float, dict]]:
+    """Yield (team, name, t, dt, info) for every recorded call to `run`."""
+    with gzip.open(path, "rb") as f:
+        header = pickle.load(f)
+        if header != {"format": FORMAT_VERSION}:
+            raise ValueError(f"Not a recording or unsupported format: {path}")
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def replay(path: str | Path, team: dict[str, Callable]) -> dict[str, np.ndarray]:
+    """Drive the AIs of `team` with a recording.
+
+    All AIs of a team are created in the order of `team` when the team
+    first appears in the recording, like in a match.
+    Returns the latencies of all calls to `run` in seconds by "team.name".
+    """
+    ais = {}
+    latencies = {}
+    for team_name, name, t, dt, info in read_recording(path):
+        key = f"{team_name}.{name}"
+        if key not in ais:
+            for other, make in team.items():
+                if f"{team_name}.{other}" not in ais:
+                    ais[f"{team_name}.{other}"] = make(team=team_name)
+        ai = ais[key]
+        start = time.perf_counter()
+        ai.run(t, dt, info)
+        latencies.setdefault(key, []).append(time.perf_counter() - start)
+    return {key: np.array(values) for key, values in latencies.items()}
+
+
+def report(latencies: dict[str, np.ndarray]) -> None:
+    percentiles = (50, 90, 99)
+    header = "".join(f"{f'p{p}':>10}" for p in percentiles)
+    print(f"{'':<30}{'ticks':>8}{header}{'max':>10}   [ms]")
+    rows = dict(latencies)
+    rows["all"] = np.concatenate(list(latencies.values()))
+    for key, values in rows.items():
+        values = values * 1e3
+        columns = "".join(f"{v:10.3f}" for v in np.percentile(values, percentiles))
+        print(f"{key:<30}{len(values):>8}{columns}{values.max():10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded match.")
+    parser.add_argument("recording", type=Path)
+    parser.add_argument(
+        "--blocking",
+        action="store_true",
+        help="search paths on the main thread to make replays deterministic",
+    )
+    args = parser.parse_args()
+
+    from . import ai, team
+
+    if args.blocking:
+        ai.Knight.BACKGROUND_SEARCH = False
+    report(replay(args.recording, team))
+
+
+if __name__ == "__main__":
+    main()
@@ -42,7 +42,7 @@ class TravelAcross(State):
             else:
                 self.target = TravelAcross.TARGET_LOW[team]
 
-        self.gem_getter = AngleGemGetter(tolerance=0.2 if index == 0 else 0.8)
+        self.gem_getter = AngleGemGetter(max_detour=0.02 if index == 0 else 0.3)
 
     @unstuck
     def step(self, *, info: dict, world: jl.World) -> tuple[State, tuple]:
@@ -61,6 +61,10 @@ class TravelAcross(State):
             return self
         return self.make(ScanEnemyZone, low_start=self.low_start)
 
+    @property
+    def shared_target(self) -> bool:
+        return self.gem_getter.getting_gem is None
+
     def cannot_go_there(self) -> tuple[State, tuple]:
         if self.gem_getter.getting_gem is not None:
             self.gem_getter.cannot_go_there()
@@ -131,6 +135,10 @@ class CollectGems(State):
             return self
         return self.make(ScanEnemyZone)
 
+    @property
+    def shared_target(self) -> bool:
+        return self.gem_getter.getting_gem is None
+
     def cannot_go_there(self) -> tuple[State, tuple]:
         if self.gem_getter.getting_gem is not None:
             self.gem_getter.cannot_go_there()
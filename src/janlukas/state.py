@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 from abc import ABC, abstractmethod
 from typing import Tuple
 
@@ -54,18 +55,37 @@ class State(ABC):
     def cannot_go_there(self) -> tuple[State, tuple]:
         return self, (896, 480)
 
+    @property
+    def shared_target(self) -> bool:
+        """True if the current target is fixed and other knights may go there, too."""
+        return True
+
 
 class Regicide(State):
     """Go directly to the enemy King and stop there."""
 
+    @property
+    def shared_target(self) -> bool:
+        # The king moves.
+        return False
+
     def step(self, *, info: dict, world: jl.World) -> tuple[State, tuple]:
         return self, world.enemy_king
 
 
 class AngleGemGetter:
-    def __init__(self, tolerance) -> None:
+    """Pick up gems that require only a small detour on the way to the target."""
+
+    # Gems that are closer to a wall than this (in pixels) are skipped
+    # because knights tend to get stuck on the corners when going there.
+    MIN_CLEARANCE = 3
+
+    def __init__(self, max_detour) -> None:
         self.getting_gem: tuple | None = None
-        self.tolerance = tolerance
+        # Maximum detour as a fraction of the length of the path to the gem.
+        # For gems that are much closer than the target, this corresponds to
+        # an angle of arccos(1 - max_detour) between the gem and the target.
+        self.max_detour = max_detour
         self.forbidden: tuple | None = None
 
     def get_gem(
@@ -74,34 +94,22 @@ class AngleGemGetter:
         if self.getting_gem is not None:
             return self.getting_gem
 
-        gems = info["gems"]
-        if not gems:
-            return None
-
-        pos = info["me"]["position"]
-        gems = np.c_[gems["x"], gems["y"]]
-
-        v = current_target - pos
-        gv = gems - pos
-        angles = np.arccos(
-            np.dot(gv, v) / np.linalg.norm(v) / np.linalg.norm(gv, axis=1)
-        )
-        gem_index = np.argmin(angles)
-        # Limiting the distance to make sure that the world has been updated
-        # around the gem so that we don't try to walk into a wall.
-        if abs(angles[gem_index]) < self.tolerance:
-            closest_gem = gems[gem_index]
-            if self.forbidden is not None and np.array_equal(
-                closest_gem, self.forbidden
+        pos = tuple(info["me"]["position"])
+        gems, costs = _gem_path_costs(info, world, self.forbidden)
+        remaining = math.dist(pos, current_target)
+        best_gem = None
+        best_detour = math.inf
+        for gem, cost in zip(gems, costs, strict=True):
+            detour = cost + math.dist(gem, current_target) - remaining
+            if (
+                detour <= self.max_detour * cost
+                and detour < best_detour
+                and world.clearance(gem) >= AngleGemGetter.MIN_CLEARANCE
             ):
-                return None
-            closest_gem = tuple(closest_gem)
-            if not world.is_accessible(closest_gem):
-                return None
-            self.getting_gem = closest_gem
-            return closest_gem
+                best_gem, best_detour = gem, detour
 
-        return None
+        self.getting_gem = best_gem
+        return best_gem
 
     def reached_target(self) -> None:
         self.getting_gem = None
@@ -112,6 +120,8 @@ class AngleGemGetter:
 
 
 class DistanceGemGetter:
+    """Pick up the gem with the shortest path."""
+
     def __init__(self) -> None:
         self.getting_gem: tuple | None = None
         self.forbidden: tuple | None = None
@@ -122,23 +132,14 @@ class DistanceGemGetter:
         if self.getting_gem is not None:
             return self.getting_gem
 
-        gems = info["gems"]
+        gems, costs = _gem_path_costs(info, world, self.forbidden)
         if not gems:
             return None
-
-        pos = info["me"]["position"]
-        gems = np.c_[gems["x"], gems["y"]]
-
-        distances = np.linalg.norm(gems - pos, axis=1)
-        gem_index = np.argmin(distances)
-        closest_gem = gems[gem_index]
-        if self.forbidden is not None and np.array_equal(closest_gem, self.forbidden):
+        cost, gem = min(zip(costs, gems, strict=True))
+        if math.isinf(cost):
             return None
-        closest_gem = tuple(closest_gem)
-        if not world.is_accessible(closest_gem):
-            return None
-        self.getting_gem = closest_gem
-        return closest_gem
+        self.getting_gem = gem
+        return gem
 
     def reached_target(self) -> None:
         self.getting_gem = None
@@ -146,3 +147,22 @@ class DistanceGemGetter:
     def cannot_go_there(self):
         self.forbidden = self.getting_gem
         self.getting_gem = None
+
+
+def _gem_path_costs(
+    info: dict, world: jl.World, forbidden: tuple | None
+) -> tuple[list[tuple], list[float]]:
+    """Return visible gems and the lengths of the paths to them.
+
+    Gems behind walls that require a long detour get infinite costs.
+    """
+    gems = info["gems"]
+    if not gems:
+        return [], []
+    gems = [(float(x), float(y)) for x, y in zip(gems["x"], gems["y"], strict=True)]
+    gems = [gem for gem in gems if gem != forbidden]
+    me = info["me"]
+    costs = world.path_costs(
+        tuple(me["position"]), gems, max_cost=3 * me["view_radius"]
+    )
+    return gems, costs
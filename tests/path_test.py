@@ -1,15 +1,26 @@
+import numpy as np
 import pytest
 
 from janlukas.ai import jl
 
+ENGINES = (
+    "theta_star",
+    "lazy_theta_star",
+    "bidirectional_theta_star",
+    "d_star_lite",
+    "hierarchical",
+    "jps",
+)
 
+
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("start", ((3, 4), (1, 2), (0, 0), (9, 4), (9, 0), (4, 0)))
 @pytest.mark.parametrize("target", ((3, 4), (1, 2), (0, 0), (9, 4), (9, 0), (4, 0)))
-def test_path_reaches_target(start, target):
+def test_path_reaches_target(start, target, engine):
     if start == target:
         return
     world = jl.World((10, 5))
-    path = jl.Path(world)
+    path = jl.Path(world, engine=engine)
     path.set_target(target)
     pos = start
     for _ in range(100):
@@ -22,20 +33,465 @@ def test_path_reaches_target(start, target):
         raise AssertionError("Did not reach target")
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("pos", ((3, 4), (1, 2), (0, 0), (9, 4), (9, 0), (4, 0)))
-def test_path_start_at_target_does_nothing(pos):
+def test_path_start_at_target_does_nothing(pos, engine):
     world = jl.World((10, 5))
-    path = jl.Path(world)
+    path = jl.Path(world, engine=engine)
     path.set_target(pos)
     assert path.next(pos, world, speed=1.0, dt=1.0) is None
 
 
+@pytest.mark.parametrize("engine", ENGINES)
 @pytest.mark.parametrize("start", ((3, 4), (1, 2), (0, 0), (9, 4), (9, 0), (4, 0)))
 @pytest.mark.parametrize("target", ((3, 4), (1, 2), (0, 0), (9, 4), (9, 0), (4, 0)))
-def test_smoothing_on_empty_world_give_length_1_path(start, target):
+def test_smoothing_on_empty_world_give_length_1_path(start, target, engine):
     if start == target:
         return
     world = jl.World((10, 5))
-    path = jl.Path(world)
+    path = jl.Path(world, engine=engine)
     path.set_target(target)
     assert path.next(start, world, speed=1.0, dt=1.0) == target
+
+
+def test_unknown_engine_raises():
+    world = jl.World((8, 8))
+    with pytest.raises(ValueError, match="engine"):
+        jl.Path(world, engine="bogo_search")
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_replans_around_new_obstacles(engine):
+    world = jl.World((256, 64))
+    path = jl.Path(world, engine=engine)
+    start = (6.0, 30.0)
+    target = (250.0, 30.0)
+    path.set_target(target)
+    assert path.next(start, world, speed=1.0, dt=1.0) == target
+
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    path.recompute_in_one_turn()
+    # The path is only recomputed in the call after the next one.
+    assert path.next(start, world, speed=1.0, dt=1.0) == target
+
+    pos = start
+    waypoints = []
+    for _ in range(100):
+        pos = path.next(pos, world, speed=1.0, dt=1.0)
+        if pos is None:
+            raise AssertionError("Failed to find path")
+        waypoints.append(pos)
+        if pos == target:
+            break
+    else:
+        raise AssertionError("Did not reach target")
+    assert len(waypoints) > 1
+    assert all(world.is_accessible(p) for p in waypoints)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_path_starts_next_to_wall(engine):
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[8, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    start = (6.0, 30.0)
+    # The knight stands inside the inflated wall.
+    assert not world.is_accessible(start)
+
+    path = jl.Path(world, engine=engine)
+    path.set_target((250.0, 30.0))
+    waypoint = path.next(start, world, speed=1.0, dt=1.0)
+    assert waypoint is not None
+    assert world.is_accessible(waypoint)
+
+
+def test_d_star_lite_repairs_only_nodes_affected_by_new_obstacles():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    path = jl.Path(world, engine="d_star_lite")
+    start = (6.0, 30.0)
+    path.set_target((250.0, 30.0))
+    path.next(start, world, speed=1.0, dt=1.0)
+    initial = path.last_stats.nodes_expanded
+    assert initial > 0
+
+    def replan_after_adding(wall):
+        local_map = np.zeros((256, 64), dtype="int64")
+        local_map[wall] = 1
+        world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+        path.recompute_in_one_turn()
+        path.next(start, world, speed=1.0, dt=1.0)
+        path.next(start, world, speed=1.0, dt=1.0)
+        return path.last_stats.nodes_expanded
+
+    # Far away from the path, no node on the path changes.
+    assert replan_after_adding(np.s_[20, 60:]) < initial / 10
+    # Between the first wall and the target.
+    assert replan_after_adding(np.s_[200, 20:40]) < initial
+
+
+@pytest.mark.parametrize("engine", ("theta_star", "lazy_theta_star"))
+@pytest.mark.parametrize("connectivity", (4, 8))
+@pytest.mark.parametrize("step_size", (4, 8, 12))
+def test_theta_star_on_other_lattices_goes_around_obstacles(
+    engine, connectivity, step_size
+):
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    path = jl.Path(world, engine=engine, connectivity=connectivity, step_size=step_size)
+    target = (250.0, 30.0)
+    path.set_target(target)
+
+    pos = (6.0, 30.0)
+    waypoints = [pos]
+    for _ in range(100):
+        pos = path.next(pos, world, speed=1.0, dt=1.0)
+        if pos is None:
+            raise AssertionError("Failed to find path")
+        waypoints.append(pos)
+        if pos == target:
+            break
+    else:
+        raise AssertionError("Did not reach target")
+    # Goes around the end of the wall.
+    assert any(p[1] > 44 for p in waypoints)
+    assert all(world.is_accessible(p) for p in waypoints)
+
+
+def test_coarse_lattice_expands_fewer_nodes():
+    world = jl.World((256, 64))
+    expanded = {}
+    for step_size in (4, 8):
+        path = jl.Path(world, step_size=step_size)
+        path.set_target((250.0, 30.0))
+        path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+        expanded[step_size] = path.stats.nodes_expanded
+        world.clear_path_cache()
+    assert expanded[8] < expanded[4]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    (
+        {"connectivity": 6},
+        {"step_size": 0},
+        {"step_size": 6},
+        {"engine": "d_star_lite", "connectivity": 8},
+        {"engine": "jps", "step_size": 8},
+        {"engine": "bidirectional_theta_star", "connectivity": 8},
+    ),
+)
+def test_invalid_lattice_raises(kwargs):
+    world = jl.World((8, 8))
+    with pytest.raises(ValueError):
+        jl.Path(world, **kwargs)
+
+
+def test_bidirectional_theta_star_finds_path_as_short_as_theta_star():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    local_map[60, 20:] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+
+    stats = {}
+    for engine in ("theta_star", "bidirectional_theta_star"):
+        path = jl.Path(world, engine=engine)
+        path.set_target((250.0, 30.0))
+        path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+        stats[engine] = path.stats
+        world.clear_path_cache()
+    assert stats["bidirectional_theta_star"].failed == 0
+    assert stats["bidirectional_theta_star"].nodes_expanded > 0
+    assert stats["bidirectional_theta_star"].path_length == pytest.approx(
+        stats["theta_star"].path_length, rel=0.05
+    )
+
+
+def test_bidirectional_theta_star_expands_fewer_nodes_for_target_in_dead_end():
+    # The target is in a dead end that opens away from the start.
+    # Theta* floods everything in front of it before going around.
+    world = jl.World((512, 128))
+    local_map = np.zeros((512, 128), dtype="int64")
+    local_map[450, 20:108] = 1
+    local_map[450:491, 20] = 1
+    local_map[450:491, 107] = 1
+    world.incorporate(local_map, knight_pos=(256, 64), view_range=256)
+
+    stats = {}
+    for engine in ("theta_star", "bidirectional_theta_star"):
+        path = jl.Path(world, engine=engine)
+        path.set_target((470.0, 62.0))
+        path.next((10.0, 62.0), world, speed=1.0, dt=1.0)
+        stats[engine] = path.stats
+        world.clear_path_cache()
+    assert (
+        stats["bidirectional_theta_star"].nodes_expanded
+        < stats["theta_star"].nodes_expanded
+    )
+    assert stats["bidirectional_theta_star"].path_length == pytest.approx(
+        stats["theta_star"].path_length, rel=0.05
+    )
+
+
+def test_jps_expands_fewer_nodes_than_theta_star():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+
+    stats = {}
+    for engine in ("theta_star", "jps"):
+        path = jl.Path(world, engine=engine)
+        path.set_target((250.0, 30.0))
+        path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+        stats[engine] = path.stats
+        world.clear_path_cache()
+    assert stats["jps"].failed == 0
+    assert 0 < stats["jps"].nodes_expanded < stats["theta_star"].nodes_expanded / 10
+    assert stats["jps"].stale_pops == 0
+
+
+def test_budget_returns_partial_path():
+    world = jl.World((256, 64))
+    path = jl.Path(world, max_expansions=5)
+    path.set_target((250.0, 30.0))
+    assert path.status is None
+    waypoint = path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+    assert waypoint is not None
+    assert waypoint != (250.0, 30.0)
+    assert path.status == "partial"
+    assert path.last_stats.nodes_expanded == 5
+    assert path.stats.partial == 1
+
+
+def test_partial_path_without_progress_is_not_arrival():
+    world = jl.World((256, 64))
+    path = jl.Path(world, max_expansions=1)
+    path.set_target((250.0, 30.0))
+    assert path.next((6.0, 30.0), world, speed=1.0, dt=1.0) is None
+    assert path.status == "partial"
+
+
+def test_partial_path_is_recomputed_in_next_call():
+    world = jl.World((256, 64))
+    path = jl.Path(world, max_expansions=5)
+    path.set_target((250.0, 30.0))
+    path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+    path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+    assert path.stats.queries == 2
+
+
+def _enclosed_target_world():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[180:221, 10] = 1
+    local_map[180:221, 50] = 1
+    local_map[180, 10:51] = 1
+    local_map[220, 10:51] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    return world
+
+
+def test_unreachable_target_raises_without_budget():
+    world = _enclosed_target_world()
+    path = jl.Path(world)
+    path.set_target((200.0, 30.0))
+    with pytest.raises(RuntimeError):
+        path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+
+
+@pytest.mark.parametrize("budget", ({"max_expansions": 10**6}, {"time_budget": 10.0}))
+def test_unreachable_target_gives_path_to_closest_node_with_budget(budget):
+    world = _enclosed_target_world()
+    path = jl.Path(world, **budget)
+    path.set_target((200.0, 30.0))
+    waypoint = path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+    assert path.status == "unreachable"
+    assert waypoint != (200.0, 30.0)
+    assert world.is_accessible(waypoint)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    (
+        {"max_expansions": 0},
+        {"time_budget": 0.0},
+        {"time_budget": -1.0},
+        {"engine": "jps", "max_expansions": 100},
+        {"engine": "d_star_lite", "time_budget": 0.01},
+    ),
+)
+def test_invalid_budget_raises(kwargs):
+    world = jl.World((8, 8))
+    with pytest.raises(ValueError):
+        jl.Path(world, **kwargs)
+
+
+def test_lazy_theta_star_makes_fewer_line_of_sight_checks():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+
+    checks = {}
+    for engine in ("theta_star", "lazy_theta_star"):
+        path = jl.Path(world, engine=engine)
+        assert path.los_checks == 0
+        path.set_target((250.0, 30.0))
+        path.next((6.0, 30.0), world, speed=1.0, dt=1.0)
+        checks[engine] = path.los_checks
+        world.clear_path_cache()
+    assert 0 < checks["lazy_theta_star"] < checks["theta_star"]
+
+
+def test_los_checks_is_none_for_engines_without_counter():
+    world = jl.World((8, 8))
+    assert jl.Path(world, engine="hierarchical").los_checks is None
+
+
+def test_stats_count_work_of_searches():
+    world = jl.World((64, 32))
+    path = jl.Path(world, engine="theta_star")
+    assert path.stats.queries == 0
+    assert path.last_stats is None
+
+    path.set_target((58.0, 26.0))
+    path.next((6.0, 6.0), world, speed=1.0, dt=1.0)
+    stats = path.stats
+    assert stats.queries == 1
+    assert stats.failed == 0
+    assert stats.nodes_expanded > 0
+    assert stats.heap_pushes >= stats.nodes_expanded
+    # Theta* lowers the cost of queued nodes instead of pushing them again.
+    assert stats.stale_pops == 0
+    assert stats.los_checks == path.los_checks
+    assert stats.path_length == pytest.approx(np.hypot(52.0, 20.0))
+    assert stats.time > 0
+    assert path.last_stats.nodes_expanded == stats.nodes_expanded
+
+    path.reset_stats()
+    assert path.stats.queries == 0
+    assert path.stats.nodes_expanded is None
+    assert path.last_stats is None
+
+
+def test_stats_counts_are_none_for_engines_without_counters():
+    world = jl.World((64, 32))
+    path = jl.Path(world, engine="hierarchical")
+    path.set_target((58.0, 26.0))
+    path.next((6.0, 6.0), world, speed=1.0, dt=1.0)
+    assert path.stats.queries == 1
+    assert path.stats.nodes_expanded is None
+
+
+def test_plan_many_returns_waypoints_per_query():
+    world = jl.World((64, 32))
+    starts = np.array([[6.0, 14.0], [50.0, 3.0], [10.0, 10.0]])
+    targets = np.array([[58.0, 14.0], [3.0, 25.0], [10.0, 11.0]])
+    paths = jl.Path.plan_many(world, starts, targets, n_threads=2)
+    assert len(paths) == 3
+    for path, target in zip(paths, targets, strict=True):
+        np.testing.assert_array_equal(path, [target])
+
+
+def test_plan_many_returns_none_for_failed_queries():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 5] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    starts = np.array([[6.0, 14.0], [6.0, 14.0]])
+    targets = np.array([[30.0, 5.0], [58.0, 14.0]])
+    paths = jl.Path.plan_many(world, starts, targets)
+    assert paths[0] is None
+    np.testing.assert_array_equal(paths[1], [targets[1]])
+
+
+def test_plan_many_requires_matching_queries():
+    world = jl.World((64, 32))
+    with pytest.raises(ValueError):
+        jl.Path.plan_many(world, np.zeros((2, 2)), np.zeros((3, 2)))
+
+
+def test_background_path_is_pending_until_search_finishes():
+    world = jl.World((64, 32))
+    path = jl.Path(world, background=True)
+    assert path.background
+    assert not path.pending
+    path.set_target((58.0, 14.0))
+    assert path.next((6.0, 14.0), world, speed=1.0, dt=1.0) is None
+    assert path.pending
+    path.wait()
+    assert not path.pending
+    assert path.next((6.0, 14.0), world, speed=1.0, dt=1.0) == (58.0, 14.0)
+
+
+def test_background_path_keeps_old_path_while_replanning():
+    world = jl.World((64, 32))
+    path = jl.Path(world, background=True)
+    path.set_target((58.0, 14.0))
+    path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    path.wait()
+    path.recompute_in_one_turn()
+    path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    # Starts a new search but still returns the old path.
+    assert path.next((6.0, 14.0), world, speed=1.0, dt=1.0) == (58.0, 14.0)
+    path.wait()
+    assert not path.pending
+
+
+def test_background_path_raises_error_of_search():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 5] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    path = jl.Path(world, background=True)
+    path.set_target((30.0, 5.0))
+    path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    with pytest.raises(ValueError):
+        path.wait()
+
+
+def test_shared_path_replans_around_new_obstacles():
+    world = jl.World((256, 64))
+    start = (6.0, 30.0)
+    target = (250.0, 30.0)
+    paths = [jl.Path(world) for _ in range(2)]
+    for path in paths:
+        path.set_target(target, shared=True)
+        assert path.shared
+        assert path.next(start, world, speed=1.0, dt=1.0) == target
+
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[130, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    for path in paths:
+        path.recompute_in_one_turn()
+        path.next(start, world, speed=1.0, dt=1.0)
+        waypoint = path.next(start, world, speed=1.0, dt=1.0)
+        assert waypoint != target
+        assert world.is_accessible(waypoint)
+
+
+def test_shared_path_starts_next_to_wall():
+    world = jl.World((256, 64))
+    local_map = np.zeros((256, 64), dtype="int64")
+    local_map[8, :44] = 1
+    world.incorporate(local_map, knight_pos=(128, 32), view_range=128)
+    start = (6.0, 30.0)
+    target = (250.0, 30.0)
+    assert not world.is_accessible(start)
+    assert world.flow_cost(target, start) < float("inf")
+
+    path = jl.Path(world)
+    path.set_target(target, shared=True)
+    waypoint = path.next(start, world, speed=1.0, dt=1.0)
+    assert waypoint is not None
+    assert world.is_accessible(waypoint)
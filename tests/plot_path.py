@@ -118,7 +118,7 @@ def main() -> None:
     print(path)
     print("length", path_length(path))
 
-    plot(world.get_map(), path)
+    plot(world.map_view(), path)
     plot(actual_map, path)
 
     plt.show()
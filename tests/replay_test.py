@@ -0,0 +1,87 @@
+import gzip
+import pickle
+from functools import partial
+
+import numpy as np
+import pytest
+
+from janlukas.replay import Recorder, read_recording, recording_team, replay
+
+
+class FakeAI:
+    def __init__(self, **kwargs) -> None:
+        self.team = kwargs.get("team")
+        self.calls = []
+
+    def run(self, t: float, dt: float, info: dict) -> None:
+        self.calls.append((t, dt, info))
+
+
+def make_info(value: int) -> dict:
+    return {
+        "me": {"position": np.array([1.0, 2.0]), "view_radius": 3},
+        "local_map": np.full((6, 6), value, dtype="int64"),
+        "gems": {"x": np.array([5.0]), "y": np.array([4.0])},
+        "friends": [{"message": {"king": (1.0, 2.0)}}],
+        "enemies": [],
+    }
+
+
+def make_team(ais: dict) -> dict:
+    """Return a team of fake AIs that are stored in `ais` when created."""
+
+    def make(name, **kwargs):
+        ais[name] = FakeAI(**kwargs)
+        return ais[name]
+
+    return {name: partial(make, name) for name in ("a", "b")}
+
+
+def record(path) -> dict:
+    ais = {}
+    team = make_team(ais)
+    with Recorder(path) as recorder:
+        recorded = recording_team(team, recorder)
+        a = recorded["a"](team="red")
+        b = recorded["b"](team="red")
+        a.run(0.0, 0.1, make_info(0))
+        b.run(0.0, 0.1, make_info(1))
+        a.run(0.1, 0.1, make_info(-1))
+    return ais
+
+
+def test_recording_team_still_runs_ais(tmp_path):
+    ais = record(tmp_path / "match.rec")
+    assert len(ais["a"].calls) == 2
+    assert len(ais["b"].calls) == 1
+
+
+def test_read_recording_returns_calls_in_order(tmp_path):
+    record(tmp_path / "match.rec")
+    calls = list(read_recording(tmp_path / "match.rec"))
+    assert [(team, name, t) for team, name, t, _, _ in calls] == [
+        ("red", "a", 0.0),
+        ("red", "b", 0.0),
+        ("red", "a", 0.1),
+    ]
+    info = calls[2][4]
+    assert info["local_map"].dtype == np.int8
+    np.testing.assert_array_equal(info["local_map"], -1)
+    assert info["friends"] == [{"message": {"king": (1.0, 2.0)}}]
+
+
+def test_replay_drives_new_ais(tmp_path):
+    record(tmp_path / "match.rec")
+    ais = {}
+    latencies = replay(tmp_path / "match.rec", make_team(ais))
+    assert [t for t, _, _ in ais["a"].calls] == [0.0, 0.1]
+    assert ais["b"].team == "red"
+    assert len(latencies["red.a"]) == 2
+    assert len(latencies["red.b"]) == 1
+
+
+def test_read_recording_rejects_other_files(tmp_path):
+    with gzip.open(tmp_path / "other", "wb") as f:
+        pickle.dump({"format": "something else"}, f)
+    with pytest.raises(ValueError, match="recording"):
+        list(read_recording(tmp_path / "other"))
@@ -1,15 +1,32 @@
 """Run a test game."""
 
+import argparse
+
 from quest.core.manager import make_team
 from quest.core.match import Match
 from quest.players.templateAI_king import team as TemplateTeam
 
 from janlukas import team as JanLukasTeam
+from janlukas.replay import Recorder, recording_team
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--record", help="record the inputs of our AIs to this file for replays"
+    )
+    args = parser.parse_args()
+
+    if args.record is None:
+        play(JanLukasTeam)
+    else:
+        with Recorder(args.record) as recorder:
+            play(recording_team(JanLukasTeam, recorder))
+
+
+def play(team: dict) -> None:
     match = Match(
-        red_team=make_team(JanLukasTeam),
+        red_team=make_team(team),
         blue_team=make_team(TemplateTeam),
         best_of=1,
         game_mode="king",
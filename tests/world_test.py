@@ -0,0 +1,436 @@
+import struct
+
+import numpy as np
+import pytest
+
+from janlukas.ai import jl
+
+
+def test_new_world_has_no_info():
+    world = jl.World((16, 8))
+    m = world.get_map()
+    assert m.shape == (16, 8)
+    assert m.dtype == np.int64
+    assert np.all(m == -1)
+
+
+def test_incorporate_extrudes_obstacles():
+    world = jl.World((16, 8))
+    local_map = np.zeros((16, 8), dtype="int64")
+    local_map[6, 4] = 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+
+    expected = np.full((16, 8), -1)
+    expected[4:9, 2:7] = 1
+    np.testing.assert_array_equal(world.get_map(), expected)
+    assert not world.is_accessible((6, 4))
+    assert world.is_accessible((12, 4))
+
+
+def test_version_changes_only_if_map_changes():
+    world = jl.World((16, 8))
+    assert world.version == 0
+    local_map = np.zeros((16, 8), dtype="int64")
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    assert world.version == 0
+    local_map[6, 4] = 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    assert world.version == 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    assert world.version == 1
+
+
+def test_path_cache_is_shared_by_paths():
+    world = jl.World((64, 32))
+    for _ in range(2):
+        path = jl.Path(world)
+        path.set_target((58.0, 14.0))
+        assert path.next((6.0, 14.0), world, speed=1.0, dt=1.0) == (58.0, 14.0)
+    info = world.path_cache_info
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+    assert info["size"] == 1
+
+
+def test_path_cache_is_not_shared_by_paths_with_other_configurations():
+    world = jl.World((64, 32))
+    for kwargs in (
+        {"engine": "theta_star"},
+        {"engine": "jps"},
+        {"engine": "theta_star", "connectivity": 8},
+        {"engine": "theta_star", "step_size": 8},
+    ):
+        path = jl.Path(world, **kwargs)
+        path.set_target((58.0, 14.0))
+        path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    info = world.path_cache_info
+    assert info["hits"] == 0
+    assert info["size"] == 4
+
+
+def test_path_cache_does_not_store_partial_paths():
+    world = jl.World((256, 64))
+    start = (6.0, 30.0)
+    target = (250.0, 30.0)
+    budgeted = jl.Path(world, max_expansions=5)
+    budgeted.set_target(target)
+    budgeted.next(start, world, speed=1.0, dt=1.0)
+    assert budgeted.status == "partial"
+    assert world.path_cache_info["size"] == 0
+
+    # Same engine and lattice, so it would get the partial path from the cache.
+    path = jl.Path(world)
+    path.set_target(target)
+    assert path.next(start, world, speed=1.0, dt=1.0) == target
+    assert path.status == "complete"
+    assert world.path_cache_info["hits"] == 0
+
+
+def test_path_cache_evicts_least_recently_used():
+    world = jl.World((64, 32), path_cache_size=1)
+    path = jl.Path(world)
+    for target in ((58.0, 14.0), (58.0, 26.0)):
+        path.set_target(target)
+        path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    info = world.path_cache_info
+    assert info["evictions"] == 1
+    assert info["size"] == 1
+    world.clear_path_cache()
+    assert world.path_cache_info["size"] == 0
+
+
+def test_flow_next_goes_straight_to_goal_in_empty_world():
+    world = jl.World((64, 32))
+    assert world.flow_next((58.0, 14.0), (6.0, 14.0)) == (58.0, 14.0)
+    assert world.flow_cost((58.0, 14.0), (6.0, 14.0)) == pytest.approx(52.0)
+
+
+def test_flow_field_is_repaired_when_obstacles_appear():
+    world = jl.World((64, 32))
+    goal = (58.0, 14.0)
+    assert world.flow_next(goal, (6.0, 14.0)) == goal
+
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, :24] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    waypoint = world.flow_next(goal, (6.0, 14.0))
+    assert waypoint != goal
+    assert world.is_accessible(waypoint)
+    assert world.flow_cost(goal, (6.0, 14.0)) > 52.0
+
+
+def test_flow_next_returns_none_if_goal_is_blocked():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 5] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    assert world.flow_next((30.0, 5.0), (6.0, 14.0)) is None
+    assert world.flow_cost((30.0, 5.0), (6.0, 14.0)) == float("inf")
+
+
+def test_clearance_is_chebyshev_distance_to_closest_obstacle():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[20, 10] = 1
+    local_map[40, 25] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+
+    obstacles = np.argwhere(world.get_map() == 1)
+    x, y = np.meshgrid(np.arange(64), np.arange(32), indexing="ij")
+    expected = np.full((64, 32), jl.World.MAX_CLEARANCE)
+    for ox, oy in obstacles:
+        expected = np.minimum(expected, np.maximum(abs(x - ox), abs(y - oy)))
+
+    clearance = world.get_clearance()
+    assert clearance.dtype == np.uint8
+    np.testing.assert_array_equal(clearance, expected)
+    assert world.clearance((20.0, 10.0)) == 0
+    assert world.clearance((20.0, 15.0)) == 3
+    assert world.clearance((70.0, 15.0)) == 0
+
+
+def test_new_world_has_max_clearance_everywhere():
+    world = jl.World((16, 8))
+    assert np.all(world.get_clearance() == jl.World.MAX_CLEARANCE)
+
+
+def test_map_view_reflects_later_changes_without_copying():
+    world = jl.World((16, 8))
+    view = world.map_view()
+    assert view.dtype == np.int8
+    assert view.shape == (16, 8)
+    assert not view.flags.writeable
+    with pytest.raises(ValueError):
+        view[0, 0] = 1
+
+    local_map = np.zeros((16, 8), dtype="int64")
+    local_map[6, 4] = 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    np.testing.assert_array_equal(view, world.get_map())
+
+
+def test_map_view_of_region_and_step():
+    world = jl.World((16, 8))
+    local_map = np.zeros((16, 8), dtype="int64")
+    local_map[6, 4] = 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    full = world.get_map()
+    np.testing.assert_array_equal(world.map_view(region=(2, 10, 1, 7)), full[2:10, 1:7])
+    np.testing.assert_array_equal(world.map_view(step=3), full[::3, ::3])
+    with pytest.raises(ValueError):
+        world.map_view(region=(0, 17, 0, 8))
+    with pytest.raises(ValueError):
+        world.map_view(step=0)
+
+
+@pytest.mark.parametrize("dtype", ("int64", "int32", "int8", "uint8", "bool"))
+def test_incorporate_accepts_integer_and_bool_dtypes(dtype):
+    world = jl.World((16, 8))
+    local_map = np.zeros((16, 8), dtype=dtype)
+    local_map[6, 4] = 1
+    world.incorporate(local_map, knight_pos=(8, 4), view_range=8)
+    assert not world.is_accessible((6, 4))
+
+
+def test_incorporate_accepts_non_contiguous_arrays():
+    world = jl.World((16, 8))
+    local_map = np.zeros((32, 16), dtype="int64")
+    local_map[12, 8] = 1
+    world.incorporate(local_map[::2, ::2], knight_pos=(8, 4), view_range=8)
+    assert not world.is_accessible((6, 4))
+
+
+def test_incorporate_rejects_float_arrays():
+    world = jl.World((16, 8))
+    with pytest.raises(TypeError):
+        world.incorporate(np.zeros((16, 8)), knight_pos=(8, 4), view_range=8)
+
+
+def test_incorporate_records_obstacles_at_edge_of_local_map():
+    world = jl.World((32, 16))
+    local_map = np.zeros((16, 8), dtype="int64")
+    local_map[0, 3] = 1
+    local_map[15, 7] = 1
+    world.incorporate(local_map, knight_pos=(16, 4), view_range=8)
+
+    expected = np.full((32, 16), -1)
+    expected[6:11, 1:6] = 1
+    expected[21:26, 5:10] = 1
+    np.testing.assert_array_equal(world.get_map(), expected)
+
+
+@pytest.mark.parametrize("radius", (0, 1, 4))
+def test_incorporate_extrudes_by_inflation_radius(radius):
+    world = jl.World((32, 16), inflation_radius=radius)
+    assert world.inflation_radius == radius
+    local_map = np.zeros((32, 16), dtype="int64")
+    local_map[10, 8] = 1
+    world.incorporate(local_map, knight_pos=(16, 8), view_range=16)
+
+    expected = np.full((32, 16), -1)
+    expected[10 - radius : 11 + radius, 8 - radius : 9 + radius] = 1
+    np.testing.assert_array_equal(world.get_map(), expected)
+
+
+def test_path_costs_in_empty_world_are_straight_line_distances():
+    world = jl.World((64, 32))
+    costs = world.path_costs((6.0, 14.0), [(58.0, 14.0), (6.0, 2.0), (6.0, 14.0)])
+    assert costs == pytest.approx([52.0, 12.0, 0.0])
+
+
+def test_path_costs_go_around_walls():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, :24] = 1
+    local_map[10, 10] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+
+    costs = world.path_costs((6.0, 14.0), [(58.0, 14.0), (10.0, 10.0), (6.0, 30.0)])
+    assert costs[0] > 52.0
+    assert costs[1] == float("inf")
+    assert costs[2] == pytest.approx(16.0)
+
+
+def test_path_costs_are_infinite_beyond_max_cost():
+    world = jl.World((64, 32))
+    costs = world.path_costs((6.0, 14.0), [(58.0, 14.0), (6.0, 2.0)], max_cost=20.0)
+    assert costs == [float("inf"), pytest.approx(12.0)]
+
+
+def _world_split_by_wall():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, :] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    return world
+
+
+def test_reachable_in_world_without_info():
+    world = jl.World((64, 32))
+    assert world.reachable((6.0, 14.0), (58.0, 14.0))
+
+
+def test_reachable_is_false_across_closed_wall():
+    world = _world_split_by_wall()
+    assert world.reachable((6.0, 14.0), (6.0, 30.0))
+    assert world.reachable((58.0, 2.0), (58.0, 14.0))
+    assert not world.reachable((6.0, 14.0), (58.0, 14.0))
+
+
+def test_reachable_is_updated_when_wall_is_closed():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, :24] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    assert world.reachable((6.0, 14.0), (58.0, 14.0))
+    local_map[30, 24:] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    assert not world.reachable((6.0, 14.0), (58.0, 14.0))
+
+
+def test_reachable_uses_free_neighbours_of_obstacles():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 14] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    assert not world.is_accessible((30.0, 14.0))
+    assert world.reachable((30.0, 14.0), (6.0, 14.0))
+
+
+def test_path_costs_skip_targets_in_other_components():
+    world = _world_split_by_wall()
+    costs = world.path_costs((6.0, 14.0), [(58.0, 14.0), (6.0, 2.0)])
+    assert costs == [float("inf"), pytest.approx(12.0)]
+
+
+def test_path_to_other_component_raises_without_searching():
+    world = _world_split_by_wall()
+    path = jl.Path(world)
+    path.set_target((58.0, 14.0))
+    with pytest.raises(RuntimeError, match="not reachable"):
+        path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+    assert path.stats.failed == 1
+    assert path.stats.nodes_expanded == 0
+
+
+def test_nearest_reachable_returns_free_position_unchanged():
+    world = jl.World((64, 32))
+    assert world.nearest_reachable((13.5, 7.25)) == (13.5, 7.25)
+    assert world.nearest_reachable((13.5, 7.25), start=(50.0, 20.0)) == (13.5, 7.25)
+
+
+def test_nearest_reachable_moves_position_off_obstacle():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 14] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    snapped = world.nearest_reachable((30.0, 14.0), start=(6.0, 14.0))
+    assert snapped is not None
+    assert world.is_accessible(snapped)
+    assert np.hypot(snapped[0] - 30.0, snapped[1] - 14.0) <= 8.0
+
+
+def test_nearest_reachable_stays_in_component_of_start():
+    world = _world_split_by_wall()
+    # Closer to the right side of the wall but the start is on the left.
+    snapped = world.nearest_reachable((31.0, 14.0), start=(6.0, 14.0))
+    assert snapped is not None
+    assert snapped[0] < 30.0
+    assert world.reachable(snapped, (6.0, 14.0))
+    snapped = world.nearest_reachable((31.0, 14.0), start=(58.0, 14.0))
+    assert snapped[0] > 30.0
+
+
+def test_nearest_reachable_returns_none_beyond_max_distance():
+    world = _world_split_by_wall()
+    assert world.nearest_reachable((62.0, 14.0), start=(6.0, 14.0)) is None
+    assert world.nearest_reachable((31.0, 14.0), max_distance=1.0) is None
+
+
+def test_snapped_path_goes_to_nearest_reachable_position():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 14] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    path = jl.Path(world)
+    path.set_target((30.0, 14.0), snap=True)
+    assert path.snap
+    pos = (6.0, 14.0)
+    for _ in range(10):
+        pos = path.next(pos, world, speed=1.0, dt=1.0)
+        if pos is None:
+            raise AssertionError("Failed to find path")
+        if pos == path.goal:
+            break
+    else:
+        raise AssertionError("Did not reach goal")
+    assert path.status == "complete"
+    assert path.goal == world.nearest_reachable((30.0, 14.0), start=(6.0, 14.0))
+
+
+def test_path_without_snap_raises_for_target_on_obstacle():
+    world = jl.World((64, 32))
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 14] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    path = jl.Path(world)
+    path.set_target((30.0, 14.0))
+    assert path.goal == (30.0, 14.0)
+    with pytest.raises(ValueError):
+        path.next((6.0, 14.0), world, speed=1.0, dt=1.0)
+
+
+@pytest.mark.parametrize("mmap", (True, False))
+def test_load_returns_saved_world(tmp_path, mmap):
+    world = jl.World((64, 32), inflation_radius=3)
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, :24] = 1
+    world.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    world.save(tmp_path / "world.bin")
+
+    loaded = jl.World.load(tmp_path / "world.bin", mmap=mmap)
+    assert loaded.shape == (64, 32)
+    assert loaded.inflation_radius == 3
+    np.testing.assert_array_equal(loaded.map_view(), world.map_view())
+    np.testing.assert_array_equal(loaded.get_clearance(), world.get_clearance())
+    path = jl.Path(loaded)
+    path.set_target((58.0, 14.0))
+    assert path.next((6.0, 14.0), loaded, speed=1.0, dt=1.0) != (58.0, 14.0)
+    assert loaded.reachable((6.0, 14.0), (58.0, 14.0))
+
+
+def test_incorporate_does_not_modify_mapped_file(tmp_path):
+    jl.World((64, 32)).save(tmp_path / "world.bin")
+    loaded = jl.World.load(tmp_path / "world.bin")
+    local_map = np.zeros((64, 32), dtype="int64")
+    local_map[30, 5] = 1
+    loaded.incorporate(local_map, knight_pos=(32, 16), view_range=32)
+    assert not loaded.is_accessible((30.0, 5.0))
+
+    assert jl.World.load(tmp_path / "world.bin").is_accessible((30.0, 5.0))
+
+
+def test_load_rejects_other_files(tmp_path):
+    (tmp_path / "world.bin").write_bytes(b"not a world" * 10)
+    with pytest.raises(ValueError):
+        jl.World.load(tmp_path / "world.bin")
+
+
+@pytest.mark.parametrize("mmap", (False, True))
+def test_load_rejects_truncated_file(tmp_path, mmap):
+    jl.World((64, 32)).save(tmp_path / "world.bin")
+    content = (tmp_path / "world.bin").read_bytes()
+    (tmp_path / "world.bin").write_bytes(content[:-100])
+    with pytest.raises(ValueError):
+        jl.World.load(tmp_path / "world.bin", mmap=mmap)
+
+
+@pytest.mark.parametrize("shape", ((2**62, 2**62), (2**63, 4), (0, 32)))
+def test_load_rejects_corrupt_shape(tmp_path, shape):
+    jl.World((64, 32)).save(tmp_path / "world.bin")
+    content = bytearray((tmp_path / "world.bin").read_bytes())
+    # nx and ny are the first fields of the header.
+    content[16:32] = struct.pack("<QQ", *shape)
+    (tmp_path / "world.bin").write_bytes(content)
+    with pytest.raises(ValueError):
+        jl.World.load(tmp_path / "world.bin")